@@ -1,14 +1,52 @@
-import gc
+import calendar
+import dataclasses
 import json
 import logging
 import os
+import tempfile
 import time
-from datetime import datetime
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import closing
+from functools import lru_cache, partial
 
-import boto3
+import numpy as np
+import requests
 from dotenv import load_dotenv
+from utils.checkpoint import RangeProgress, RunCheckpoint, RunSuspended
+from utils.chunk_format import CONTENT_TYPE, NdjsonChunkWriter
+from utils.dedup import ScanBuffer, load_spill_files, select_latest
+from utils.fanout import (
+    LambdaFanout,
+    ProcessFanout,
+    iter_s3_lines_at,
+    iter_s3_range_lines,
+    load_array_from_s3,
+    partition_of,
+    save_array_to_s3,
+    split_s3_byte_ranges,
+)
 from utils.format_time import iso_to_timestamp_ms
-from utils.s3 import upload_file_to_s3, upload_json_to_s3
+from utils.manifest import StateManifest, hash_content, hash_id, load_manifest_from_s3, save_manifest_to_s3
+from utils.metrics import Metrics
+from utils.run_state import (
+    RunState,
+    RunStateConflict,
+    SourceVersion,
+    bootstrap_run_state,
+    load_run_state,
+    save_run_state,
+)
+from utils.s3 import S3Uploader, copy_object_in_s3, get_s3_client, upload_file_to_s3
+from utils.snapshot_parser import (
+    ByteRange,
+    extract_key_fields,
+    iter_lines_at,
+    iter_range_lines,
+    map_in_processes,
+    run_in_processes,
+    split_byte_ranges,
+)
+from utils.zip_stream import iter_lines_with_offsets, iter_zip_member, prefetch, tee_to_file, tee_to_ranges
 
 if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
     logger = logging.getLogger()
@@ -22,71 +60,402 @@ load_dotenv()
 
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 S3_FOLDER_PREFIX = os.getenv("S3_FOLDER_PREFIX")
+# 增量模式: 只輸出與上次處理相比新增或內容有變動的論文
+DELTA_MODE = os.getenv("DELTA_MODE", "true").lower() == "true"
+MANIFEST_KEY = os.getenv("MANIFEST_KEY", "state/manifest.bin")
+# 平行解析的行程數 (Lambda 10240 MB 時有 6 vCPU)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+# 輸出 chunk 依未壓縮大小或筆數切分 (先達到者為準)
+CHUNK_TARGET_BYTES = int(os.getenv("CHUNK_TARGET_BYTES", 16 * 1024 * 1024))
+CHUNK_MAX_RECORDS = int(os.getenv("CHUNK_MAX_RECORDS", 5000))
+CHUNK_COMPRESSION_LEVEL = int(os.getenv("CHUNK_COMPRESSION_LEVEL", 6))
+# 每個輸出行程以背景執行緒上傳 chunk，尚未完成的上傳達上限時暫停解析
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 8))
+UPLOAD_MAX_PENDING = int(os.getenv("UPLOAD_MAX_PENDING", 16))
+SNAPSHOT_FILE_NAME = "arxiv-metadata-oai-snapshot.json"
+# 串流模式: 邊下載邊解壓並掃描，不先把 zip 存到 /tmp 再解壓
+STREAM_DOWNLOAD = os.getenv("STREAM_DOWNLOAD", "true").lower() == "true"
+# 串流模式下每寫入此大小 (以行首對齊) 就交給一個掃描行程
+SCAN_SEGMENT_BYTES = int(os.getenv("SCAN_SEGMENT_BYTES", 128 * 1024 * 1024))
+KAGGLE_DOWNLOAD_URL = os.getenv(
+    "KAGGLE_DOWNLOAD_URL", "https://www.kaggle.com/api/v1/datasets/download/Cornell-University/arxiv"
+)
+# 資料集的 metadata (lastUpdated)，確認是否有新版本時不需載入 Kaggle SDK
+KAGGLE_METADATA_URL = os.getenv(
+    "KAGGLE_METADATA_URL", "https://www.kaggle.com/api/v1/datasets/view/Cornell-University/arxiv"
+)
+# 接續模式: 去重結果與每個 range 的輸出進度記錄於 S3，執行時間不足時由下一次呼叫接續
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+# 輸出中每隔多少秒 (於 chunk 邊界) 記錄一次進度
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", 30))
+# 剩餘時間少於此秒數時停止輸出，保留時間等待上傳並呼叫下一次執行
+RESUME_MARGIN_SECONDS = float(os.getenv("RESUME_MARGIN_SECONDS", 120))
+MAX_RESUMES = int(os.getenv("MAX_RESUMES", 8))
+# run state 為 running 且開始未超過此秒數時，視為仍在執行 (含接續) 的執行，新的觸發略過；
+# 預設為接續次數用盡所需的最長時間，超過時視為已中斷，新的觸發取得執行權並由 checkpoint 接續
+RUN_STALE_SECONDS = float(os.getenv("RUN_STALE_SECONDS", (MAX_RESUMES + 1) * 900))
+# 水平擴展模式: 快照上傳至 S3 後切成 byte range shard，由多個 worker Lambda 平行掃描、去重與輸出 (0 為停用)
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 0))
+# 去重依 id_hash 分區的數量，每個分區由一個 worker 處理 (0 時與 shard 數相同)
+FANOUT_PARTITIONS = int(os.getenv("FANOUT_PARTITIONS", 0)) or FANOUT_WORKERS
+FANOUT_FUNCTION_NAME = os.getenv("FANOUT_FUNCTION_NAME")
+FANOUT_PREFIX = os.getenv("FANOUT_PREFIX", "fanout")
+# worker 的 timeout (秒): coordinator 剩餘時間不足一輪時記錄進度並由下一次呼叫接續
+FANOUT_WORKER_TIMEOUT = int(os.getenv("FANOUT_WORKER_TIMEOUT", 600))
 
 
 def lambda_handler(event, context):
     logger.info(f"Lambda function started,{event}, {context}")
-    # 1. 確認當下 S3 的最新檔案的詳細資料
-    latest_file_update_timestamp = get_latest_processed_timestamp()
+    if event and "fanout_task" in event:
+        # 由 coordinator 呼叫的 worker
+        return run_fanout_task(event["fanout_task"])
+    metrics = Metrics("collection")
+    try:
+        if event and "resume" in event:
+            # invoke_resume 的接續呼叫: 直接由 checkpoint 接續
+            return run_resume(metrics, event["resume"], context)
+        return run_collection(metrics, context)
+    finally:
+        metrics.flush()
 
-    # 2. 確認來源的 metadata.json 的最新更新時間
-    kaggle_arxiv_metadata_service = ArxivMetadataService()
-    latest_update_timestamp = kaggle_arxiv_metadata_service.get_latest_update_time()
 
-    # 3. 如果來源的版本號比當下 S3 的版本號相同，則跳過
-    if int(latest_update_timestamp) == int(latest_file_update_timestamp):
+def run_collection(metrics: Metrics, context=None) -> dict:
+    with metrics.stage("check"):
+        # 1. 讀取上次處理的來源版本與執行狀態 (單一 GET)
+        run_state = load_run_state(S3_BUCKET_NAME) or bootstrap_run_state(S3_BUCKET_NAME, S3_FOLDER_PREFIX)
+        if is_run_active(run_state):
+            # 另一個執行 (或其接續) 仍在處理，不重複輸出相同的範圍
+            logger.info(f"版本 {run_state.source_version} 的執行仍在進行中，略過")
+            metrics.put("skipped", 1)
+            return {"status": "skip"}
+
+        # 2. 確認來源的 metadata.json 的最新更新時間 (上次成功時帶入 ETag，未變動時回應 304)
+        kaggle_arxiv_metadata_service = ArxivMetadataService()
+        source = kaggle_arxiv_metadata_service.check_source(
+            run_state.source_etag if run_state.status == "success" else None
+        )
+
+    # 3. 如果來源未變動或版本與上次處理的相同，則跳過
+    if source is None or source.version == run_state.processed_version:
         logger.info("source file is up to date")
+        metrics.put("skipped", 1)
+        return {"status": "skip"}
+
+    try:
+        run_state = update_run_state(
+            run_state,
+            status="running",
+            source_version=source.version,
+            source_etag=source.etag,
+            started_at=time.time(),
+            finished_at=None,
+            error=None,
+        )
+    except RunStateConflict:
+        # 同時觸發的另一個執行已開始處理
+        logger.info("其他執行已開始處理，略過")
+        metrics.put("skipped", 1)
+        return {"status": "skip"}
+
+    collect = run_fanout_collection if FANOUT_WORKERS > 0 else run_single_collection
+    return run_claimed(metrics, run_state, kaggle_arxiv_metadata_service, source, collect, context)
+
+
+def is_run_active(run_state: RunState, now: float | None = None) -> bool:
+    """run state 為 running 且尚未超過 RUN_STALE_SECONDS"""
+    if run_state.status != "running":
+        return False
+    now = time.time() if now is None else now
+    return now - (run_state.started_at or 0) < RUN_STALE_SECONDS
+
+
+def run_resume(metrics: Metrics, checkpoint_prefix: str, context=None) -> dict:
+    """
+    接續 invoke_resume 暫停的執行: 不再確認來源版本也不重新取得執行權，直接由 checkpoint 接續
+
+    run state 已不是同一版本的 running (例如已完成或已標記失敗) 時略過。
+    """
+    version = int(checkpoint_prefix.rstrip("/").rsplit("/", 1)[-1])
+    run_state = load_run_state(S3_BUCKET_NAME)
+    if run_state is None or run_state.status != "running" or run_state.source_version != version:
+        logger.info(f"run state 與 {checkpoint_prefix} 不符，略過接續: {run_state}")
+        metrics.put("skipped", 1)
         return {"status": "skip"}
+    source = SourceVersion(version, run_state.source_etag)
+    # 水平擴展模式的 checkpoint 與中間結果放在 FANOUT_PREFIX 下
+    collect = run_fanout_collection if checkpoint_prefix.startswith(f"{FANOUT_PREFIX}/") else run_single_collection
+    return run_claimed(metrics, run_state, ArxivMetadataService(), source, collect, context)
+
+
+def run_claimed(
+    metrics: Metrics,
+    run_state: RunState,
+    service: "ArxivMetadataService",
+    source: SourceVersion,
+    collect: Callable[..., dict],
+    context=None,
+) -> dict:
+    """執行已取得執行權 (run state 為 running) 的處理，完成時記錄版本、失敗時標記 failed"""
+    try:
+        result = collect(metrics, service, source.version, context)
+    except Exception as e:
+        mark_run_failed(run_state, e)
+        raise
+
+    if result["status"] == "success":
+        finish_run(run_state, source)
+    return result
 
-    # # 4. 下載最新的 metadata.json
-    source_file_path = kaggle_arxiv_metadata_service.download_latest_metadata()
 
-    # # 5. 處理 metadata.json 的資料
-    process_metadata(source_file_path, latest_update_timestamp)
+def update_run_state(run_state: RunState, **changes) -> RunState:
+    return save_run_state(S3_BUCKET_NAME, dataclasses.replace(run_state, **changes))
 
-    # 6. 上傳最新的 metadata.json 至 S3, 表示已進入下一個流程
-    new_file_name = f"{S3_FOLDER_PREFIX}-{latest_update_timestamp}.json"
-    upload_file_to_s3(S3_BUCKET_NAME, new_file_name, source_file_path)
 
+def finish_run(run_state: RunState, source: SourceVersion) -> None:
+    """所有輸出與 manifest 都已寫入後，才將來源版本記錄為已處理"""
+    try:
+        update_run_state(
+            run_state,
+            status="success",
+            processed_version=source.version,
+            snapshot_key=f"{S3_FOLDER_PREFIX}-{source.version}.json",
+            finished_at=time.time(),
+        )
+    except RunStateConflict:
+        # 輸出已完成；下一次執行會再比對一次 (增量模式下不會重複輸出未變動的論文)
+        logger.warning("run state 已被其他執行更新，未記錄本次完成的版本")
+
+
+def mark_run_failed(run_state: RunState, error: Exception) -> None:
+    try:
+        update_run_state(run_state, status="failed", error=str(error)[:1000], finished_at=time.time())
+    except Exception:
+        logger.exception("run state 更新失敗")
+
+
+def run_single_collection(
+    metrics: Metrics, kaggle_arxiv_metadata_service: "ArxivMetadataService", latest_update_timestamp: int, context=None
+) -> dict:
+    """單機模式: 在此 Lambda 中下載、去重並輸出 chunk，執行時間不足時由下一次呼叫接續"""
+    # 同一版本先前未完成的執行會留下 checkpoint，由此接續
+    checkpoint = RunCheckpoint(S3_BUCKET_NAME, str(latest_update_timestamp)) if CHECKPOINT_ENABLED else None
+    state = checkpoint.load_state() if checkpoint else None
+    resuming = bool(state) and state.get("phase") == "emit"
+    deadline = run_deadline(context)
+
+    # # 4. 下載最新的 metadata.json (串流模式下同時完成掃描)
+    scans = None
+    with metrics.stage("download") as stage:
+        if resuming:
+            # 去重結果已在 checkpoint 中，只需取得快照檔案
+            logger.info(f"由 checkpoint 接續 (第 {state['resumes']} 次)")
+            source_file_path = fetch_snapshot(kaggle_arxiv_metadata_service, state["snapshot_bytes"])
+        elif STREAM_DOWNLOAD:
+            # 單一核心的掃描 (約 100 MB/s) 跟不上解壓後的下載速度，主執行緒只寫檔並切分 range，
+            # 已寫入的 range 由下載開始前 fork 的常駐行程平行掃描
+            source_file_path = os.path.join("/tmp", SNAPSHOT_FILE_NAME)
+            scan = partial(scan_range, file_path=source_file_path)
+            stream = kaggle_arxiv_metadata_service.stream_latest_ranges(source_file_path, SCAN_SEGMENT_BYTES)
+            with closing(stream) as byte_ranges:
+                scans = map_in_processes(scan, byte_ranges, PARSE_WORKERS)
+            stage.records = sum(scan["lines"] for scan in scans)
+        else:
+            source_file_path = kaggle_arxiv_metadata_service.download_latest_metadata()
+        stage.bytes = os.path.getsize(source_file_path)
+
+    # # 5. 處理 metadata.json 的資料 (增量模式下只輸出新增/變動的論文)
+    previous_manifest = None
+    if DELTA_MODE and not resuming:
+        with metrics.stage("manifest_load"):
+            previous_manifest = load_manifest_from_s3(S3_BUCKET_NAME, MANIFEST_KEY, "/tmp/manifest-previous.bin")
+    try:
+        _, next_manifest = process_metadata(
+            source_file_path,
+            latest_update_timestamp,
+            previous_manifest,
+            scans=scans,
+            metrics=metrics,
+            checkpoint=checkpoint,
+            deadline=deadline,
+        )
+    except RunSuspended as e:
+        logger.info(f"執行時間不足，已記錄進度: {e}")
+        invoke_resume(checkpoint, context)
+        metrics.put("suspended", 1)
+        return {"status": "suspended"}
+
+    with metrics.stage("upload") as stage:
+        # 處理完成後才更新 manifest，避免中途失敗時遺漏變動
+        save_manifest_to_s3(next_manifest, S3_BUCKET_NAME, MANIFEST_KEY, "/tmp/manifest-next.bin")
+
+        # 6. 上傳最新的 metadata.json 至 S3, 表示已進入下一個流程
+        new_file_name = f"{S3_FOLDER_PREFIX}-{latest_update_timestamp}.json"
+        upload_file_to_s3(S3_BUCKET_NAME, new_file_name, source_file_path)
+        stage.bytes = os.path.getsize(source_file_path)
+
+    if checkpoint:
+        checkpoint.clear()
     return {"status": "success"}
 
 
-def get_latest_processed_timestamp() -> int:
-    s3 = boto3.client("s3")
-    response = s3.list_objects_v2(Bucket=S3_BUCKET_NAME, Prefix=S3_FOLDER_PREFIX)
-    if "Contents" not in response:
-        return 0
-    latest_file = max(response["Contents"], key=lambda x: x["LastModified"])
-    logger.info(f"latest_processed_file: {latest_file}")
-    return latest_file["Key"].split("-")[-1].split(".")[0]
+def run_deadline(context) -> float | None:
+    """輸出階段須在此時間 (epoch 秒) 前停止；本地執行 (沒有 context) 時不限制"""
+    if context is None:
+        return None
+    return time.time() + context.get_remaining_time_in_millis() / 1000 - RESUME_MARGIN_SECONDS
+
+
+def download_snapshot_file(service: "ArxivMetadataService") -> str:
+    """下載並解壓快照至 /tmp，不在下載時掃描"""
+    if not STREAM_DOWNLOAD:
+        return service.download_latest_metadata()
+    file_path = os.path.join("/tmp", SNAPSHOT_FILE_NAME)
+    for _ in service.stream_latest_metadata(file_path):
+        pass
+    return file_path
+
+
+def fetch_snapshot(service: "ArxivMetadataService", expected_bytes: int) -> str:
+    """接續時取得快照；同一個執行環境 (warm start) 已有完整的檔案時直接使用"""
+    file_path = os.path.join("/tmp", SNAPSHOT_FILE_NAME)
+    if not (os.path.exists(file_path) and os.path.getsize(file_path) == expected_bytes):
+        file_path = download_snapshot_file(service)
+    if os.path.getsize(file_path) != expected_bytes:
+        raise RuntimeError(f"快照大小 {os.path.getsize(file_path)} 與 checkpoint 記錄的 {expected_bytes} 不同")
+    return file_path
+
+
+def invoke_resume(checkpoint: RunCheckpoint, context) -> None:
+    """以非同步呼叫自己接續處理 (同一個快照版本會讀到相同的 checkpoint)"""
+    state = checkpoint.load_state()
+    if state["resumes"] >= MAX_RESUMES:
+        raise RuntimeError(f"已接續 {state['resumes']} 次仍未完成，停止自動接續")
+    state["resumes"] += 1
+    checkpoint.save_state(state)
+
+    if context is None:
+        logger.info(f"本地執行: 以 `python arxiv_metadata.py {checkpoint.prefix}` 接續")
+        return
+    import boto3
+
+    boto3.client("lambda").invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"resume": checkpoint.prefix}).encode("utf-8"),
+    )
+    logger.info(f"已呼叫下一次執行接續 {checkpoint.prefix}")
+
+
+def run_fanout_collection(metrics: Metrics, service: "ArxivMetadataService", timestamp_str: str, context=None) -> dict:
+    """
+    水平擴展模式的 coordinator: 快照放上 S3 後由 worker 處理，完成後才寫入最終的快照檔名
+
+    Lambda 上以同步呼叫 FANOUT_FUNCTION_NAME 執行 worker；本地執行時改用子行程。
+    每一輪完成後記錄於 {FANOUT_PREFIX}/{timestamp}/state.json，剩餘時間不足一輪時由下一次呼叫接續。
+    """
+    checkpoint = RunCheckpoint(S3_BUCKET_NAME, str(timestamp_str), prefix=FANOUT_PREFIX)
+    snapshot_key = f"{checkpoint.prefix}/{SNAPSHOT_FILE_NAME}"
+    deadline = run_deadline(context)
+    state = checkpoint.load_state()
+    if state:
+        # 快照已在 S3 上，由已完成的一輪接續
+        logger.info(f"由 {checkpoint.prefix} 接續 (第 {state['resumes']} 次)")
+    else:
+        with metrics.stage("download") as stage:
+            source_file_path = download_snapshot_file(service)
+            stage.bytes = os.path.getsize(source_file_path)
+        with metrics.stage("upload") as stage:
+            upload_file_to_s3(S3_BUCKET_NAME, snapshot_key, source_file_path)
+            stage.bytes = os.path.getsize(source_file_path)
+        # worker 直接讀取 S3 上的快照，本機檔案已不需要
+        os.remove(source_file_path)
+        checkpoint.save_state({"phase": "fanout", "resumes": 0, "rounds": {}})
+
+    if context is None:
+        fanout = ProcessFanout(run_fanout_task, FANOUT_WORKERS)
+    else:
+        fanout = LambdaFanout(FANOUT_FUNCTION_NAME, max_concurrency=max(FANOUT_WORKERS, FANOUT_PARTITIONS))
+    try:
+        _, next_manifest = process_metadata_fanout(
+            S3_BUCKET_NAME,
+            snapshot_key,
+            timestamp_str,
+            fanout,
+            shards=FANOUT_WORKERS,
+            partitions=FANOUT_PARTITIONS,
+            manifest_key=MANIFEST_KEY if DELTA_MODE else None,
+            metrics=metrics,
+            checkpoint=checkpoint,
+            deadline=deadline,
+        )
+    except RunSuspended as e:
+        logger.info(f"執行時間不足，已記錄進度: {e}")
+        invoke_resume(checkpoint, context)
+        metrics.put("suspended", 1)
+        return {"status": "suspended"}
+
+    with metrics.stage("manifest_save"):
+        save_manifest_to_s3(next_manifest, S3_BUCKET_NAME, MANIFEST_KEY, "/tmp/manifest-next.bin")
+        # 與單機模式相同，最後才寫入快照檔名，表示已進入下一個流程
+        copy_object_in_s3(S3_BUCKET_NAME, snapshot_key, f"{S3_FOLDER_PREFIX}-{timestamp_str}.json")
+    checkpoint.clear()
+    return {"status": "success"}
 
 
 class ArxivMetadataService:
+    """
+    Kaggle 上的 arXiv 資料集
+
+    確認更新時間與串流下載直接呼叫 Kaggle REST API；Kaggle SDK 的 import 與驗證較慢，
+    只在需要時 (非串流下載、未設定 KAGGLE_USERNAME / KAGGLE_KEY) 才初始化，沒有新版本時不會載入。
+    """
+
     def __init__(self):
         self.dataset_ref = "Cornell-University/arxiv"
-        self._init_kaggle()
+        self._kaggle = None
+
+    @property
+    def kaggle(self):
+        if self._kaggle is None:
+            self._init_kaggle()
+        return self._kaggle
 
     def _init_kaggle(self):
         # Import kaggle only when needed to avoid undefined errors
         import kaggle
 
-        self.kaggle = kaggle
-        self.kaggle.api.authenticate()
+        self._kaggle = kaggle
+        self._kaggle.api.authenticate()
+
+    def _auth(self) -> tuple[str, str]:
+        username, key = os.getenv("KAGGLE_USERNAME"), os.getenv("KAGGLE_KEY")
+        if username and key:
+            return username, key
+        config = self.kaggle.api.config_values
+        return config["username"], config["key"]
 
-    def get_latest_update_time(self) -> int:
-        datasets = self.kaggle.api.dataset_list(search=self.dataset_ref)
-        dataset_metadata = None
+    def check_source(self, etag: str | None = None) -> SourceVersion | None:
+        """
+        取得資料集目前的版本
 
-        for dataset in datasets:
-            if dataset.ref == self.dataset_ref:
-                dataset_metadata = dataset.to_dict()
-                break
+        Args:
+            etag (str | None): 上次成功處理時 metadata 回應的 ETag，以 If-None-Match 送出
 
-        if not dataset_metadata:
+        Returns:
+            SourceVersion | None: 來源回應 304 (與上次相同) 時回傳 None
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        response = requests.get(KAGGLE_METADATA_URL, auth=self._auth(), headers=headers, timeout=(10, 60))
+        if response.status_code == 304:
+            logger.info(f"dataset_metadata 未變動 (ETag {etag})")
+            return None
+        if response.status_code == 404:
             raise ValueError(f"Dataset {self.dataset_ref} not found")
+        response.raise_for_status()
+        dataset_metadata = response.json()
 
-        logger.info(f"dataset_metadata: {dataset_metadata}")
-        return iso_to_timestamp_ms(dataset_metadata["lastUpdated"])
+        logger.info(f"dataset_metadata: {dataset_metadata.get('ref')}, {dataset_metadata.get('lastUpdated')}")
+        return SourceVersion(iso_to_timestamp_ms(dataset_metadata["lastUpdated"]), response.headers.get("ETag"))
 
     def download_latest_metadata(self) -> str:
         tmp_dir = "/tmp"
@@ -97,79 +466,563 @@ class ArxivMetadataService:
 
         for _, _, files in os.walk(tmp_dir):
             logger.info(f"找到的檔案: {files}")
-            json_files = [f for f in files if f == "arxiv-metadata-oai-snapshot.json"]
+            json_files = [f for f in files if f == SNAPSHOT_FILE_NAME]
             if json_files:
                 return os.path.join(tmp_dir, json_files[0])
 
         raise FileNotFoundError(f"No JSON file found in {tmp_dir}")
 
+    def stream_latest_metadata(self, file_path: str) -> Iterator[tuple[int, bytes]]:
+        """邊下載邊解壓，寫入 file_path 的同時逐行產出 (offset, line)"""
+        stream = open_snapshot_stream(KAGGLE_DOWNLOAD_URL, auth=self._auth())
+        return stream_snapshot(stream, file_path)
 
-def process_metadata(file_path: str, timestamp_str: str):
-    processed_count = 0
-    error_count = 0
+    def stream_latest_ranges(self, file_path: str, segment_bytes: int) -> Iterator[ByteRange]:
+        """邊下載邊解壓，寫入 file_path 的同時產出已寫入的 ByteRange (開始迭代時才連線)"""
+        stream = open_snapshot_stream(KAGGLE_DOWNLOAD_URL, auth=self._auth())
+        yield from stream_snapshot_ranges(stream, file_path, segment_bytes)
+
+
+def open_snapshot_stream(url: str, auth: tuple[str, str] | None = None):
+    """開啟 zip 下載的 HTTP 串流 (Kaggle 會再轉址至實際的儲存位置)"""
+    response = requests.get(url, auth=auth, stream=True, timeout=(10, 300))
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response.raw
+
+
+def stream_snapshot(zip_stream, file_path: str) -> Iterator[tuple[int, bytes]]:
+    """
+    從 zip 串流解壓快照，寫入 file_path 供後續平行輸出使用，並逐行產出 (offset, line)
+
+    下載與解壓在背景執行緒進行，與呼叫端的解析同時進行；
+    磁碟上只會有解壓後的 JSON，不會同時存在 zip。
+    產出結束或被關閉時背景執行緒即已結束，之後 fork 出的輸出行程不會繼承執行中的執行緒。
+    """
+    chunks = prefetch(iter_zip_member(zip_stream, SNAPSHOT_FILE_NAME))
+    try:
+        yield from iter_lines_with_offsets(tee_to_file(chunks, file_path))
+    finally:
+        chunks.close()
+
+
+def stream_snapshot_ranges(zip_stream, file_path: str, segment_bytes: int) -> Iterator[ByteRange]:
+    """
+    從 zip 串流解壓快照寫入 file_path，每寫入約 segment_bytes 產出一段以行首對齊的 ByteRange
+
+    下載與解壓在背景執行緒進行，產出的 range 已可由其他行程讀取 (供 map_in_processes 平行掃描)。
+    """
+    chunks = prefetch(iter_zip_member(zip_stream, SNAPSHOT_FILE_NAME))
+    try:
+        for index, (start, end) in enumerate(tee_to_ranges(chunks, file_path, segment_bytes)):
+            yield ByteRange(index, start, end)
+    finally:
+        chunks.close()
+
+
+def process_metadata(
+    file_path: str,
+    timestamp_str: str,
+    previous_manifest: StateManifest | None = None,
+    workers: int = PARSE_WORKERS,
+    scans: list[dict] | None = None,
+    metrics: Metrics | None = None,
+    checkpoint: RunCheckpoint | None = None,
+    deadline: float | None = None,
+) -> tuple[int, StateManifest]:
+    """
+    解析快照並分批上傳至 S3
+
+    快照切成以行首對齊的 byte range 後分兩階段平行處理:
+    1. 掃描: 只取出 id / update_date / 內容雜湊 / offset 等定長欄位
+    2. 去重與增量比對: 每個 id 只保留最新的一筆，並排除與上一次相同的論文
+    3. 輸出: 只讀取並解析被選中的行，依 range 順序切成 chunk 上傳
+
+    提供 checkpoint 時，去重結果與每個 range 的輸出進度會寫入 S3；已有去重結果時略過掃描與去重，
+    輸出只從各 range 上次的進度接續。超過 deadline 時於 chunk 邊界停止並拋出 RunSuspended。
 
-    id_update_map = {}
-    results = []
-    with open(file_path, encoding="utf-8") as file:
-        for line_num, line in enumerate(file, 1):
-            line = line.strip()
-
-            # 跳過空行
-            if not line:
-                continue
-
-            try:
-                item = json.loads(line)
-                result = process_single_item(item)
-
-                if result["id"] not in id_update_map:
-                    id_update_map[result["id"]] = result["update_timestamp"]
-
-                # 該筆資料較舊，跳過
-                elif result["update_timestamp"] < id_update_map[result["id"]]:
-                    continue
-
-                processed_count += 1
-                results.append(result)
-
-                # 定期清理記憶體
-                if processed_count % 1000 == 0:
-                    logger.info(f"已處理 {processed_count} 筆")
-                    upload_json_to_s3(
-                        results,
-                        S3_BUCKET_NAME,
-                        f"parsed_{timestamp_str}/metadata-{processed_count}.json",
+    Args:
+        file_path (str): 快照檔案路徑
+        timestamp_str (str): 來源版本時間戳，作為輸出資料夾名稱
+        previous_manifest (StateManifest | None): 上一次的 manifest，提供時只輸出新增或內容變動的論文
+        workers (int): 平行處理的行程數
+        scans (list[dict] | None): 已在下載時完成的掃描結果 (scan_lines 的回傳值)，提供時略過掃描階段
+        metrics (Metrics | None): 記錄 parse / dedup / emit 各階段的耗時與處理量
+        checkpoint (RunCheckpoint | None): 記錄與接續處理進度
+        deadline (float | None): 輸出階段停止的時間 (epoch 秒)
+
+    Returns:
+        tuple[int, StateManifest]: 輸出的論文數，以及本次快照的 manifest
+    """
+    st = time.time()
+    metrics = metrics or Metrics("collection")
+    selection = checkpoint.load_selection() if checkpoint else None
+    if selection is not None:
+        latest, next_manifest, byte_ranges = selection
+        delta = bool(checkpoint.load_state().get("delta"))
+        scans = []
+        logger.info(f"由 checkpoint 接續輸出: 待輸出 {len(latest)} 筆, {len(byte_ranges)} 個 byte range")
+    else:
+        byte_ranges = split_byte_ranges(file_path, workers)
+        logger.info(f"切分為 {len(byte_ranges)} 個 byte range, 使用 {workers} 個行程")
+
+        # 掃描結果寫入暫存檔，由主行程讀入預先配置的陣列，避免經由 Pipe 傳遞並複製整份資料
+        if scans is None:
+            with metrics.stage("parse") as stage:
+                scans = run_in_processes(partial(scan_range, file_path=file_path), byte_ranges, workers)
+                stage.records = sum(scan["lines"] for scan in scans)
+                stage.bytes = sum(scan["bytes"] for scan in scans)
+        log_range_throughput("掃描", scans)
+
+        with metrics.stage("dedup") as stage:
+            latest = select_latest(load_spill_files([scan["spill"] for scan in scans]))
+            next_manifest = StateManifest.from_entries(latest)
+            scanned_count = sum(scan["spill"][1] for scan in scans)
+            logger.info(f"去重: 掃描 {scanned_count} 筆, 不重複 id {len(latest)} 筆")
+
+            # 增量模式: 未變動或較舊的資料不再輸出 (manifest 為空的第一次執行仍為全量輸出)
+            delta = previous_manifest is not None and len(previous_manifest) > 0
+            if delta:
+                latest = latest[
+                    previous_manifest.changed_mask(
+                        latest["id_hash"], latest["update_timestamp"], latest["content_hash"]
                     )
-                    results.clear()
-                    gc.collect()
+                ]
+            stage.records = scanned_count
+        if checkpoint:
+            checkpoint.save_selection(latest, next_manifest, byte_ranges, delta)
+
+    with metrics.stage("emit") as stage:
+        selected_offsets = np.sort(latest["offset"])
+        bounds = np.searchsorted(selected_offsets, [byte_range.end for byte_range in byte_ranges])
+        tasks = [
+            (byte_range, offsets, checkpoint.load_range_progress(byte_range.index) if checkpoint else None)
+            for byte_range, offsets in zip(byte_ranges, np.split(selected_offsets, bounds[:-1]), strict=True)
+        ]
+        emit = partial(
+            emit_range,
+            file_path=file_path,
+            timestamp_str=timestamp_str,
+            checkpoint=checkpoint,
+            deadline=deadline,
+            delta=delta,
+        )
+        emits = run_in_processes(emit, tasks, workers)
+        stage.records = sum(emit["processed"] for emit in emits)
+        stage.bytes = sum(emit["bytes"] for emit in emits)
+    log_range_throughput("輸出", emits)
+
+    processed_count = sum(emit["processed"] for emit in emits)
+    error_count = sum(scan["errors"] for scan in scans) + sum(emit["errors"] for emit in emits)
+    metrics.put("unique_ids", len(next_manifest))
+    metrics.put("unchanged_skipped", len(next_manifest) - len(latest))
+    metrics.put("errors", error_count)
+    incomplete = [emit["index"] for emit in emits if not emit["complete"]]
+    if incomplete:
+        raise RunSuspended(f"range {incomplete} 尚未輸出完成")
+    logger.info(
+        f"處理完成: 成功 {processed_count} 筆, 未變動略過 {len(next_manifest) - len(latest)} 筆, "
+        f"錯誤 {error_count} 筆, 花費 {time.time() - st:.2f} 秒"
+    )
+    return processed_count, next_manifest
+
+
+def scan_range(byte_range: ByteRange, file_path: str) -> dict:
+    """掃描單一 byte range (在子行程中執行)"""
+    return scan_lines(byte_range.index, iter_range_lines(file_path, byte_range))
+
+
+def scan_lines(index: int, lines: Iterable[tuple[int, bytes]]) -> dict:
+    """
+    掃描 (offset, line)，只取出去重與增量比對所需的定長欄位並寫入 spill 檔
+
+    Args:
+        index (int): range 編號，僅用於紀錄
+        lines (Iterable[tuple[int, bytes]]): 檔案中的每一行與其起始 offset
+    """
+    st = time.time()
+    error_count = 0
+    line_count = 0
+    read_bytes = 0
+    scanned = ScanBuffer()
+
+    for offset, raw_line in lines:
+        line = raw_line.strip()
+        line_count += 1
+        read_bytes += len(raw_line)
+
+        # 跳過空行
+        if not line:
+            continue
+
+        try:
+            paper_id, update_date = extract_key_fields(line)
+            scanned.add(hash_id(paper_id), date_to_timestamp(update_date), hash_content(line), offset)
+
+        except Exception as e:
+            error_count += 1
+            if error_count <= 10:  # 只印前 10 個錯誤
+                logger.error(f"offset {offset} 解析錯誤: {e}")
+                logger.error(f"問題行: {line[:100].decode('utf-8', 'replace')}...")
+            continue
+
+    spill_fd, spill_path = tempfile.mkstemp(prefix=f"scan-{index:03d}-", suffix=".bin")
+    os.close(spill_fd)
+    return {
+        "index": index,
+        "spill": (spill_path, scanned.spill(spill_path)),
+        "errors": error_count,
+        "lines": line_count,
+        "bytes": read_bytes,
+        "elapsed": time.time() - st,
+    }
+
+
+def emit_range(
+    task: tuple[ByteRange, np.ndarray, RangeProgress | None],
+    file_path: str | None,
+    timestamp_str: str,
+    checkpoint: RunCheckpoint | None = None,
+    deadline: float | None = None,
+    lines_at: Callable[[np.ndarray], Iterator[tuple[int, bytes]]] | None = None,
+    delta: bool = False,
+) -> dict:
+    """
+    解析 byte range 中被選中的行並上傳為 chunk (在子行程中執行)
+
+    task 的第三個元素為上次記錄的進度，從其後的 offset 與 chunk 序號接續；
+    提供 checkpoint 時每隔 CHECKPOINT_INTERVAL 秒於 chunk 上傳完成後記錄進度，
+    超過 deadline 時於 chunk 邊界停止並回傳 complete=False。
+    lines_at 可取代從 file_path 讀取被選中行的方式 (例如水平擴展模式直接讀取 S3)。
+    delta 標記 chunk 為增量輸出 (只含變動的論文)，不可用於重建索引。
+    """
+    byte_range, offsets, progress = task
+    progress = progress or RangeProgress()
+    st = time.time()
+    offsets = offsets[progress.consumed :]
+    read_bytes = 0
+    last_saved = time.time()
+    uploader = S3Uploader(S3_BUCKET_NAME, max_workers=UPLOAD_WORKERS, max_pending=UPLOAD_MAX_PENDING)
+    chunks = NdjsonChunkWriter(
+        f"parsed_{timestamp_str}/metadata-{byte_range.index:03d}",
+        upload=partial(upload_chunk, uploader),
+        target_bytes=CHUNK_TARGET_BYTES,
+        max_records=CHUNK_MAX_RECORDS,
+        compression_level=CHUNK_COMPRESSION_LEVEL,
+        source_version=str(timestamp_str),
+        first_sequence=len(progress.keys) + 1,
+        delta=delta,
+    )
+
+    lines_at = lines_at or partial(iter_lines_at, file_path)
+    for offset, line in lines_at(offsets):
+        read_bytes += len(line)
+        progress.consumed += 1
+        progress.last_offset = int(offset)
+        try:
+            key = chunks.append(process_single_item(json.loads(line)))
+            progress.processed += 1
+        except Exception as e:
+            progress.errors += 1
+            logger.error(f"offset {offset} 處理錯誤: {e}")
+            continue
+
+        # 只在 chunk 邊界記錄進度或停止
+        if key is None:
+            continue
+        progress.keys.append(key)
+        if checkpoint is None:
+            continue
+        if deadline is not None and time.time() >= deadline:
+            save_emit_progress(checkpoint, uploader, byte_range.index, progress)
+            break
+        if time.time() - last_saved >= CHECKPOINT_INTERVAL:
+            save_emit_progress(checkpoint, uploader, byte_range.index, progress)
+            last_saved = time.time()
+    else:
+        key = chunks.flush()
+        progress.keys += [key] if key else []
+        progress.complete = True
+
+    failed_keys = uploader.close()
+    if failed_keys:
+        raise RuntimeError(f"range {byte_range.index}: {len(failed_keys)} 個 chunk 上傳失敗: {failed_keys[:10]}")
+    if checkpoint:
+        checkpoint.save_range_progress(byte_range.index, progress)
+    logger.info(f"range {byte_range.index} 上傳 {len(chunks.keys)} 個 chunk, 完成: {progress.complete}")
+
+    return {
+        "index": byte_range.index,
+        "processed": progress.processed,
+        "errors": progress.errors,
+        "complete": progress.complete,
+        "lines": len(offsets),
+        "bytes": read_bytes,
+        "elapsed": time.time() - st,
+    }
+
+
+def save_emit_progress(checkpoint: RunCheckpoint, uploader: S3Uploader, index: int, progress: RangeProgress) -> None:
+    """等待已排入的 chunk 上傳完成後才記錄進度，避免記錄尚未存在的 chunk"""
+    failed_keys = uploader.flush()
+    if failed_keys:
+        raise RuntimeError(f"range {index}: {len(failed_keys)} 個 chunk 上傳失敗: {failed_keys[:10]}")
+    checkpoint.save_range_progress(index, progress)
+
 
-                # TODO: 因為測試而已，限定數量
-                if processed_count >= 100000:
-                    break
+def process_metadata_fanout(
+    bucket: str,
+    snapshot_key: str,
+    timestamp_str: str,
+    fanout: LambdaFanout | ProcessFanout,
+    shards: int,
+    partitions: int,
+    manifest_key: str | None = None,
+    metrics: Metrics | None = None,
+    checkpoint: RunCheckpoint | None = None,
+    deadline: float | None = None,
+) -> tuple[int, StateManifest]:
+    """
+    以多個 worker 平行處理 S3 上的快照，輸出與 process_metadata 相同的 chunk 與 manifest
 
-            except json.JSONDecodeError as e:
-                error_count += 1
-                if error_count <= 10:  # 只印前 10 個錯誤
-                    logger.error(f"第 {line_num} 行 JSON 錯誤: {e}")
-                    logger.error(f"問題行: {line[:100]}...")
-                continue
+    1. 掃描: 每個 worker 以 range GET 讀取一個 byte range shard，掃描結果依 id_hash 分區寫入 S3
+    2. 去重與增量比對: 每個 worker 負責一個分區 (同一 id 必在同一分區)，被選中的 offset 依 shard 寫回 S3
+    3. 輸出: 每個 worker 只讀取自己 shard 中被選中的行並上傳 chunk
 
-            except Exception as e:
-                error_count += 1
-                logger.error(f"第 {line_num} 行處理錯誤: {e}")
-                continue
+    中間結果存放於快照所在的 prefix 下，由呼叫端於完成後刪除。
+    提供 checkpoint 時記錄 shard 切分與每一輪的結果，接續時略過已完成的輪次。
 
-    logger.info(f"處理完成: 成功 {processed_count} 筆, 錯誤 {error_count} 筆")
-    return processed_count
+    Args:
+        bucket (str): 快照與中間結果所在的 bucket
+        snapshot_key (str): 快照的 S3 key，中間結果寫在同一個 prefix 下
+        timestamp_str (str): 來源版本時間戳，作為輸出資料夾名稱
+        fanout (LambdaFanout | ProcessFanout): 執行 worker 的方式
+        shards (int): byte range shard 數 (掃描與輸出的平行度)
+        partitions (int): id_hash 分區數 (去重的平行度)
+        manifest_key (str | None): 上一次 manifest 的 S3 key，提供時只輸出新增或內容變動的論文
+        metrics (Metrics | None): 記錄 parse / dedup / emit 各階段的耗時與處理量
+        checkpoint (RunCheckpoint | None): 記錄每一輪完成後的結果
+        deadline (float | None): 剩餘時間不足一輪 (FANOUT_WORKER_TIMEOUT) 時不再開始下一輪
+
+    Returns:
+        tuple[int, StateManifest]: 輸出的論文數，以及本次快照的 manifest
+
+    Raises:
+        RunSuspended: 剩餘時間不足，已完成的輪次已寫入 checkpoint
+    """
+    st = time.time()
+    metrics = metrics or Metrics("collection")
+    run_prefix = snapshot_key.rsplit("/", 1)[0]
+    state = (checkpoint.load_state() if checkpoint else None) or {"resumes": 0}
+    rounds = state.setdefault("rounds", {})
+    if "byte_ranges" not in state:
+        size = get_s3_client().head_object(Bucket=bucket, Key=snapshot_key)["ContentLength"]
+        state["byte_ranges"] = [
+            [byte_range.index, byte_range.start, byte_range.end]
+            for byte_range in split_s3_byte_ranges(bucket, snapshot_key, size, shards)
+        ]
+    byte_ranges = [ByteRange(*values) for values in state["byte_ranges"]]
+    partitions = max(partitions, 1)
+
+    def run_round(name: str, tasks: list[dict]) -> list[dict]:
+        if name in rounds:
+            logger.info(f"{name} 已於先前的執行完成，略過")
+            return rounds[name]
+        if deadline is not None and time.time() + FANOUT_WORKER_TIMEOUT > deadline:
+            raise RunSuspended(f"剩餘時間不足以執行 {name}")
+        rounds[name] = fanout.map(tasks)
+        if checkpoint:
+            checkpoint.save_state(state)
+        return rounds[name]
+
+    logger.info(f"切分為 {len(byte_ranges)} 個 shard 與 {partitions} 個分區")
+    common = {"bucket": bucket, "key": snapshot_key, "run_prefix": run_prefix, "partitions": partitions}
+    metrics.put("fanout_shards", len(byte_ranges))
+
+    with metrics.stage("parse") as stage:
+        scans = run_round(
+            "parse",
+            [
+                {**common, "task": "scan", "shard": [byte_range.index, byte_range.start, byte_range.end]}
+                for byte_range in byte_ranges
+            ],
+        )
+        stage.records = sum(scan["lines"] for scan in scans)
+        stage.bytes = sum(scan["bytes"] for scan in scans)
+    log_range_throughput("掃描", scans)
+
+    with metrics.stage("dedup") as stage:
+        dedups = run_round(
+            "dedup",
+            [
+                {
+                    **common,
+                    "task": "dedup",
+                    "partition": partition,
+                    "shards": len(byte_ranges),
+                    "shard_ends": [byte_range.end for byte_range in byte_ranges],
+                    "manifest_key": manifest_key,
+                }
+                for partition in range(partitions)
+            ],
+        )
+        stage.records = sum(dedup["scanned"] for dedup in dedups)
+    unique_count = sum(dedup["unique"] for dedup in dedups)
+    selected_count = sum(dedup["selected"] for dedup in dedups)
+    logger.info(f"去重: 掃描 {stage.records} 筆, 不重複 id {unique_count} 筆, 待輸出 {selected_count} 筆")
+
+    with metrics.stage("emit") as stage:
+        emits = run_round(
+            "emit",
+            [
+                {
+                    **common,
+                    "task": "emit",
+                    "shard": [byte_range.index, byte_range.start, byte_range.end],
+                    "timestamp_str": str(timestamp_str),
+                    "delta": any(dedup["delta"] for dedup in dedups),
+                }
+                for byte_range in byte_ranges
+            ],
+        )
+        stage.records = sum(emit["processed"] for emit in emits)
+        stage.bytes = sum(emit["bytes"] for emit in emits)
+    log_range_throughput("輸出", emits)
+
+    # 分區編號隨 id_hash 遞增，依序串接即為排序後的 manifest
+    next_manifest = StateManifest(
+        np.concatenate(
+            [
+                load_array_from_s3(bucket, f"{run_prefix}/manifest/part-{partition:03d}.npy")
+                for partition in range(partitions)
+            ]
+        )
+    )
+    processed_count = sum(emit["processed"] for emit in emits)
+    error_count = sum(scan["errors"] for scan in scans) + sum(emit["errors"] for emit in emits)
+    metrics.put("unique_ids", unique_count)
+    metrics.put("unchanged_skipped", unique_count - selected_count)
+    metrics.put("errors", error_count)
+    logger.info(
+        f"處理完成: 成功 {processed_count} 筆, 未變動略過 {unique_count - selected_count} 筆, "
+        f"錯誤 {error_count} 筆, 花費 {time.time() - st:.2f} 秒"
+    )
+    return processed_count, next_manifest
+
+
+def run_fanout_task(task: dict) -> dict:
+    """worker 的進入點，依 task["task"] 執行水平擴展模式的其中一個步驟"""
+    handlers = {"scan": scan_shard, "dedup": dedup_partition, "emit": emit_shard}
+    return handlers[task["task"]](task)
+
+
+def scan_shard(task: dict) -> dict:
+    """掃描一個 shard，結果依 id_hash 分區寫入 {run_prefix}/scan/part-{分區}/shard-{shard}.npy"""
+    byte_range = ByteRange(*task["shard"])
+    scan = scan_lines(byte_range.index, iter_s3_range_lines(task["bucket"], task["key"], byte_range))
+    entries = load_spill_files([scan.pop("spill")])
+    partition_ids = partition_of(entries["id_hash"], task["partitions"])
+    for partition in range(task["partitions"]):
+        save_array_to_s3(
+            task["bucket"],
+            f"{task['run_prefix']}/scan/part-{partition:03d}/shard-{byte_range.index:03d}.npy",
+            entries[partition_ids == partition],
+        )
+    return scan
+
+
+def dedup_partition(task: dict) -> dict:
+    """
+    去重一個分區並與上一次的 manifest 比對
+
+    本分區的 manifest 寫入 {run_prefix}/manifest/part-{分區}.npy，
+    被選中的 offset 依所在 shard 寫入 {run_prefix}/selected/shard-{shard}/part-{分區}.npy。
+    """
+    bucket, run_prefix, partition = task["bucket"], task["run_prefix"], task["partition"]
+    entries = np.concatenate(
+        [
+            load_array_from_s3(bucket, f"{run_prefix}/scan/part-{partition:03d}/shard-{shard:03d}.npy")
+            for shard in range(task["shards"])
+        ]
+    )
+    scanned_count = len(entries)
+    latest = select_latest(entries)
+    save_array_to_s3(
+        bucket, f"{run_prefix}/manifest/part-{partition:03d}.npy", StateManifest.from_entries(latest).entries
+    )
+    unique_count = len(latest)
+
+    delta = False
+    if task.get("manifest_key"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            previous_manifest = load_manifest_from_s3(bucket, task["manifest_key"], f"{tmp_dir}/manifest.bin")
+            delta = len(previous_manifest) > 0
+            latest = latest[
+                previous_manifest.changed_mask(latest["id_hash"], latest["update_timestamp"], latest["content_hash"])
+            ]
+
+    selected_offsets = np.sort(latest["offset"])
+    bounds = np.searchsorted(selected_offsets, task["shard_ends"])
+    for shard, offsets in enumerate(np.split(selected_offsets, bounds[:-1])):
+        save_array_to_s3(bucket, f"{run_prefix}/selected/shard-{shard:03d}/part-{partition:03d}.npy", offsets)
+    return {
+        "partition": partition,
+        "scanned": scanned_count,
+        "unique": unique_count,
+        "selected": len(latest),
+        "delta": delta,
+    }
+
+
+def emit_shard(task: dict) -> dict:
+    """以 range GET 讀取 shard 中被選中的行並上傳 chunk (chunk 命名與單機模式相同)"""
+    byte_range = ByteRange(*task["shard"])
+    selected_prefix = f"{task['run_prefix']}/selected/shard-{byte_range.index:03d}"
+    offsets = np.sort(
+        np.concatenate(
+            [
+                load_array_from_s3(task["bucket"], f"{selected_prefix}/part-{partition:03d}.npy")
+                for partition in range(task["partitions"])
+            ]
+        )
+    )
+    return emit_range(
+        (byte_range, offsets, None),
+        None,
+        task["timestamp_str"],
+        lines_at=partial(iter_s3_lines_at, task["bucket"], task["key"], byte_range),
+        delta=task.get("delta", False),
+    )
+
+
+def log_range_throughput(stage: str, range_results: list[dict]) -> None:
+    for result in range_results:
+        elapsed = max(result["elapsed"], 1e-9)
+        logger.info(
+            f"{stage} range {result['index']}: {result['lines']} 行, {result['bytes'] / 1024 / 1024:.1f} MB, "
+            f"{result['bytes'] / 1024 / 1024 / elapsed:.1f} MB/s, {result['lines'] / elapsed:.0f} 行/s"
+        )
+
+
+def upload_chunk(uploader: S3Uploader, key: str, body: bytes, metadata: dict[str, str]) -> None:
+    uploader.put_bytes(key, body, ContentType=CONTENT_TYPE, Metadata=metadata)
 
 
 def process_single_item(item):
-    update_time_str = item["update_date"]
-    dt = datetime.strptime(update_time_str, "%Y-%m-%d")
-    item["update_timestamp"] = int(dt.timestamp())
+    item["update_timestamp"] = date_to_timestamp(item["update_date"])
     return item
 
 
+@lru_cache(maxsize=16384)
+def date_to_timestamp(update_time_str: str) -> int:
+    # update_date 只有日期，數百萬筆資料中重複度極高，快取 strptime 的結果
+    # 以 UTC 解讀 (與 data_process_layer 的 date_to_version 相同)，manifest 與索引的版本不隨主機時區改變
+    return calendar.timegm(time.strptime(update_time_str, "%Y-%m-%d"))
+
+
 if __name__ == "__main__":
     if os.getenv("ENV") == "local":
-        lambda_handler(None, None)
+        import sys
+
+        # 指定 checkpoint 時接續暫停的執行 (與 invoke_resume 送出的事件相同)
+        lambda_handler({"resume": sys.argv[1]} if len(sys.argv) > 1 else None, None)
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import tempfile
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from utils.manifest import StateManifest, load_manifest_from_s3, save_manifest_to_s3
+from utils.s3 import delete_prefix_in_s3, get_s3_client, upload_file_to_s3, upload_json_to_s3
+from utils.snapshot_parser import ByteRange
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = os.getenv("CHECKPOINT_PREFIX", "checkpoints")
+
+
+class RunSuspended(Exception):
+    """執行時間不足，進度已寫入 checkpoint，需由下一次呼叫接續"""
+
+
+@dataclass
+class RangeProgress:
+    """單一 byte range 的輸出進度，只在 chunk 邊界記錄 (此前的資料都已在已上傳的 chunk 中)"""
+
+    consumed: int = 0  # 已處理的被選中行數 (被選中的 offset 由去重結果決定，每次接續都相同)
+    last_offset: int | None = None
+    keys: list[str] = field(default_factory=list)
+    processed: int = 0
+    errors: int = 0
+    complete: bool = False
+
+
+class RunCheckpoint:
+    """
+    單一快照版本的處理進度，存放於 s3://{bucket}/{CHECKPOINT_PREFIX}/{timestamp}/
+
+    - state.json: 階段、byte range 切分方式、快照大小與已接續的次數
+    - selected.npy / manifest-next.bin: 去重後要輸出的行 (offset) 與本次快照的 manifest
+    - range-{index}.json: 每個 byte range 已上傳的 chunk 與最後一筆已輸出的 offset
+
+    chunk 只在完整上傳後才記錄進度，接續時從下一個 offset 與 chunk 序號開始，不會重複輸出。
+    """
+
+    def __init__(self, bucket: str, timestamp_str: str, prefix: str = CHECKPOINT_PREFIX):
+        self.bucket = bucket
+        self.prefix = f"{prefix}/{timestamp_str}"
+
+    def _get_json(self, name: str) -> dict | None:
+        try:
+            response = get_s3_client().get_object(Bucket=self.bucket, Key=f"{self.prefix}/{name}")
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def load_state(self) -> dict | None:
+        return self._get_json("state.json")
+
+    def save_state(self, state: dict) -> None:
+        upload_json_to_s3(state, self.bucket, f"{self.prefix}/state.json")
+
+    def save_selection(
+        self, latest: np.ndarray, manifest: StateManifest, byte_ranges: list[ByteRange], delta: bool = False
+    ) -> None:
+        """記錄去重結果 (delta: 是否已排除未變動的論文)，之後的呼叫可略過下載後的掃描與去重"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            selected_path = os.path.join(tmp_dir, "selected.npy")
+            np.save(selected_path, latest)
+            upload_file_to_s3(self.bucket, f"{self.prefix}/selected.npy", selected_path)
+            save_manifest_to_s3(manifest, self.bucket, f"{self.prefix}/manifest-next.bin", f"{tmp_dir}/manifest.bin")
+        self.save_state(
+            {
+                "phase": "emit",
+                "byte_ranges": [[byte_range.index, byte_range.start, byte_range.end] for byte_range in byte_ranges],
+                "snapshot_bytes": byte_ranges[-1].end if byte_ranges else 0,
+                "resumes": 0,
+                "delta": delta,
+            }
+        )
+        logger.info(f"checkpoint: 已記錄去重結果 {len(latest)} 筆至 s3://{self.bucket}/{self.prefix}/")
+
+    def load_selection(self) -> tuple[np.ndarray, StateManifest, list[ByteRange]] | None:
+        """回傳 (要輸出的行, 本次快照的 manifest, byte range)，尚未完成去重時回傳 None"""
+        state = self.load_state()
+        if not state or state.get("phase") != "emit":
+            return None
+        tmp_dir = tempfile.mkdtemp(prefix="checkpoint-")
+        selected_path = os.path.join(tmp_dir, "selected.npy")
+        get_s3_client().download_file(self.bucket, f"{self.prefix}/selected.npy", selected_path)
+        manifest = load_manifest_from_s3(self.bucket, f"{self.prefix}/manifest-next.bin", f"{tmp_dir}/manifest.bin")
+        byte_ranges = [ByteRange(*values) for values in state["byte_ranges"]]
+        return np.load(selected_path), manifest, byte_ranges
+
+    def load_range_progress(self, index: int) -> RangeProgress | None:
+        progress = self._get_json(f"range-{index:03d}.json")
+        return RangeProgress(**progress) if progress else None
+
+    def save_range_progress(self, index: int, progress: RangeProgress) -> None:
+        upload_json_to_s3(asdict(progress), self.bucket, f"{self.prefix}/range-{index:03d}.json")
+
+    def clear(self) -> None:
+        """處理完成後刪除 checkpoint"""
+        delete_prefix_in_s3(self.bucket, f"{self.prefix}/")
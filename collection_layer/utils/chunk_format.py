@@ -0,0 +1,106 @@
+import json
+import zlib
+from collections.abc import Callable
+
+FORMAT_NAME = "arxiv-metadata-ndjson"
+FORMAT_VERSION = 1
+CHUNK_SUFFIX = ".ndjson.gz"
+CONTENT_TYPE = "application/x-ndjson"
+GZIP_WBITS = 31  # zlib 以 gzip 格式輸出 (header 中 mtime 為 0，相同內容的輸出相同)
+
+
+def _gzip_compressor(level: int):
+    return zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+
+class NdjsonChunkWriter:
+    """
+    將記錄寫成 gzip 壓縮的 NDJSON chunk，依未壓縮大小或筆數 (先達到者) 切分
+
+    每個 chunk 由兩個 gzip member 串接而成: 第一個只有一行 header (格式、版本、筆數、大小)，
+    第二個為逐行的記錄；讀取端可逐筆解壓與解析，不需將整份 chunk 載入記憶體。
+    """
+
+    def __init__(
+        self,
+        key_prefix: str,
+        upload: Callable[[str, bytes, dict[str, str]], None],
+        target_bytes: int = 16 * 1024 * 1024,
+        max_records: int = 5000,
+        compression_level: int = 6,
+        source_version: str | None = None,
+        first_sequence: int = 1,
+        delta: bool = False,
+    ):
+        """
+        Args:
+            key_prefix (str): chunk 的 key 前綴，實際 key 為 `{key_prefix}-{序號:05d}.ndjson.gz`
+            upload (Callable): upload(key, body, metadata)，負責實際上傳
+            target_bytes (int): 單一 chunk 的目標未壓縮大小
+            max_records (int): 單一 chunk 的最大筆數
+            compression_level (int): gzip 壓縮等級
+            source_version (str | None): 來源快照版本，寫入 header 供追蹤
+            first_sequence (int): 第一個 chunk 的序號，由 checkpoint 接續時從上次的下一號開始
+            delta (bool): 是否為增量輸出 (只含變動的論文)，寫入 header 與 metadata，重建索引時拒絕增量的輸出
+        """
+        self.key_prefix = key_prefix
+        self.upload = upload
+        self.target_bytes = target_bytes
+        self.max_records = max_records
+        self.compression_level = compression_level
+        self.source_version = source_version
+        self.first_sequence = first_sequence
+        self.delta = delta
+        self.keys: list[str] = []
+        self._reset()
+
+    def _reset(self) -> None:
+        self._compressor = _gzip_compressor(self.compression_level)
+        self._parts: list[bytes] = []
+        self._record_count = 0
+        self._uncompressed_bytes = 0
+
+    def append(self, record: dict) -> str | None:
+        """加入一筆記錄，達到切分條件時上傳並回傳該 chunk 的 key"""
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        self._parts.append(self._compressor.compress(line))
+        self._record_count += 1
+        self._uncompressed_bytes += len(line)
+
+        if self._record_count >= self.max_records or self._uncompressed_bytes >= self.target_bytes:
+            return self.flush()
+        return None
+
+    def flush(self) -> str | None:
+        """上傳目前累積的記錄，回傳 chunk 的 key (沒有資料時回傳 None)"""
+        if self._record_count == 0:
+            return None
+
+        self._parts.append(self._compressor.flush())
+        header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "record_count": self._record_count,
+            "uncompressed_bytes": self._uncompressed_bytes,
+            "source_version": self.source_version,
+            "delta": self.delta,
+        }
+        header_compressor = _gzip_compressor(self.compression_level)
+        header_member = header_compressor.compress(json.dumps(header).encode("utf-8") + b"\n")
+        header_member += header_compressor.flush()
+        body = header_member + b"".join(self._parts)
+
+        key = f"{self.key_prefix}-{self.first_sequence + len(self.keys):05d}{CHUNK_SUFFIX}"
+        self.upload(
+            key,
+            body,
+            {
+                "chunk-format": f"{FORMAT_NAME}-v{FORMAT_VERSION}",
+                "record-count": str(self._record_count),
+                "uncompressed-bytes": str(self._uncompressed_bytes),
+                "chunk-delta": str(self.delta).lower(),
+            },
+        )
+        self.keys.append(key)
+        self._reset()
+        return key
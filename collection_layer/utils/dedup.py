@@ -0,0 +1,101 @@
+import os
+from array import array
+
+import numpy as np
+
+# 掃描階段每筆只保留 32 bytes 的定長欄位，而非以 Python dict 保存每個 id
+SCAN_DTYPE = np.dtype(
+    [("id_hash", "<u8"), ("update_timestamp", "<i8"), ("content_hash", "<u8"), ("offset", "<u8")],
+)
+COMPACT_BLOCK_SIZE = 1 << 16
+
+
+class ScanBuffer:
+    """以 array 逐欄累積掃描結果的定長欄位"""
+
+    TYPECODES = {"id_hash": "Q", "update_timestamp": "q", "content_hash": "Q", "offset": "Q"}
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        self._columns = {field: array(typecode) for field, typecode in self.TYPECODES.items()}
+        self._append = [column.append for column in self._columns.values()]
+
+    def __len__(self) -> int:
+        return len(self._columns["id_hash"])
+
+    def add(self, id_hash: int, update_timestamp: int, content_hash: int, offset: int) -> None:
+        append_id, append_timestamp, append_content, append_offset = self._append
+        append_id(id_hash)
+        append_timestamp(update_timestamp)
+        append_content(content_hash)
+        append_offset(offset)
+
+    def to_array(self) -> np.ndarray:
+        entries = np.empty(len(self), dtype=SCAN_DTYPE)
+        for field in SCAN_DTYPE.names:
+            entries[field] = np.frombuffer(self._columns[field], dtype=SCAN_DTYPE[field])
+        self._reset()
+        return entries
+
+    def spill(self, file_path: str) -> int:
+        """逐欄寫入暫存檔後清空緩衝區，回傳筆數"""
+        count = len(self)
+        with open(file_path, "wb") as file:
+            for field in SCAN_DTYPE.names:
+                self._columns[field].tofile(file)
+        self._reset()
+        return count
+
+
+def load_spill_files(spills: list[tuple[str, int]]) -> np.ndarray:
+    """
+    依序讀入多個 spill 檔並串接為單一陣列，讀取後刪除暫存檔
+
+    先配置好完整陣列再逐欄填入，峰值記憶體約為結果本身加上單一欄位的大小。
+
+    Args:
+        spills (list[tuple[str, int]]): (檔案路徑, 筆數)，依檔案順序排列
+    """
+    entries = np.empty(sum(count for _, count in spills), dtype=SCAN_DTYPE)
+    position = 0
+    for file_path, count in spills:
+        with open(file_path, "rb") as file:
+            for field in SCAN_DTYPE.names:
+                entries[field][position : position + count] = np.fromfile(file, dtype=SCAN_DTYPE[field], count=count)
+        os.remove(file_path)
+        position += count
+    return entries
+
+
+def select_latest(entries: np.ndarray) -> np.ndarray:
+    """
+    每個 id 只保留 update_timestamp 最新的一筆，時間相同則保留檔案中較後出現者
+
+    直接在 entries 上排序與壓縮 (會修改輸入)，不需額外配置整份陣列。
+
+    Args:
+        entries (np.ndarray): SCAN_DTYPE 陣列，可來自多個 range 的串接
+
+    Returns:
+        np.ndarray: 依 id_hash 排序、每個 id 恰好一筆的 SCAN_DTYPE 陣列 (entries 前段的 view)
+    """
+    if len(entries) == 0:
+        return entries
+
+    entries.sort(order=["id_hash", "update_timestamp", "offset"])
+
+    # 逐區塊把每個 id 的最後一筆往前搬，寫入位置永遠不會超過讀取位置
+    ids = entries["id_hash"]
+    kept = 0
+    for start in range(0, len(entries), COMPACT_BLOCK_SIZE):
+        end = min(start + COMPACT_BLOCK_SIZE, len(entries))
+        stop = min(end, len(entries) - 1)  # 整份陣列的最後一筆必為該 id 的最後一筆
+        is_last = np.ones(end - start, dtype=bool)
+        is_last[: stop - start] = ids[start + 1 : stop + 1] != ids[start:stop]
+
+        block = entries[start:end][is_last]
+        entries[kept : kept + len(block)] = block
+        kept += len(block)
+    return entries[:kept]
@@ -0,0 +1,133 @@
+import io
+import json
+import logging
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import pairwise
+
+import boto3
+import numpy as np
+from botocore.config import Config
+
+from utils.s3 import get_s3_client
+from utils.snapshot_parser import ByteRange, run_in_processes
+from utils.zip_stream import READ_SIZE, iter_lines_with_offsets
+
+logger = logging.getLogger(__name__)
+
+# 尋找行尾時每次讀取的大小 (單行 metadata 通常小於 10 KB)
+PROBE_SIZE = 1 << 16
+# 同步呼叫 worker 時需等待其執行完畢 (最長 15 分鐘)
+LAMBDA_READ_TIMEOUT = 960
+
+
+class LambdaFanout:
+    """以同步呼叫 (RequestResponse) 平行執行 worker Lambda，回傳結果依 payload 順序排列"""
+
+    def __init__(self, function_name: str, max_concurrency: int = 16):
+        self.function_name = function_name
+        self.max_concurrency = max_concurrency
+        self.client = boto3.client(
+            "lambda",
+            config=Config(
+                read_timeout=LAMBDA_READ_TIMEOUT,
+                max_pool_connections=max_concurrency,
+                # 失敗由 coordinator 整體重跑，不在此重送 (避免同一個 worker 重複輸出)
+                retries={"max_attempts": 0},
+            ),
+        )
+
+    def _invoke(self, payload: dict) -> dict:
+        response = self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="RequestResponse",
+            Payload=json.dumps({"fanout_task": payload}).encode("utf-8"),
+        )
+        result = json.loads(response["Payload"].read())
+        if "FunctionError" in response:
+            raise RuntimeError(f"worker {payload.get('task')} 失敗: {result}")
+        return result
+
+    def map(self, payloads: list[dict]) -> list[dict]:
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, max(len(payloads), 1))) as executor:
+            return list(executor.map(self._invoke, payloads))
+
+
+class ProcessFanout:
+    """本地執行用: 以子行程執行 worker handler，取代 Lambda 的 fan-out"""
+
+    def __init__(self, handler: Callable[[dict], dict], workers: int):
+        self.handler = handler
+        self.workers = workers
+
+    def map(self, payloads: list[dict]) -> list[dict]:
+        return run_in_processes(self.handler, payloads, self.workers)
+
+
+def split_s3_byte_ranges(bucket: str, key: str, size: int, parts: int) -> list[ByteRange]:
+    """
+    以少量的 range GET 將 S3 上的 NDJSON 切成 `parts` 段以行首對齊的 byte range
+
+    切分點的規則與 split_byte_ranges 相同，對同一份檔案會得到相同的結果。
+    """
+    s3 = get_s3_client()
+    boundaries = [0]
+    for part in range(1, max(parts, 1)):
+        target = size * part // parts
+        if target <= boundaries[-1]:
+            continue
+        # 從 target 前一個 byte 開始找行尾，下一個位置必為行首
+        position = target - 1
+        while position < size:
+            end = min(position + PROBE_SIZE, size) - 1
+            data = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={position}-{end}")["Body"].read()
+            newline = data.find(b"\n")
+            if newline >= 0:
+                position += newline + 1
+                break
+            position = end + 1
+        if boundaries[-1] < position < size:
+            boundaries.append(position)
+    boundaries.append(size)
+    return [ByteRange(index, start, end) for index, (start, end) in enumerate(pairwise(boundaries)) if end > start]
+
+
+def iter_s3_range_lines(bucket: str, key: str, byte_range: ByteRange) -> Iterator[tuple[int, bytes]]:
+    """以單一 range GET 串流讀取 byte range，逐行產出 (offset, line)"""
+    if byte_range.size == 0:
+        return iter(())
+    response = get_s3_client().get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={byte_range.start}-{byte_range.end - 1}"
+    )
+    return iter_lines_with_offsets(response["Body"].iter_chunks(READ_SIZE), start=byte_range.start)
+
+
+def iter_s3_lines_at(bucket: str, key: str, byte_range: ByteRange, offsets: np.ndarray) -> Iterator[tuple[int, bytes]]:
+    """串流讀取 byte range，只產出起始位置在 offsets (已排序) 中的行"""
+    if len(offsets) == 0:
+        return
+    wanted = iter(offsets.tolist())
+    target = next(wanted)
+    for offset, line in iter_s3_range_lines(bucket, key, byte_range):
+        if offset != target:
+            continue
+        yield offset, line
+        target = next(wanted, None)
+        if target is None:
+            return
+
+
+def partition_of(id_hashes: np.ndarray, partitions: int) -> np.ndarray:
+    """依 id_hash 的高位分區，分區編號隨 id_hash 遞增 (各分區依序串接後仍為排序)"""
+    return ((id_hashes >> np.uint64(32)) * np.uint64(partitions)) >> np.uint64(32)
+
+
+def save_array_to_s3(bucket: str, key: str, array: np.ndarray) -> None:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    get_s3_client().put_object(Bucket=bucket, Key=key, Body=buffer.getvalue(), ServerSideEncryption="AES256")
+
+
+def load_array_from_s3(bucket: str, key: str) -> np.ndarray:
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+    return np.load(io.BytesIO(body), allow_pickle=False)
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import NamedTuple
+
+from botocore.exceptions import ClientError
+
+from utils.s3 import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+# 上次處理的來源版本與執行狀態，每次觸發只需一次 GET (S3 為強一致，寫入後立即可讀)
+RUN_STATE_KEY = os.getenv("RUN_STATE_KEY", "state/run.json")
+
+
+class SourceVersion(NamedTuple):
+    """來源資料集的版本: lastUpdated (ms) 與 metadata 回應的 ETag (供下次以 If-None-Match 確認)"""
+
+    version: int
+    etag: str | None = None
+
+
+class RunStateConflict(Exception):
+    """state 在讀取後已被其他執行更新 (條件式寫入失敗)"""
+
+
+@dataclass
+class RunState:
+    """
+    s3://{bucket}/{RUN_STATE_KEY} 的內容
+
+    status 為 running / success / failed；source_version 為最後一次開始或完成處理的來源版本，
+    processed_version 為最後一次成功處理的版本 (判斷是否需要處理只看此欄位)。
+    """
+
+    source_version: int = 0
+    source_etag: str | None = None
+    processed_version: int = 0
+    status: str = "none"
+    snapshot_key: str | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    # 讀取時 state 物件的 ETag，寫入時以 If-Match 確認未被其他執行更新 (不寫入 state 內容)
+    etag: str | None = field(default=None, compare=False)
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        del data["etag"]
+        return json.dumps(data, ensure_ascii=False)
+
+
+def load_run_state(bucket: str, key: str = RUN_STATE_KEY) -> RunState | None:
+    """讀取 state，不存在時回傳 None"""
+    try:
+        response = get_s3_client().get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    data = json.loads(response["Body"].read())
+    return RunState(**data, etag=response["ETag"])
+
+
+def save_run_state(bucket: str, state: RunState, key: str = RUN_STATE_KEY) -> RunState:
+    """
+    以條件式寫入更新 state: 讀取時不存在則要求仍不存在 (If-None-Match)，否則要求 ETag 未變 (If-Match)
+
+    Returns:
+        RunState: 寫入後的 state (etag 已更新，可再次寫入)
+
+    Raises:
+        RunStateConflict: state 已被其他執行更新
+    """
+    condition = {"IfMatch": state.etag} if state.etag else {"IfNoneMatch": "*"}
+    try:
+        response = get_s3_client().put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=state.to_json().encode("utf-8"),
+            ContentType="application/json",
+            ServerSideEncryption="AES256",
+            **condition,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise RunStateConflict(f"s3://{bucket}/{key} 已被其他執行更新") from e
+        raise
+    state.etag = response["ETag"]
+    return state
+
+
+def bootstrap_run_state(bucket: str, folder_prefix: str) -> RunState:
+    """
+    尚未建立 state 時，由既有的快照檔名 ({folder_prefix}-{timestamp}.json) 推算上次處理的版本
+
+    以分頁列出所有快照 (不受單次 1000 筆的限制)，只在第一次執行時需要。
+    """
+    latest = 0
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{folder_prefix}-"):
+        for item in page.get("Contents", []):
+            timestamp = item["Key"].removeprefix(f"{folder_prefix}-").removesuffix(".json")
+            if timestamp.isdigit():
+                latest = max(latest, int(timestamp))
+    logger.info(f"尚未建立 run state，由既有的快照推算上次處理的版本: {latest}")
+    status = "success" if latest else "none"
+    return RunState(source_version=latest, processed_version=latest, status=status, finished_at=time.time())
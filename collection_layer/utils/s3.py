@@ -1,16 +1,73 @@
 import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+MAX_POOL_CONNECTIONS = 32
+# 快照約數 GB，以較大的 part 並行上傳，減少 part 數與請求次數
+SNAPSHOT_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    multipart_chunksize=64 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True,
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    取得共用的 S3 client，同一行程內重複使用連線池
+
+    以 pid 區分，fork 出的子行程不會沿用父行程的連線。
+    """
+    pid = os.getpid()
+    with _clients_lock:
+        if pid not in _clients:
+            _clients[pid] = boto3.client(
+                "s3",
+                config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": 5, "mode": "adaptive"},
+                ),
+            )
+        return _clients[pid]
 
 
 def upload_file_to_s3(bucket_name: str, object_name: str, file_path: str) -> None:
-    s3 = boto3.client("s3")
-    s3.upload_file(file_path, bucket_name, object_name)
+    s3 = get_s3_client()
+    s3.upload_file(file_path, bucket_name, object_name, Config=SNAPSHOT_TRANSFER_CONFIG)
+
+
+def copy_object_in_s3(bucket_name: str, source_key: str, object_name: str) -> None:
+    """S3 內部複製 (大於 5 GB 的物件以 multipart copy 進行)"""
+    s3 = get_s3_client()
+    s3.copy({"Bucket": bucket_name, "Key": source_key}, bucket_name, object_name, Config=SNAPSHOT_TRANSFER_CONFIG)
+
+
+def delete_prefix_in_s3(bucket_name: str, prefix: str) -> int:
+    """刪除 prefix 下的所有物件，回傳刪除的數量"""
+    s3 = get_s3_client()
+    deleted = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=prefix):
+        objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        if objects:
+            s3.delete_objects(Bucket=bucket_name, Delete={"Objects": objects})
+            deleted += len(objects)
+    return deleted
 
 
 def upload_json_to_s3(data: dict, bucket: str, key: str, **kwargs):
     """上傳 JSON 資料到 S3"""
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
 
     default_args = {"ContentType": "application/json", "ServerSideEncryption": "AES256"}
     default_args.update(kwargs)
@@ -23,3 +80,84 @@ def upload_json_to_s3(data: dict, bucket: str, key: str, **kwargs):
     )
 
     return f"s3://{bucket}/{key}"
+
+
+class S3Uploader:
+    """
+    以背景 thread pool 上傳物件，呼叫端 (解析) 不必等待每次網路往返
+
+    尚未完成的上傳數達到 max_pending 時，put_bytes 會阻塞呼叫端 (backpressure)，
+    避免上傳跟不上解析時記憶體無限增長。失敗的 key 於 flush / close 時回報。
+    """
+
+    def __init__(self, bucket: str, max_workers: int = 8, max_pending: int = 16, client=None):
+        """
+        Args:
+            bucket (str): 目標 bucket
+            max_workers (int): 同時上傳的執行緒數
+            max_pending (int): 尚未完成 (含上傳中) 的上傳數上限
+            client: S3 client，預設使用 get_s3_client()
+        """
+        self.bucket = bucket
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload")
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.lock = threading.Lock()
+        self.pending: set[Future] = set()
+        self.failed: dict[str, str] = {}
+        self.uploaded_count = 0
+        self.uploaded_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put_bytes(self, key: str, body: bytes, **kwargs) -> None:
+        """排入一個上傳工作，尚未完成的上傳已達上限時等待"""
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self._put, key, body, kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._on_done)
+
+    def _put(self, key: str, body: bytes, kwargs: dict) -> None:
+        client = self.client or get_s3_client()
+        try:
+            client.put_object(Bucket=self.bucket, Key=key, Body=body, ServerSideEncryption="AES256", **kwargs)
+        except Exception as e:
+            logger.error(f"上傳失敗 s3://{self.bucket}/{key}: {e}")
+            with self.lock:
+                self.failed[key] = str(e)
+            return
+        with self.lock:
+            self.uploaded_count += 1
+            self.uploaded_bytes += len(body)
+
+    def _on_done(self, future: Future) -> None:
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+
+    def flush(self) -> list[str]:
+        """等待目前所有的上傳完成，回傳失敗的 key"""
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                break
+            for future in pending:
+                future.result()
+        with self.lock:
+            return sorted(self.failed)
+
+    def close(self) -> list[str]:
+        """等待上傳完成並關閉 thread pool，回傳失敗的 key"""
+        failed_keys = self.flush()
+        self.executor.shutdown(wait=True)
+        return failed_keys
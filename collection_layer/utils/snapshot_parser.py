@@ -0,0 +1,238 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import traceback
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from itertools import pairwise
+from multiprocessing.connection import wait
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+READ_BUFFER_SIZE = 1 << 20
+
+# JSON 字串值中的雙引號必定被跳脫，因此這兩個 pattern 只會命中頂層的 key
+ID_PATTERN = re.compile(rb'"id"\s*:\s*"([^"\\]*)"')
+UPDATE_DATE_PATTERN = re.compile(rb'"update_date"\s*:\s*"([^"\\]*)"')
+
+
+@dataclass(frozen=True)
+class ByteRange:
+    index: int
+    start: int
+    end: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+def split_byte_ranges(file_path: str, parts: int) -> list[ByteRange]:
+    """
+    將檔案切成 `parts` 段大小相近、且每段都從行首開始的 byte range
+
+    Args:
+        file_path (str): NDJSON 檔案路徑
+        parts (int): 預計切分的段數 (檔案太小時實際段數可能較少)
+
+    Returns:
+        list[ByteRange]: 依檔案順序排列的 byte range
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, "rb") as file:
+        for part in range(1, max(parts, 1)):
+            target = size * part // parts
+            if target <= boundaries[-1]:
+                continue
+            # 從 target 前一個 byte 讀到行尾，下一個位置必為行首
+            file.seek(target - 1)
+            file.readline()
+            position = file.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+    boundaries.append(size)
+
+    return [ByteRange(index, start, end) for index, (start, end) in enumerate(pairwise(boundaries)) if end > start]
+
+
+def iter_range_lines(file_path: str, byte_range: ByteRange) -> Iterator[tuple[int, bytes]]:
+    """依序產出 range 內每一行的 (起始 offset, 原始 bytes)"""
+    with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as file:
+        file.seek(byte_range.start)
+        offset = byte_range.start
+        while offset < byte_range.end:
+            line = file.readline()
+            if not line:
+                break
+            yield offset, line
+            offset += len(line)
+
+
+def iter_lines_at(file_path: str, offsets) -> Iterator[tuple[int, bytes]]:
+    """
+    依序讀取指定 offset 開頭的行
+
+    offsets 需為遞增，連續的行會直接順序讀取，不連續時才 seek，
+    讓只需輸出少量資料的增量執行不必讀過整個檔案。
+    """
+    with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as file:
+        position = -1
+        for offset in offsets:
+            offset = int(offset)
+            if offset != position:
+                file.seek(offset)
+            line = file.readline()
+            position = offset + len(line)
+            yield offset, line
+
+
+def extract_key_fields(line: bytes) -> tuple[str, str]:
+    """
+    只取出去重需要的 id 與 update_date，避免對整行 (含 abstract) 執行 json.loads
+
+    無法以 pattern 取得 (例如含跳脫字元) 時改用 json.loads，格式錯誤則拋出例外。
+    """
+    id_match = ID_PATTERN.search(line)
+    date_match = UPDATE_DATE_PATTERN.search(line)
+    if id_match and date_match:
+        return id_match.group(1).decode("utf-8"), date_match.group(1).decode("utf-8")
+
+    item = json.loads(line)
+    return str(item["id"]), item["update_date"]
+
+
+def _run_worker(func: Callable[[Any], Any], task: Any, conn) -> None:
+    try:
+        conn.send(("ok", func(task)))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_in_processes(func: Callable[[Any], Any], tasks: list[Any], workers: int) -> list[Any]:
+    """
+    以多個行程執行 func(task)，回傳結果依 tasks 順序排列
+
+    Lambda 環境沒有 /dev/shm，multiprocessing.Pool / Queue 無法使用，
+    因此改以 Process + Pipe 實作；子行程以 fork 建立，func / task 不需可 pickle。
+    fork 時若有其他執行緒持有鎖 (logging、S3 連線池等)，子行程可能死結，
+    呼叫前須先結束背景執行緒 (串流下載的 prefetch、S3Uploader 的 thread pool)。
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(task) for task in tasks]
+
+    threads = [thread.name for thread in threading.enumerate() if thread is not threading.current_thread()]
+    if threads:
+        logger.warning(f"fork 時仍有執行中的執行緒 {threads}，子行程可能死結")
+    context = multiprocessing.get_context("fork")
+    results: list[Any] = [None] * len(tasks)
+    pending = list(enumerate(tasks))
+    running = {}
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                index, task = pending.pop(0)
+                reader, writer = context.Pipe(duplex=False)
+                process = context.Process(target=_run_worker, args=(func, task, writer), daemon=True)
+                process.start()
+                writer.close()
+                running[reader] = (index, process)
+
+            for reader in wait(list(running)):
+                index, process = running.pop(reader)
+                try:
+                    status, payload = reader.recv()
+                except EOFError:
+                    status, payload = "error", f"worker exited unexpectedly (exitcode={process.exitcode})"
+                reader.close()
+                process.join()
+
+                if status == "error":
+                    raise RuntimeError(f"task {index} failed:\n{payload}")
+                results[index] = payload
+    finally:
+        for reader, (_, process) in running.items():
+            process.terminate()
+            process.join()
+            reader.close()
+
+    return results
+
+
+def _serve_tasks(func: Callable[[Any], Any], conn) -> None:
+    try:
+        while (task := conn.recv()) is not None:
+            try:
+                conn.send(("ok", func(task)))
+            except BaseException:
+                conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _collect_results(running: dict, results: list[Any], idle: list) -> None:
+    """等待至少一個子行程完成，結果依 task 編號寫入 results，完成的子行程放回 idle"""
+    for conn in wait(list(running)):
+        index = running.pop(conn)
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            status, payload = "error", "worker exited unexpectedly"
+        if status == "error":
+            raise RuntimeError(f"task {index} failed:\n{payload}")
+        results[index] = payload
+        idle.append(conn)
+
+
+def map_in_processes(func: Callable[[Any], Any], tasks: Iterable[Any], workers: int) -> list[Any]:
+    """
+    以常駐的子行程執行 func(task)，tasks 可為邊執行邊產生的 iterator，回傳結果依 tasks 順序排列
+
+    子行程在讀取第一個 task 前就先 fork，產生 task 的過程中 (例如串流下載的背景執行緒已啟動後)
+    不會再 fork；所有子行程都在執行時，暫停讀取下一個 task。task 與結果經由 Pipe 傳遞，須可 pickle。
+    """
+    if workers <= 1:
+        return [func(task) for task in tasks]
+
+    context = multiprocessing.get_context("fork")
+    pool = []
+    for _ in range(workers):
+        conn, child_conn = context.Pipe()
+        process = context.Process(target=_serve_tasks, args=(func, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        pool.append((conn, process))
+
+    results: list[Any] = []
+    idle = [conn for conn, _ in pool]
+    running = {}
+    completed = False
+    try:
+        for index, task in enumerate(tasks):
+            if not idle:
+                _collect_results(running, results, idle)
+            conn = idle.pop()
+            results.append(None)
+            conn.send(task)
+            running[conn] = index
+        while running:
+            _collect_results(running, results, idle)
+        completed = True
+    finally:
+        # 正常結束時子行程皆已閒置，通知後等待結束；失敗時直接終止
+        for conn, process in pool:
+            if completed:
+                conn.send(None)
+            else:
+                process.terminate()
+            process.join()
+            conn.close()
+
+    return results
@@ -0,0 +1,227 @@
+import io
+import queue
+import struct
+import threading
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO
+
+LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+ZIP64_EXTRA_ID = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x08
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+READ_SIZE = 1 << 20
+
+
+class _StreamReader:
+    """包裝不可 seek 的串流 (例如 HTTP response)，提供精確讀取與回填"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.pending = b""
+
+    def read(self, size: int) -> bytes:
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self.stream.read(size)
+
+    def read_exact(self, size: int) -> bytes:
+        parts = []
+        while size > 0:
+            data = self.read(min(size, READ_SIZE))
+            if not data:
+                raise EOFError("Unexpected end of zip stream")
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes) -> None:
+        self.pending = data + self.pending
+
+
+def _parse_zip64_sizes(extra: bytes, compressed_size: int, uncompressed_size: int) -> tuple[int, int]:
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, position)
+        if header_id == ZIP64_EXTRA_ID:
+            fields = extra[position + 4 : position + 4 + size]
+            index = 0
+            if uncompressed_size == 0xFFFFFFFF:
+                (uncompressed_size,) = struct.unpack_from("<Q", fields, index)
+                index += 8
+            if compressed_size == 0xFFFFFFFF:
+                (compressed_size,) = struct.unpack_from("<Q", fields, index)
+            break
+        position += 4 + size
+    return compressed_size, uncompressed_size
+
+
+def iter_zip_member(stream: BinaryIO, member_name: str) -> Iterator[bytes]:
+    """
+    從不可 seek 的 zip 串流中邊讀邊解壓指定的檔案，不需先把 zip 存到磁碟
+
+    依序讀取 local file header (支援 Zip64 與 data descriptor)，
+    只解壓目標檔案並驗證 CRC32。
+
+    Args:
+        stream (BinaryIO): 具有 read(size) 的串流，例如 open(..., "rb") 或 requests 的 response.raw
+        member_name (str): zip 內的檔案名稱
+
+    Yields:
+        bytes: 解壓後的資料區塊
+    """
+    reader = _StreamReader(stream)
+    while True:
+        signature = reader.read_exact(4)
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise FileNotFoundError(f"{member_name} not found in zip stream")
+
+        (_, _, flags, method, _, _, crc, compressed_size, uncompressed_size, name_length, extra_length) = (
+            LOCAL_HEADER.unpack(signature + reader.read_exact(LOCAL_HEADER.size - 4))
+        )
+        name = reader.read_exact(name_length).decode("utf-8")
+        extra = reader.read_exact(extra_length)
+        compressed_size, uncompressed_size = _parse_zip64_sizes(extra, compressed_size, uncompressed_size)
+        has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+
+        if name != member_name:
+            if has_descriptor:
+                raise ValueError(f"Cannot skip streamed zip member without size: {name}")
+            reader.read_exact(compressed_size)
+            continue
+
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise ValueError(f"Unsupported zip compression method: {method}")
+        if method == METHOD_STORED and has_descriptor:
+            raise ValueError(f"Cannot stream stored zip member without size: {name}")
+
+        yield from _inflate_member(reader, method, compressed_size, crc, has_descriptor)
+        return
+
+
+def _inflate_member(
+    reader: _StreamReader, method: int, compressed_size: int, expected_crc: int, has_descriptor: bool
+) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == METHOD_DEFLATED else None
+    actual_crc = 0
+    remaining = None if has_descriptor else compressed_size
+
+    while remaining is None or remaining > 0:
+        data = reader.read(READ_SIZE if remaining is None else min(READ_SIZE, remaining))
+        if not data:
+            raise EOFError("Unexpected end of zip stream")
+        if remaining is not None:
+            remaining -= len(data)
+
+        output = decompressor.decompress(data) if decompressor else data
+        if output:
+            actual_crc = zlib.crc32(output, actual_crc)
+            yield output
+
+        if decompressor and decompressor.eof:
+            reader.unread(decompressor.unused_data)
+            break
+
+    if decompressor and not decompressor.eof:
+        raise EOFError("Truncated deflate stream")
+
+    if has_descriptor:
+        descriptor = reader.read_exact(4)
+        if descriptor == DATA_DESCRIPTOR_SIGNATURE:
+            descriptor = reader.read_exact(4)
+        (expected_crc,) = struct.unpack("<I", descriptor)
+
+    if actual_crc != expected_crc:
+        raise ValueError(f"CRC mismatch: expected {expected_crc:08x}, got {actual_crc:08x}")
+
+
+def prefetch(chunks: Iterable[bytes], max_buffered: int = 8) -> Iterator[bytes]:
+    """
+    以背景執行緒預先讀取 (下載與解壓)，讓網路 I/O 與解壓和後續的解析同時進行
+
+    zlib 與 socket 讀取期間會釋放 GIL，因此能與主執行緒的解析重疊。
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max_buffered)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                buffer.put(chunk)
+            buffer.put(done)
+        except BaseException as e:
+            buffer.put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # 讓被阻塞在 put 的 producer 可以結束
+        while thread.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        # 結束後才會 fork 出輸出行程，確保執行緒已完全結束
+        thread.join()
+
+
+def tee_to_file(chunks: Iterable[bytes], file_path: str) -> Iterator[bytes]:
+    """將串流資料寫入檔案的同時往下傳遞"""
+    with open(file_path, "wb") as file:
+        for chunk in chunks:
+            file.write(chunk)
+            yield chunk
+
+
+def tee_to_ranges(chunks: Iterable[bytes], file_path: str, segment_bytes: int) -> Iterator[tuple[int, int]]:
+    """
+    將串流資料寫入檔案，每寫入約 segment_bytes 就產出一段以行首對齊的 (start, end)
+
+    產出前已 flush，其他行程可直接從檔案讀取該範圍；最後一段包含檔尾沒有換行的資料。
+    """
+    start = line_end = written = 0
+    with open(file_path, "wb") as file:
+        for chunk in chunks:
+            newline = chunk.rfind(b"\n")
+            file.write(chunk)
+            if newline >= 0:
+                line_end = written + newline + 1
+            written += len(chunk)
+            if line_end - start >= segment_bytes:
+                file.flush()
+                yield start, line_end
+                start = line_end
+    if written > start:
+        yield start, written
+
+
+def iter_lines_with_offsets(chunks: Iterable[bytes], start: int = 0) -> Iterator[tuple[int, bytes]]:
+    """將資料區塊切成行，並附上每行在解壓後檔案中的起始 offset (資料從檔案的 start 開始)"""
+    offset = start
+    remainder = b""
+    for chunk in chunks:
+        data = remainder + chunk
+        end = data.rfind(b"\n") + 1
+        remainder = data[end:]
+        # 與 iter_range_lines 相同，只以 \n 斷行
+        for line in io.BytesIO(data[:end]):
+            yield offset, line
+            offset += len(line)
+    if remainder:
+        yield offset, remainder
@@ -1,39 +1,87 @@
+import argparse
 import os
+import sys
+import time
+from pathlib import Path
 
 import boto3
 from dotenv import load_dotenv
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
+from opensearchpy import OpenSearch
 
 load_dotenv()
 
+# 與 data_process_layer 共用 OpenSearch client 的設定
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "data_process_layer"))
+from utils.authors import (  # noqa: E402
+    AUTHOR_BUCKET,
+    AUTHOR_IDS_FIELD,
+    AUTHOR_INDEX_ENABLED,
+    AuthorPostings,
+    collect_authors,
+)
+from utils.chunk_format import DeltaChunkError, iter_chunk_records  # noqa: E402
+from utils.embedding import EMBEDDING_DIMENSION, VECTOR_FIELD, get_vector_mapping  # noqa: E402
+from utils.index_to_db import BulkController, bulk_index_documents  # noqa: E402
+from utils.opensearch_client import OPENSEARCH_SERVICE, get_open_search_client  # noqa: E402
+from utils.rollups import ROLLUP_BUCKET, ROLLUPS_ENABLED, compact_rollups  # noqa: E402
+from utils.transform_metadata import (  # noqa: E402
+    DOCUMENT_PROFILE,
+    EMBEDDING_ENABLED,
+    PROFILES,
+    transform_metadata_batch,
+)
+
+# 查詢與 data_process_layer 寫入皆經由 alias，實際的索引為 {alias}-{時間戳} (每次重建一個世代)
+INDEX_ALIAS = os.getenv("INDEX_ALIAS", "arxiv-papers")
+INDEX_REPLICAS = int(os.getenv("INDEX_REPLICAS", 1))
+INDEX_REFRESH_INTERVAL = os.getenv("INDEX_REFRESH_INTERVAL", "1s")
+# 切換後保留的世代數 (含目前使用中的索引)，供回滾
+KEEP_GENERATIONS = int(os.getenv("KEEP_GENERATIONS", 2))
+FORCE_MERGE_SEGMENTS = int(os.getenv("FORCE_MERGE_SEGMENTS", 1))
+# 寫入期間的設定: 不 refresh、不建立 replica，完成後再恢復
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+# aoss 可設定的索引設定 (建立 knn_vector 欄位需要 index.knn)
+AOSS_INDEX_SETTINGS = ("knn",)
+# dynamic mapping 不會產生的欄位型別，只存在於舊索引時表示舊索引為不同的 profile 或有向量欄位
+EXPLICIT_FIELD_TYPES = ("nested", "knn_vector")
+
 
 def main():
-    index_name = "arxiv-papers"
-    open_search_client = get_open_search_client()
-    # Notes: 注意這邊會把原本相同名字的進行刪除
-    create_and_init_index(open_search_client, index_name, get_papers_mappings())
-
-
-def get_open_search_client():
-    service = "aoss"
-    region = "ap-northeast-1"
-    credentials = boto3.Session().get_credentials()
-    awsauth = AWS4Auth(
-        credentials.access_key,
-        credentials.secret_key,
-        region,
-        service,
-        session_token=credentials.token,
+    parser = argparse.ArgumentParser(description="建立 / 重建 arxiv-papers 索引")
+    parser.add_argument(
+        "--source",
+        default="reindex",
+        help="新索引的資料來源: reindex (由目前 alias 指向的索引複製)、none (建立空索引) "
+        "或 s3://bucket/parsed_<ts>/ (載入 collection_layer 輸出的 chunk)",
     )
-    host = os.getenv("OPEN_SEARCH_HOST")
-    return OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=awsauth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        timeout=300,
+    parser.add_argument("--keep", type=int, default=KEEP_GENERATIONS, help="保留的世代數")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PROFILES),
+        default=DOCUMENT_PROFILE,
+        help="文件格式 (須與 data_process_layer 的 DOCUMENT_PROFILE 相同；變更時須以 s3:// 來源重建)",
+    )
+    parser.add_argument("--recreate", action="store_true", help="舊行為: 直接刪除並重建同名索引 (重建期間無法查詢)")
+    parser.add_argument(
+        "--assume-full",
+        action="store_true",
+        help="由 S3 載入未標記全量 / 增量的舊 chunk 時，確認其為完整快照 (增量輸出的 chunk 仍會拒絕)",
+    )
+    args = parser.parse_args()
+
+    open_search_client = get_open_search_client()
+    if args.recreate:
+        # Notes: 注意這邊會把原本相同名字的進行刪除
+        create_and_init_index(open_search_client, INDEX_ALIAS, get_papers_mappings(args.profile))
+        return
+    rebuild_index(
+        open_search_client,
+        INDEX_ALIAS,
+        get_papers_mappings(args.profile),
+        args.source,
+        args.keep,
+        profile=args.profile,
+        assume_full=args.assume_full,
     )
 
 
@@ -47,7 +95,283 @@ def create_and_init_index(client: OpenSearch, index_name: str, mappings: dict):
     print(f"索引 '{index_name}' 已創建")
 
 
-def get_papers_mappings() -> dict:
+def rebuild_index(
+    client: OpenSearch,
+    alias: str,
+    mappings: dict,
+    source: str = "reindex",
+    keep: int = KEEP_GENERATIONS,
+    service: str = OPENSEARCH_SERVICE,
+    profile: str = DOCUMENT_PROFILE,
+    assume_full: bool = False,
+) -> str:
+    """
+    Blue/green 重建: 建立新世代的索引並載入資料，完成後才將 alias 切換過去
+
+    重建期間查詢仍由舊索引提供；切換為單一 update_aliases 請求，不會有 alias 不存在的空窗。
+    重建期間由 data_process_layer 寫入舊索引的變動不會出現在新索引，應於 pipeline 空檔執行。
+    載入失敗 (reindex 回報失敗或逾時、文件數與舊索引不同) 時不切換 alias，並刪除新索引。
+
+    Args:
+        client (OpenSearch): OpenSearch client
+        alias (str): 查詢與寫入使用的 alias 名稱
+        mappings (dict): 新索引的 mapping
+        source (str): reindex / none / s3://bucket/prefix/
+        keep (int): 切換後保留的世代數
+        service (str): aoss 不支援 refresh_interval / replica / force merge / codec 等設定，會略過這些步驟
+        profile (str): 由 S3 載入時使用的文件格式 (reindex 沿用舊索引的文件)
+        assume_full (bool): 由 S3 載入時接受未標記全量 / 增量的舊 chunk (見 check_full_snapshot)
+
+    Returns:
+        str: 新索引的名稱
+    """
+    if source.startswith("s3://"):
+        # 增量輸出不含未變動的論文，建立新索引前先確認
+        check_full_snapshot(*parse_s3_source(source), assume_full)
+    tune_settings = service != "aoss"
+    index_name = f"{alias}-{time.strftime('%Y%m%d%H%M%S', time.gmtime())}"
+    previous_indices = get_alias_targets(client, alias)
+    if source == "reindex" and previous_indices:
+        check_reindex_mappings(client, alias, mappings)
+
+    body = dict(mappings)
+    index_settings = body.pop("settings", {}).get("index", {})
+    if tune_settings:
+        body["settings"] = {"index": {**index_settings, **BULK_LOAD_SETTINGS}}
+    elif any(name in index_settings for name in AOSS_INDEX_SETTINGS):
+        body["settings"] = {
+            "index": {name: index_settings[name] for name in AOSS_INDEX_SETTINGS if name in index_settings}
+        }
+    client.indices.create(index=index_name, body=body)
+    print(f"索引 '{index_name}' 已創建 (寫入設定: {body.get('settings')})")
+
+    try:
+        st = time.time()
+        loaded = load_index(client, index_name, alias, source, profile, assume_full)
+        print(f"載入 {loaded} 筆至 '{index_name}', 花費 {time.time() - st:.2f} 秒")
+
+        if tune_settings:
+            client.indices.put_settings(
+                index=index_name,
+                body={"index": {"refresh_interval": INDEX_REFRESH_INTERVAL, "number_of_replicas": INDEX_REPLICAS}},
+            )
+            client.indices.refresh(index=index_name)
+            client.indices.forcemerge(index=index_name, max_num_segments=FORCE_MERGE_SEGMENTS, request_timeout=3600)
+            # replica 建立完成前不切換，避免切換後查詢負載全落在 primary
+            client.cluster.health(index=index_name, wait_for_status="green", timeout="30m", request_timeout=1900)
+        else:
+            client.indices.refresh(index=index_name)
+
+        if source == "reindex" and previous_indices:
+            check_document_count(client, index_name, alias)
+    except Exception:
+        # 未完成的索引不切換 alias 也不保留，避免被計入保留的世代而刪除可回滾的舊索引
+        client.indices.delete(index=index_name)
+        print(f"重建失敗，已刪除未完成的索引 '{index_name}'，alias 仍指向 {previous_indices or '無'}")
+        raise
+
+    swap_alias(client, alias, index_name, previous_indices)
+    cleanup_generations(client, alias, keep)
+    return index_name
+
+
+def get_alias_targets(client: OpenSearch, alias: str) -> list[str]:
+    """回傳 alias 目前指向的索引；舊版以同名實體索引部署時回傳該索引"""
+    if client.indices.exists_alias(name=alias):
+        return sorted(client.indices.get_alias(name=alias))
+    if client.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def load_index(
+    client: OpenSearch,
+    index_name: str,
+    alias: str,
+    source: str,
+    profile: str = DOCUMENT_PROFILE,
+    assume_full: bool = False,
+) -> int:
+    """依 source 載入新索引，回傳載入的筆數"""
+    if source == "none":
+        return 0
+    if source == "reindex":
+        if not get_alias_targets(client, alias):
+            print(f"'{alias}' 不存在，建立空索引")
+            return 0
+        response = client.reindex(
+            body={"source": {"index": alias}, "dest": {"index": index_name}},
+            wait_for_completion=True,
+            request_timeout=3600,
+        )
+        failures = response.get("failures") or []
+        if failures or response.get("timed_out"):
+            raise RuntimeError(
+                f"reindex 未完成 (timed_out: {response.get('timed_out')}, 失敗 {len(failures)} 筆): {failures[:3]}"
+            )
+        return response.get("created", 0) + response.get("updated", 0)
+    if source.startswith("s3://"):
+        return load_from_s3(client, index_name, *parse_s3_source(source), profile, assume_full)
+    raise ValueError(f"Unsupported source: {source}")
+
+
+def check_reindex_mappings(client: OpenSearch, alias: str, mappings: dict) -> None:
+    """
+    reindex 只複製舊索引的 _source，確認新的 mapping 與舊索引相同 (同一 profile、同樣有無向量欄位)
+
+    profile 不同時文件結構不同 (例如 full 的 nested 欄位無法寫入 lean 的 keyword 欄位)；
+    新 mapping 多出的欄位 (例如開啟 embedding 後的 knn_vector) 在複製的文件中也不存在。
+    兩者皆須由 S3 的完整快照重新轉換後載入。
+
+    Raises:
+        ValueError: 新舊 mapping 的欄位型別不同
+    """
+    target = mappings.get("mappings", {}).get("properties", {})
+    for index_name, mapping in client.indices.get_mapping(index=alias).items():
+        source = mapping.get("mappings", {}).get("properties", {})
+        differences = [
+            name for name, field in target.items() if source.get(name, {}).get("type") != field.get("type")
+        ] + [name for name, field in source.items() if name not in target and field.get("type") in EXPLICIT_FIELD_TYPES]
+        if differences:
+            raise ValueError(
+                f"新的 mapping 與 '{index_name}' 的欄位 {sorted(differences)} 不同，無法以 reindex 複製；"
+                "請以 --source s3://bucket/parsed_<ts>/ (完整快照) 重建"
+            )
+
+
+def check_document_count(client: OpenSearch, index_name: str, alias: str) -> None:
+    """
+    reindex 後確認新索引的文件數與 alias 目前指向的索引相同
+
+    Raises:
+        RuntimeError: 文件數不同 (部分文件未複製，或重建期間舊索引仍有寫入)
+    """
+    expected = client.count(index=alias)["count"]
+    actual = client.count(index=index_name)["count"]
+    if actual != expected:
+        raise RuntimeError(
+            f"'{index_name}' 有 {actual} 筆，與 '{alias}' 的 {expected} 筆不同；"
+            "請確認重建期間沒有 data_process_layer 寫入後重新執行"
+        )
+
+
+def parse_s3_source(source: str) -> tuple[str, str]:
+    bucket, _, prefix = source.removeprefix("s3://").partition("/")
+    return bucket, prefix
+
+
+def check_full_snapshot(bucket: str, prefix: str, assume_full: bool = False) -> None:
+    """
+    確認 prefix 下的 chunk 為完整快照 (collection_layer 以 DELTA_MODE=false 或第一次執行的輸出)
+
+    增量輸出 (chunk-delta: true) 只含變動的論文，以其重建會遺失其餘論文並以不完整的計數取代彙總與作者表。
+    未標記的舊 chunk 只在 assume_full 時接受。
+
+    Raises:
+        DeltaChunkError: prefix 下沒有 chunk、為增量輸出，或無法確認為完整快照
+    """
+    s3 = boto3.client("s3")
+    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1)
+    if not response.get("Contents"):
+        raise DeltaChunkError(f"s3://{bucket}/{prefix} 下沒有 chunk")
+    key = response["Contents"][0]["Key"]
+    delta = s3.head_object(Bucket=bucket, Key=key).get("Metadata", {}).get("chunk-delta")
+    if delta == "false" or (delta is None and assume_full):
+        return
+    raise DeltaChunkError(
+        f"s3://{bucket}/{key} 不是完整快照 (chunk-delta: {delta})；"
+        "請以 DELTA_MODE=false 執行 collection_layer 產生完整的 parsed_ 輸出後再重建"
+        + ("" if delta else "，或確認為舊版的完整輸出後加上 --assume-full")
+    )
+
+
+def load_from_s3(
+    client: OpenSearch,
+    index_name: str,
+    bucket: str,
+    prefix: str,
+    profile: str = DOCUMENT_PROFILE,
+    assume_full: bool = False,
+) -> int:
+    """
+    逐一載入 prefix 下 collection_layer 輸出的 chunk (須為完整快照，增量輸出的 chunk 拋出 DeltaChunkError)
+
+    載入的文件即為完整的資料，載入完成後以其計數取代儀表板的彙總與作者表 (修正增量維護時漏記的變化)。
+    """
+    s3 = boto3.client("s3")
+    controller = BulkController()
+    postings = AuthorPostings()
+    total = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            body = s3.get_object(Bucket=bucket, Key=item["Key"])["Body"]
+            records = transform_metadata_batch(
+                iter_chunk_records(body, item["Key"], require_full=True, allow_unmarked=assume_full), profile
+            )
+            if AUTHOR_INDEX_ENABLED:
+                records = collect_authors(records, postings)
+            # 新索引為空，不需比對 content_hash
+            success, _ = bulk_index_documents(
+                index_name,
+                records,
+                client=client,
+                controller=controller,
+                skip_unchanged=False,
+                track_rollups=ROLLUPS_ENABLED,
+                embed=EMBEDDING_ENABLED,
+            )
+            total += success
+    if controller.rollups is not None:
+        compact_rollups(s3, ROLLUP_BUCKET or bucket, counts=controller.rollups)
+    if AUTHOR_INDEX_ENABLED:
+        from utils.author_table import compact_author_table
+
+        compact_author_table(s3, AUTHOR_BUCKET or bucket, replace=postings)
+    return total
+
+
+def swap_alias(client: OpenSearch, alias: str, index_name: str, previous_indices: list[str]) -> None:
+    """以單一請求將 alias 移至新索引；舊版的同名實體索引以 remove_index 於同一請求中刪除"""
+    actions = []
+    for previous in previous_indices:
+        if previous == alias:
+            actions.append({"remove_index": {"index": previous}})
+        else:
+            actions.append({"remove": {"index": previous, "alias": alias}})
+    actions.append({"add": {"index": index_name, "alias": alias}})
+    client.indices.update_aliases(body={"actions": actions})
+    print(f"alias '{alias}' 已指向 '{index_name}' (原為 {previous_indices or '無'})")
+
+
+def cleanup_generations(client: OpenSearch, alias: str, keep: int) -> list[str]:
+    """刪除較舊的世代，保留最新的 keep 個 (不刪除 alias 正在使用的索引)"""
+    in_use = set(get_alias_targets(client, alias))
+    generations = sorted(
+        (name for name in client.indices.get(index=f"{alias}-*") if name.removeprefix(f"{alias}-").isdigit()),
+        reverse=True,
+    )
+    stale = [name for name in generations[max(keep, 1) :] if name not in in_use]
+    for name in stale:
+        client.indices.delete(index=name)
+        print(f"已刪除舊世代索引 '{name}'")
+    return stale
+
+
+def get_papers_mappings(profile: str = DOCUMENT_PROFILE, embedding: bool = EMBEDDING_ENABLED) -> dict:
+    """回傳 profile 對應的索引 mapping (與 transform_metadata 的文件格式一致)，embedding 時加上向量欄位"""
+    if profile == "lean":
+        mappings = get_lean_papers_mappings()
+    elif profile == "full":
+        mappings = get_full_papers_mappings()
+    else:
+        raise ValueError(f"Unsupported document profile: {profile}")
+    if embedding:
+        mappings.setdefault("settings", {}).setdefault("index", {})["knn"] = True
+        mappings["mappings"]["properties"][VECTOR_FIELD] = get_vector_mapping(EMBEDDING_DIMENSION)
+    return mappings
+
+
+def get_full_papers_mappings() -> dict:
     return {
         "mappings": {
             "properties": {
@@ -104,11 +428,55 @@ def get_papers_mappings() -> dict:
                     "index": False,
                 },
                 "update_date_datetime": {"type": "date"},
-                # "latest_version_date": {"type": "date"},
+                # data_process_layer 寫入時附加，用於略過內容未變動的文件
+                "content_hash": {"type": "keyword", "index": False},
+                # 此文件計入的儀表板彙總 key，更新時用於扣除舊的計數 (見 utils.rollups)
+                "rollup_keys": {"type": "keyword", "index": False, "doc_values": False},
+                # 作者實體的 id (見 utils.authors)，查詢作者的論文時以 term 查詢，不需 nested 查詢
+                AUTHOR_IDS_FIELD: {"type": "long"},
             }
         }
     }
 
 
+def get_lean_papers_mappings() -> dict:
+    """
+    lean 格式的 mapping: 沒有 nested 欄位 (每篇論文只有一個 Lucene 文件)，只用於顯示的欄位不建立索引
+
+    以 best_compression 壓縮 stored fields (_source)，以少量的讀取成本換取較小的索引。
+    """
+    text_with_keyword = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+    stored_only = {"type": "keyword", "index": False, "doc_values": False}
+    return {
+        "settings": {"index": {"codec": "best_compression"}},
+        "mappings": {
+            "properties": {
+                "id": {"type": "keyword"},
+                "submitter": text_with_keyword,
+                "title": {"type": "text"},
+                "authors": text_with_keyword,
+                "affiliations": {"type": "keyword"},
+                "comments": {"type": "text"},
+                "journal-ref": {"type": "text"},
+                "doi": {"type": "keyword"},
+                "report-no": {"type": "keyword"},
+                "categories": {"type": "keyword"},
+                "category_groups": {"type": "keyword"},
+                "license": {"type": "keyword"},
+                "abstract": {"type": "text"},
+                "version_count": {"type": "integer"},
+                # transform 產出的時間為 UTC 秒數
+                "first_version_date": {"type": "date", "format": "epoch_second"},
+                "latest_version_date": {"type": "date", "format": "epoch_second"},
+                "update_date": stored_only,
+                "update_date_datetime": {"type": "date"},
+                "content_hash": stored_only,
+                "rollup_keys": stored_only,
+                AUTHOR_IDS_FIELD: {"type": "long"},
+            }
+        },
+    }
+
+
 if __name__ == "__main__":
     main()
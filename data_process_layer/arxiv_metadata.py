@@ -1,38 +1,245 @@
 import json
+import os
+import time
 import urllib.parse
+from collections import Counter
+from collections.abc import Iterator
+from functools import lru_cache
+from typing import TYPE_CHECKING, NamedTuple
 
-import boto3
-from utils.index_to_db import bulk_index_documents
-from utils.transform_metadata import transform_metadata
+from utils.authors import AUTHOR_BUCKET, AUTHOR_INDEX_ENABLED, AuthorPostings, collect_authors, write_author_delta
+from utils.chunk_format import iter_chunk_records
+from utils.metrics import Metrics
+from utils.rollups import ROLLUP_BUCKET, ROLLUPS_ENABLED, compact_rollups, write_rollup_delta
+from utils.transform_metadata import EMBEDDING_ENABLED, transform_metadata_batch
+
+# boto3 / opensearchpy / requests_aws4auth 的 import 佔冷啟動大半時間，只在實際需要時才載入
+if TYPE_CHECKING:
+    from opensearchpy import OpenSearch
+    from utils.index_to_db import BulkController
+
+# 重試後仍索引失敗的文件寫入 s3://{bucket}/{FAILURE_PREFIX}/{chunk key}.ndjson，供之後重播
+FAILURE_PREFIX = os.getenv("FAILURE_PREFIX", "failures")
+# 寫入 alias 而非實體索引，create_index_with_mapping 重建時切換 alias 即可，不需更新此設定
+INDEX_ALIAS = os.getenv("INDEX_ALIAS", "arxiv-papers")
+
+
+class ChunkRef(NamedTuple):
+    """事件中的一個 chunk；message_id 為 SQS 訊息 id (直接由 S3 觸發時為 None)"""
+
+    message_id: str | None
+    bucket: str
+    key: str
 
 
 def lambda_handler(event, context):
     print("START EVENT", event)
 
-    bucket = event["Records"][0]["s3"]["bucket"]["name"]
-    key = urllib.parse.unquote_plus(event["Records"][0]["s3"]["object"]["key"], encoding="utf-8")
-    print("bucket: " + bucket)
-    print("key: " + key)
+    if event.get("rollups") == "compact":
+        # 排程觸發: 將各次執行寫入的彙總變化併入儀表板用的表格
+        return {"status": "success", "rollups": compact_rollups(get_s3_client(), event.get("bucket", ROLLUP_BUCKET))}
+    if event.get("authors") == "compact":
+        # 排程觸發: 將各次執行寫入的作者清單併入作者表 (需要 numpy，只在此時載入)
+        from utils.author_table import compact_author_table
 
+        return {
+            "status": "success",
+            "authors": compact_author_table(get_s3_client(), event.get("bucket", AUTHOR_BUCKET)),
+        }
+
+    chunks = parse_event(event)
+    if not chunks:
+        # 例如 S3 設定通知時的 s3:TestEvent: 不需要建立 S3 / OpenSearch client
+        print("事件中沒有 chunk，略過")
+        return {"batchItemFailures": []} if event.get("Records") else {"status": "skip"}
+    print(f"本次處理 {len(chunks)} 個 chunk: {[chunk.key for chunk in chunks]}")
+
+    metrics = Metrics("data_process")
+    metrics.set_property("s3_keys", [chunk.key for chunk in chunks])
+    metrics.put("chunks", len(chunks))
     try:
-        s3 = boto3.client("s3")
-        response = s3.get_object(Bucket=bucket, Key=key)
-        metadata_list = json.loads(response["Body"].read().decode("utf-8"))
+        failed_keys = index_chunks(chunks, metrics)
+    finally:
+        metrics.flush()
+
+    if any(chunk.message_id for chunk in chunks):
+        # SQS: 只回報失敗的訊息，其餘訊息由 Lambda 刪除，不會整批重送
+        failed_messages = dict.fromkeys(chunk.message_id for chunk in chunks if chunk.key in failed_keys)
+        return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_messages]}
+    if failed_keys:
+        return {"status": "partial", "failed_keys": sorted(failed_keys)}
+    return {"status": "success"}
+
+
+def parse_event(event: dict) -> list[ChunkRef]:
+    """
+    取出事件中所有的 chunk，支援 S3 事件與 SQS 事件 (訊息內容為 S3 事件通知)
+
+    S3 設定通知時送出的 s3:TestEvent 不含 Records，會被略過。
+    """
+    chunks = []
+    for record in event.get("Records", []):
+        if record.get("eventSource") == "aws:sqs":
+            notification = json.loads(record["body"])
+            s3_records = notification.get("Records", [])
+            message_id = record["messageId"]
+        else:
+            s3_records = [record]
+            message_id = None
+        for s3_record in s3_records:
+            bucket = s3_record["s3"]["bucket"]["name"]
+            key = urllib.parse.unquote_plus(s3_record["s3"]["object"]["key"], encoding="utf-8")
+            chunks.append(ChunkRef(message_id, bucket, key))
+    return chunks
+
+
+def index_chunks(
+    chunks: list[ChunkRef],
+    metrics: Metrics,
+    client: "OpenSearch | None" = None,
+    controller: "BulkController | None" = None,
+) -> set[str]:
+    """
+    以同一個 client 與 bulk 流程索引多個 chunk，回傳需要重試的 chunk key
+
+    各 chunk 的文件串接成單一串流，bulk request 可跨 chunk 湊滿，batch 大小與並行數的調整也延續整批；
+    讀取失敗或有文件索引失敗的 chunk 視為失敗 (重送時未變動的文件只有 mget 的成本)。
+    """
+    from utils.index_to_db import BulkController, bulk_index_documents
+
+    failed_keys: set[str] = set()
+    # 用於將索引失敗的文件對應回所屬的 chunk
+    document_chunks: dict[str, ChunkRef] = {}
+    # 寫入的論文的作者清單 (AUTHOR_INDEX_ENABLED 時)，索引後寫入 delta 供彙整作者表
+    postings = AuthorPostings()
+
+    def iter_documents() -> Iterator[dict]:
+        for chunk in chunks:
+            try:
+                for doc in transform_metadata_batch(read_chunk(chunk.bucket, chunk.key, metrics)):
+                    document_chunks[doc["id"]] = chunk
+                    yield doc
+            except Exception as e:
+                # 單一 chunk 讀取失敗不影響同一批的其他 chunk
+                print(f"Error getting object {chunk.key} from bucket {chunk.bucket}: {e}")
+                failed_keys.add(chunk.key)
+
+    def write_failures(failures: list[dict]) -> None:
+        grouped: dict[ChunkRef, list[dict]] = {}
+        for failure in failures:
+            grouped.setdefault(document_chunks[failure["_id"]], []).append(failure)
+        for chunk, chunk_failures in grouped.items():
+            write_failure_file(chunk.bucket, chunk.key, chunk_failures)
+            failed_keys.add(chunk.key)
+        postings.discard(failure["_id"] for failure in failures)
+
+    # 讀取、轉換與索引以 generator 串接，記憶體用量與 chunk 大小無關；
+    # 各階段的耗時由 metrics 分開計算 (bulk 不含讀取與轉換的時間)
+    st = time.time()
+    controller = controller or BulkController()
+    with metrics.stage("bulk") as stage:
+        success, failed = bulk_index_documents(
+            INDEX_ALIAS,
+            add_derived_fields(metrics.timed_iter("transform", iter_documents()), postings),
+            client=client,
+            controller=controller,
+            failure_sink=write_failures,
+            track_rollups=ROLLUPS_ENABLED,
+            embed=EMBEDDING_ENABLED,
+        )
+        stage.records = success
+    write_deltas(chunks, controller, postings)
+    for latency in controller.latencies:
+        metrics.observe("bulk_latency", latency)
+    metrics.put("bulk_requests", controller.requests)
+    metrics.put("bulk_throttled", controller.throttled)
+    metrics.put("index_unchanged", controller.unchanged)
+    metrics.put("index_stale", controller.stale)
+    if EMBEDDING_ENABLED:
+        metrics.put("index_embedded", controller.embedded)
+        metrics.put("embed_seconds", round(controller.embed_seconds, 3))
+    metrics.put("index_failed", failed)
+    metrics.put("chunks_failed", len(failed_keys))
+
+    elapsed = max(time.time() - st, 1e-9)
+    print(
+        f"成功索引 {success} 條記錄，失敗 {failed} 條記錄，失敗的 chunk {len(failed_keys)} 個，"
+        f"花費 {elapsed:.2f} 秒 ({success / elapsed:.0f} docs/s)"
+    )
+    return failed_keys
+
+
+def add_derived_fields(documents: Iterator[dict], postings: AuthorPostings) -> Iterator[dict]:
+    """
+    轉換後的選用階段: AUTHOR_INDEX_ENABLED 時記錄作者清單至 postings
+
+    向量 (EMBEDDING_ENABLED) 由 bulk 在略過未變動的文件後才計算，不在此加上。
+    """
+    if AUTHOR_INDEX_ENABLED:
+        documents = collect_authors(documents, postings)
+    return documents
+
+
+def read_chunk(bucket: str, key: str, metrics: Metrics) -> Iterator[dict]:
+    """下載並逐筆讀取 chunk，新格式 (.ndjson.gz) 邊解壓邊解析，舊格式 (.json 陣列) 仍可讀取"""
+    with metrics.stage("download") as stage:
+        response = get_s3_client().get_object(Bucket=bucket, Key=key)
+        stage.bytes = response.get("ContentLength")
+    yield from metrics.timed_iter("read", iter_chunk_records(response["Body"], key))
+
+
+def write_deltas(chunks: list[ChunkRef], controller: "BulkController", postings: AuthorPostings) -> None:
+    """寫入本次索引造成的彙總變化與寫入的論文的作者清單"""
+    if controller.rollups:
+        write_rollups(chunks, controller.rollups)
+    if postings:
+        write_author_postings(chunks, postings)
+
+
+def write_rollups(chunks: list[ChunkRef], delta: Counter) -> None:
+    """
+    寫入本次索引造成的彙總變化
+
+    文件已寫入索引，失敗時不讓整批重送 (重送時文件未變動，也不會再產生變化)，
+    漏記的變化於重建彙總時修正。
+    """
+    try:
+        write_rollup_delta(get_s3_client(), ROLLUP_BUCKET or chunks[0].bucket, delta, [chunk.key for chunk in chunks])
     except Exception as e:
-        print(e)
-        print(
-            f"Error getting object {key} from bucket {bucket}. Make sure they exist and your bucket is in the same region as this function."
+        print(f"彙總變化寫入失敗: {e}")
+
+
+def write_author_postings(chunks: list[ChunkRef], postings: AuthorPostings) -> None:
+    """寫入本次索引的論文的作者清單 (失敗時與 write_rollups 相同只記錄，於重建作者表時修正)"""
+    try:
+        write_author_delta(
+            get_s3_client(), AUTHOR_BUCKET or chunks[0].bucket, postings, [chunk.key for chunk in chunks]
         )
-        raise e
+    except Exception as e:
+        print(f"作者清單寫入失敗: {e}")
 
-    # print(f"來源內容{metadata_list}")
 
-    transformed_records = [transform_metadata(metadata) for metadata in metadata_list]
-    # print(f"轉換後內容{transformed_records}")
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """同一個執行環境共用 S3 client"""
+    import boto3
 
-    success, failed = bulk_index_documents("arxiv-papers", transformed_records)
-    print(f"成功索引 {success} 條記錄，失敗 {failed} 條記錄")
-    return {"status": "success"}
+    return boto3.client("s3")
+
+
+def write_failure_file(bucket: str, key: str, failures: list[dict]) -> str:
+    """將索引失敗的文件 (含原始 action 與 source) 以 NDJSON 寫入 S3"""
+    failure_key = f"{FAILURE_PREFIX}/{key}.ndjson"
+    body = "".join(json.dumps(failure, ensure_ascii=False) + "\n" for failure in failures)
+    get_s3_client().put_object(
+        Bucket=bucket,
+        Key=failure_key,
+        Body=body.encode("utf-8"),
+        ContentType="application/x-ndjson",
+        ServerSideEncryption="AES256",
+    )
+    print(f"{len(failures)} 筆索引失敗的文件已寫入 s3://{bucket}/{failure_key}")
+    return failure_key
 
 
 ##### 地端測試用
@@ -60,7 +267,7 @@ def mock_event():
                         "arn": "arn:aws:s3:::arxiv-dateset",
                     },
                     "object": {
-                        "key": "parsed_1755993077850/metadata-1000.json",
+                        "key": "parsed_1755993077850/metadata-000-00001.ndjson.gz",
                         "size": 1024,
                         "eTag": "0123456789abcdef0123456789abcdef",
                         "sequencer": "0A1B2C3D4E5F678901",
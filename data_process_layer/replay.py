@@ -0,0 +1,202 @@
+"""
+重播 / 回填: 以多個行程將 S3 上的 chunk 或索引失敗的紀錄寫入索引
+
+    python replay.py s3://arxiv-dataset/parsed_1755993077850/ --workers 4 --rate 3000
+    python replay.py s3://arxiv-dataset/failures/parsed_1755993077850/
+
+parsed_ chunk 與 S3 事件觸發的 Lambda 使用相同的讀取、轉換與 bulk 流程 (index_chunks)；
+failures/ 下的失敗紀錄已是轉換後的文件，直接重新送出，全部成功後刪除該檔案，否則以剩餘的失敗覆寫。
+已完成的物件記錄於 checkpoint 檔，中斷後以相同參數再次執行會略過已完成的物件。
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from arxiv_metadata import FAILURE_PREFIX, INDEX_ALIAS, ChunkRef, get_s3_client, index_chunks, write_deltas
+from utils.authors import AUTHOR_INDEX_ENABLED, AuthorPostings, collect_authors
+from utils.index_to_db import BulkController, bulk_index_documents
+from utils.metrics import Metrics
+from utils.opensearch_client import get_open_search_client
+from utils.rollups import ROLLUPS_ENABLED
+from utils.transform_metadata import EMBEDDING_ENABLED
+
+REPLAY_SUFFIXES = (".ndjson.gz", ".ndjson", ".json")
+SUMMARY_FIELDS = ("indexed", "failed", "unchanged", "stale")
+
+
+def list_replay_keys(bucket: str, prefix: str) -> list[str]:
+    """列出 prefix 下的 chunk (.ndjson.gz / 舊格式 .json) 或失敗紀錄 (.ndjson)，依 key 排序"""
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    return sorted(
+        item["Key"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for item in page.get("Contents", [])
+        if item["Key"].endswith(REPLAY_SUFFIXES)
+    )
+
+
+def is_failure_file(key: str) -> bool:
+    return key.startswith(f"{FAILURE_PREFIX}/")
+
+
+def reset_clients() -> None:
+    """子行程不沿用父行程的連線 (列出物件時已建立 S3 client)"""
+    get_s3_client.cache_clear()
+    get_open_search_client.cache_clear()
+
+
+def replay_object(bucket: str, key: str, max_rate: float | None = None) -> dict:
+    """
+    重播單一物件
+
+    Returns:
+        dict: key、是否成功與成功 / 失敗 / 未變動 / 版本較舊的筆數
+    """
+    controller = BulkController(max_rate=max_rate)
+    metrics = Metrics("replay")
+    if is_failure_file(key):
+        ok = replay_failure_file(bucket, key, metrics, controller)
+    else:
+        ok = not index_chunks([ChunkRef(None, bucket, key)], metrics, controller=controller)
+    return {
+        "key": key,
+        "ok": ok,
+        "indexed": int(metrics.value("bulk_records")),
+        "failed": int(metrics.value("index_failed")),
+        "unchanged": controller.unchanged,
+        "stale": controller.stale,
+    }
+
+
+def replay_failure_file(bucket: str, key: str, metrics: Metrics, controller: BulkController) -> bool:
+    """重新送出失敗紀錄中的文件，回傳是否全部成功 (成功時刪除失敗紀錄)"""
+    s3 = get_s3_client()
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    documents = (json.loads(line)["_source"] for line in body.iter_lines() if line.strip())
+    postings = AuthorPostings()
+    if AUTHOR_INDEX_ENABLED:
+        documents = collect_authors(documents, postings)
+    remaining: list[dict] = []
+    with metrics.stage("bulk") as stage:
+        success, failed = bulk_index_documents(
+            INDEX_ALIAS,
+            documents,
+            controller=controller,
+            failure_sink=remaining.extend,
+            track_rollups=ROLLUPS_ENABLED,
+            embed=EMBEDDING_ENABLED,
+        )
+        stage.records = success
+    metrics.put("index_failed", failed)
+    postings.discard(failure["_id"] for failure in remaining)
+    write_deltas([ChunkRef(None, bucket, key)], controller, postings)
+
+    if not remaining:
+        s3.delete_object(Bucket=bucket, Key=key)
+        return True
+    body = "".join(json.dumps(failure, ensure_ascii=False) + "\n" for failure in remaining)
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body.encode("utf-8"),
+        ContentType="application/x-ndjson",
+        ServerSideEncryption="AES256",
+    )
+    return False
+
+
+def load_checkpoint(path: str, source: str) -> dict:
+    if not os.path.exists(path):
+        return {"source": source, "done": {}}
+    with open(path, encoding="utf-8") as file:
+        checkpoint = json.load(file)
+    if checkpoint["source"] != source:
+        raise ValueError(f"checkpoint {path} 屬於 {checkpoint['source']}，與 {source} 不同")
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    """先寫入暫存檔再取代，中斷時不會留下不完整的 checkpoint"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+def replay(
+    source: str,
+    workers: int = 1,
+    rate: float | None = None,
+    checkpoint_path: str | None = None,
+    executor_factory=ProcessPoolExecutor,
+) -> dict:
+    """
+    重播 source (s3://bucket/prefix) 下所有尚未完成的物件
+
+    Args:
+        workers (int): 同時處理的物件數 (行程數)；每個行程各自以 BulkController 調整 batch 與並行數
+        rate (float | None): 所有行程合計每秒送出的文件數上限
+        checkpoint_path (str | None): 記錄已完成物件的檔案，None 時不記錄
+
+    Returns:
+        dict: 各項筆數的合計與失敗的物件
+    """
+    bucket, _, prefix = source.removeprefix("s3://").partition("/")
+    checkpoint = load_checkpoint(checkpoint_path, source) if checkpoint_path else {"source": source, "done": {}}
+    keys = [key for key in list_replay_keys(bucket, prefix) if key not in checkpoint["done"]]
+    print(f"{source}: 待處理 {len(keys)} 個物件 (已完成 {len(checkpoint['done'])} 個)")
+
+    totals: Counter = Counter()
+    failed_keys = []
+    st = time.time()
+    max_rate = rate / workers if rate else None
+    with executor_factory(max_workers=workers, initializer=reset_clients) as executor:
+        futures = [executor.submit(replay_object, bucket, key, max_rate) for key in keys]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            totals.update({field: result[field] for field in SUMMARY_FIELDS})
+            if result["ok"]:
+                checkpoint["done"][result["key"]] = {field: result[field] for field in SUMMARY_FIELDS}
+                if checkpoint_path:
+                    save_checkpoint(checkpoint_path, checkpoint)
+            else:
+                failed_keys.append(result["key"])
+            elapsed = max(time.time() - st, 1e-9)
+            print(
+                f"[{completed}/{len(keys)}] {result['key']}: 成功 {result['indexed']} 筆, 失敗 {result['failed']} 筆 "
+                f"(累計 {totals['indexed']} 筆, {totals['indexed'] / elapsed:.0f} docs/s)"
+            )
+
+    summary = {
+        **{field: totals[field] for field in SUMMARY_FIELDS},
+        "objects": len(keys),
+        "failed_objects": failed_keys,
+    }
+    print(f"重播完成，花費 {time.time() - st:.2f} 秒: {json.dumps(summary, ensure_ascii=False)}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重播 parsed_ chunk 或索引失敗的紀錄")
+    parser.add_argument("source", help="s3://bucket/parsed_<ts>/ 或 s3://bucket/failures/...")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="同時處理的物件數")
+    parser.add_argument("--rate", type=float, help="每秒送出的文件數上限 (所有行程合計)")
+    parser.add_argument("--checkpoint", help="checkpoint 檔案路徑，預設依 source 命名於目前目錄")
+    parser.add_argument("--no-checkpoint", action="store_true", help="不記錄進度 (每次重新處理所有物件)")
+    args = parser.parse_args()
+
+    checkpoint_path = None
+    if not args.no_checkpoint:
+        checkpoint_path = args.checkpoint or "replay-{}.json".format(
+            args.source.removeprefix("s3://").strip("/").replace("/", "_")
+        )
+    summary = replay(args.source, args.workers, args.rate, checkpoint_path)
+    raise SystemExit(1 if summary["failed_objects"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+作者實體表的彙整與讀取 (需要 numpy，只在彙整與查詢時載入)
+
+{prefix}/state.npz 保存每篇論文的作者清單 (依論文 id 排序的 CSR) 與作者的顯示名稱；
+彙整時將 delta 併入 state，再反轉為以作者為單位的表格，每個陣列各自存為 {prefix}/table/{name}.npy：
+
+    author_ids                     依大小排序的作者 id (int64)，以 searchsorted 取得作者的位置 i
+    names / name_offsets           顯示名稱 (UTF-8)，第 i 位作者為 names[name_offsets[i]:name_offsets[i + 1]]
+    papers / paper_offsets         作者的論文 (paper_ids 中的位置)
+    paper_ids                      依字典序排序的論文 id
+    coauthors / coauthor_counts / coauthor_offsets
+                                   共同作者的位置與合著篇數 (依篇數由多到少)
+
+.npy 可直接以 np.load(mmap_mode="r") 讀取，查詢時只讀入用到的部分 (AuthorTable)。
+"""
+
+import io
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils.authors import AUTHOR_PREFIX, MAX_COAUTHORS, AuthorPostings, author_id
+from utils.rollups import get_gzip_json
+
+TABLE_ARRAYS = (
+    "author_ids",
+    "names",
+    "name_offsets",
+    "papers",
+    "paper_offsets",
+    "paper_ids",
+    "coauthors",
+    "coauthor_counts",
+    "coauthor_offsets",
+)
+STATE_ARRAYS = ("paper_ids", "versions", "offsets", "authors", "name_ids", "names", "name_offsets", "applied")
+
+
+def csr_offsets(lengths: np.ndarray) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def take_rows(values: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """依 rows 的順序取出 CSR 中的列，回傳新的 values 與 offsets"""
+    starts = offsets[rows]
+    new_offsets = csr_offsets(offsets[rows + 1] - starts)
+    index = np.repeat(starts - new_offsets[:-1], np.diff(new_offsets)) + np.arange(new_offsets[-1])
+    return values[index], new_offsets
+
+
+def search_sorted(sorted_values: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """values 在已排序陣列中的位置與是否存在 (不存在時位置為 0)"""
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    position = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    found = sorted_values[position] == values
+    return np.where(found, position, 0), found
+
+
+def pack_strings(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, csr_offsets(np.array([len(value) for value in encoded], dtype=np.int64))
+
+
+def empty_state() -> dict[str, np.ndarray]:
+    return {
+        "paper_ids": np.array([], dtype="S1"),
+        "versions": np.array([], dtype=np.int64),
+        "offsets": np.zeros(1, dtype=np.int64),
+        "authors": np.array([], dtype=np.int64),
+        "name_ids": np.array([], dtype=np.int64),
+        "names": np.array([], dtype=np.uint8),
+        "name_offsets": np.zeros(1, dtype=np.int64),
+        "applied": np.array([], dtype="S1"),
+    }
+
+
+def merge_postings(state: dict[str, np.ndarray], postings: AuthorPostings) -> dict[str, np.ndarray]:
+    """
+    將 postings 併入 state: 論文的作者清單整份取代 (版本較舊時保留 state 中的清單)，作者名稱以 postings 為準
+
+    Returns:
+        dict[str, np.ndarray]: 新的 state (論文依 id、作者名稱依 id 排序)
+    """
+    paper_ids = np.array([paper_id.encode() for paper_id in postings.papers], dtype="S")
+    versions = np.array([version for version, _ in postings.papers.values()], dtype=np.int64)
+    lengths = np.array([len(ids) for _, ids in postings.papers.values()], dtype=np.int64)
+    authors = np.array([author for _, ids in postings.papers.values() for author in ids], dtype=np.int64)
+
+    # 已在 state 中的論文: 版本不比 state 舊時取代
+    position, found = search_sorted(state["paper_ids"], paper_ids)
+    newer = ~found
+    newer[found] = versions[found] >= state["versions"][position[found]]
+    keep = np.ones(len(state["paper_ids"]), dtype=bool)
+    keep[position[found & newer]] = False
+    kept_rows = np.flatnonzero(keep)
+    kept_authors, kept_offsets = take_rows(state["authors"], state["offsets"], kept_rows)
+    new_authors, new_offsets = take_rows(authors, csr_offsets(lengths), np.flatnonzero(newer))
+
+    merged_ids = np.concatenate([state["paper_ids"][kept_rows], paper_ids[newer]])
+    merged_versions = np.concatenate([state["versions"][kept_rows], versions[newer]])
+    merged_authors = np.concatenate([kept_authors, new_authors])
+    merged_offsets = np.concatenate([kept_offsets, new_offsets[1:] + kept_offsets[-1]])
+    order = np.argsort(merged_ids, kind="stable")
+    sorted_authors, sorted_offsets = take_rows(merged_authors, merged_offsets, order)
+
+    # 作者名稱: state 中未出現在 postings 的保留，其餘以 postings 的名稱取代
+    name_ids = np.array(list(postings.names), dtype=np.int64)
+    names, name_offsets = pack_strings(list(postings.names.values()))
+    kept_names = np.flatnonzero(~np.isin(state["name_ids"], name_ids))
+    old_names, old_offsets = take_rows(state["names"], state["name_offsets"], kept_names)
+    all_name_ids = np.concatenate([state["name_ids"][kept_names], name_ids])
+    all_names = np.concatenate([old_names, names])
+    all_offsets = np.concatenate([old_offsets, name_offsets[1:] + old_offsets[-1]])
+    name_order = np.argsort(all_name_ids, kind="stable")
+    sorted_names, sorted_name_offsets = take_rows(all_names, all_offsets, name_order)
+
+    return {
+        "paper_ids": merged_ids[order],
+        "versions": merged_versions[order],
+        "offsets": sorted_offsets,
+        "authors": sorted_authors,
+        "name_ids": all_name_ids[name_order],
+        "names": sorted_names,
+        "name_offsets": sorted_name_offsets,
+        "applied": state["applied"],
+    }
+
+
+def coauthor_pairs(authors: np.ndarray, offsets: np.ndarray, author_count: int) -> np.ndarray:
+    """
+    每篇論文中兩兩作者的 (作者, 共同作者) 位置，以 作者 * 作者數 + 共同作者 表示
+
+    authors 為依論文排序 (offsets 為各論文的範圍)、論文內不重複的作者位置；作者數相同的論文一起以陣列運算展開。
+    """
+    lengths = np.diff(offsets)
+    pairs = [np.array([], dtype=np.int64)]
+    for size in np.unique(lengths[(lengths >= 2) & (lengths <= MAX_COAUTHORS)]):
+        papers = np.flatnonzero(lengths == size)
+        matrix = authors[offsets[papers][:, None] + np.arange(size)]
+        other = ~np.eye(size, dtype=bool)
+        source = np.broadcast_to(matrix[:, :, None], (len(papers), size, size))[:, other]
+        target = np.broadcast_to(matrix[:, None, :], (len(papers), size, size))[:, other]
+        pairs.append(source.ravel() * author_count + target.ravel())
+    return np.concatenate(pairs)
+
+
+def build_table(state: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """將以論文為單位的 state 反轉為以作者為單位的表格 (各陣列的內容見模組說明)"""
+    paper_count = len(state["paper_ids"])
+    rows = np.repeat(np.arange(paper_count, dtype=np.int64), np.diff(state["offsets"]))
+    author_ids, positions = np.unique(state["authors"], return_inverse=True)
+    author_count = len(author_ids)
+
+    # 依論文排序的 (論文, 作者) 與依作者排序的 (作者, 論文)，皆去除重複
+    by_paper = np.unique(rows * max(author_count, 1) + positions)
+    paper_rows, paper_authors = np.divmod(by_paper, max(author_count, 1))
+    by_author = np.unique(positions * max(paper_count, 1) + rows)
+    posting_authors, postings = np.divmod(by_author, max(paper_count, 1))
+
+    pairs, counts = np.unique(
+        coauthor_pairs(paper_authors, csr_offsets(np.bincount(paper_rows, minlength=paper_count)), author_count),
+        return_counts=True,
+    )
+    sources, targets = np.divmod(pairs, max(author_count, 1))
+    order = np.lexsort((-counts, sources))
+
+    # 作者名稱依 author_ids 的順序排列，沒有名稱的作者為空字串
+    position, has_name = search_sorted(state["name_ids"], author_ids)
+    name_rows = np.where(has_name, position, len(state["name_ids"]))
+    padded_offsets = np.append(state["name_offsets"], state["name_offsets"][-1])
+    names, name_offsets = take_rows(state["names"], padded_offsets, name_rows)
+
+    return {
+        "author_ids": author_ids,
+        "names": names,
+        "name_offsets": name_offsets,
+        "papers": postings.astype(np.int32),
+        "paper_offsets": csr_offsets(np.bincount(posting_authors, minlength=author_count)),
+        "paper_ids": state["paper_ids"],
+        "coauthors": targets[order].astype(np.int32),
+        "coauthor_counts": counts[order].astype(np.int32),
+        "coauthor_offsets": csr_offsets(np.bincount(sources, minlength=author_count)),
+    }
+
+
+def load_state(s3, bucket: str, prefix: str = AUTHOR_PREFIX) -> dict[str, np.ndarray]:
+    try:
+        body = s3.get_object(Bucket=bucket, Key=f"{prefix}/state.npz")["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return empty_state()
+    with np.load(io.BytesIO(body)) as data:
+        return {name: data[name] for name in STATE_ARRAYS}
+
+
+def put_buffer(s3, bucket: str, key: str, buffer: io.BytesIO) -> None:
+    s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue(), ServerSideEncryption="AES256")
+
+
+def compact_author_table(s3, bucket: str, prefix: str = AUTHOR_PREFIX, replace: AuthorPostings | None = None) -> dict:
+    """
+    將累積的 delta 併入 state，並輸出作者表至 {prefix}/table/
+
+    與 compact_rollups 相同: state 中記錄已套用的 delta，刪除 delta 前中斷時不會重複套用；應只有單一執行者呼叫。
+
+    Args:
+        replace (AuthorPostings | None): 提供時取代整個 state (例如由完整快照重建索引時)，既有的 delta 視為已包含在內
+    """
+    delta_keys = [
+        item["Key"]
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=f"{prefix}/deltas/")
+        for item in page.get("Contents", [])
+    ]
+    if replace is not None:
+        state = merge_postings(empty_state(), replace)
+    else:
+        state = load_state(s3, bucket, prefix)
+        applied = {key.decode() for key in state["applied"]}
+        postings = AuthorPostings()
+        for delta_key in delta_keys:
+            if delta_key not in applied:
+                postings.update(get_gzip_json(s3, bucket, delta_key))
+        state = merge_postings(state, postings)
+    state["applied"] = np.array([key.encode() for key in delta_keys], dtype="S")
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **state)
+    put_buffer(s3, bucket, f"{prefix}/state.npz", buffer)
+    table = build_table(state)
+    for name, array in table.items():
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        put_buffer(s3, bucket, f"{prefix}/table/{name}.npy", buffer)
+    for start in range(0, len(delta_keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in delta_keys[start : start + 1000]]})
+    stats = {
+        "deltas": len(delta_keys),
+        "papers": len(table["paper_ids"]),
+        "authors": len(table["author_ids"]),
+        "coauthor_pairs": len(table["coauthors"]),
+    }
+    print(f"作者表已更新: {stats}")
+    return stats
+
+
+def download_author_table(s3, bucket: str, directory: str, prefix: str = AUTHOR_PREFIX) -> Path:
+    """下載作者表至本機目錄 (供 AuthorTable 以 memory map 讀取)"""
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    for name in TABLE_ARRAYS:
+        s3.download_file(bucket, f"{prefix}/table/{name}.npy", str(path / f"{name}.npy"))
+    return path
+
+
+class AuthorTable:
+    """以 memory map 讀取作者表，依作者 id 或姓名直接取得論文與共同作者"""
+
+    def __init__(self, directory: str | os.PathLike):
+        self.arrays = {name: np.load(Path(directory) / f"{name}.npy", mmap_mode="r") for name in TABLE_ARRAYS}
+
+    def __len__(self) -> int:
+        return len(self.arrays["author_ids"])
+
+    def position(self, author: int) -> int | None:
+        author_ids = self.arrays["author_ids"]
+        position = int(np.searchsorted(author_ids, author))
+        return position if position < len(author_ids) and author_ids[position] == author else None
+
+    def _segment(self, values: str, offsets: str, position: int) -> np.ndarray:
+        start, end = self.arrays[offsets][position : position + 2]
+        return self.arrays[values][start:end]
+
+    def name(self, position: int) -> str:
+        return self._segment("names", "name_offsets", position).tobytes().decode("utf-8")
+
+    def get(self, author: int, max_coauthors: int = 20) -> dict | None:
+        """
+        回傳作者的名稱、論文 id 與合著篇數最多的共同作者
+
+        Returns:
+            dict | None: {"id", "name", "papers", "coauthors": [{"id", "name", "papers"}...]}，不存在時為 None
+        """
+        position = self.position(author)
+        if position is None:
+            return None
+        paper_ids = self.arrays["paper_ids"]
+        papers = [paper_ids[row].decode() for row in self._segment("papers", "paper_offsets", position)]
+        coauthors = self._segment("coauthors", "coauthor_offsets", position)[:max_coauthors]
+        counts = self._segment("coauthor_counts", "coauthor_offsets", position)[:max_coauthors]
+        return {
+            "id": author,
+            "name": self.name(position),
+            "papers": papers,
+            "coauthors": [
+                {"id": int(self.arrays["author_ids"][other]), "name": self.name(other), "papers": int(count)}
+                for other, count in zip(coauthors, counts, strict=True)
+            ],
+        }
+
+    def find(self, keyname: str, firstname: str = "", max_coauthors: int = 20) -> dict | None:
+        """以姓名查詢 (與 authors_parsed 的 [姓, 名] 相同的正規化)"""
+        return self.get(author_id(keyname, firstname), max_coauthors)
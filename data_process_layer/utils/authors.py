@@ -0,0 +1,122 @@
+import hashlib
+import os
+import re
+import time
+import unicodedata
+import uuid
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+from utils.rollups import put_gzip_json
+
+load_dotenv()
+
+# 作者實體表: 每篇論文以 author_ids 引用作者，作者的論文清單與共同作者計數由各次索引寫入的 delta 彙整
+# (見 utils.author_table)，查詢某位作者的論文只需對 author_ids 的 term 查詢，不需 nested 查詢
+AUTHOR_INDEX_ENABLED = os.getenv("AUTHOR_INDEX_ENABLED", "false").lower() == "true"
+# 作者表寫入 s3://{AUTHOR_BUCKET}/{AUTHOR_PREFIX}/，未設定時寫入 chunk 所在的 bucket
+AUTHOR_BUCKET = os.getenv("AUTHOR_BUCKET") or os.getenv("S3_BUCKET_NAME")
+AUTHOR_PREFIX = os.getenv("AUTHOR_PREFIX", "authors")
+# 作者數超過此值的論文 (大型合作計畫) 不計入共同作者
+MAX_COAUTHORS = int(os.getenv("MAX_COAUTHORS", 50))
+
+AUTHOR_IDS_FIELD = "author_ids"
+# LaTeX 的重音符號 (例如 M\"uller、\v{S}koda) 與括號
+LATEX_MARKUP = re.compile(r"\\[\"'`^~=.]|\\[uvHcdbtk](?=[{\s])|[{}]")
+NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_name(value: str) -> str:
+    """小寫並去除重音符號與標點，例如 'Müller-Lüdenscheidt, J.' → 'muller ludenscheidt j'"""
+    value = unicodedata.normalize("NFKD", LATEX_MARKUP.sub("", value))
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(NON_WORD.sub(" ", value.lower()).split())
+
+
+@lru_cache(maxsize=200_000)
+def author_id(keyname: str, firstname: str = "") -> int:
+    """
+    作者的 id: 正規化後的 '姓|名' 以 blake2b 雜湊為 64 位元整數 (OpenSearch 的 long)
+
+    id 只由姓名決定，各個 Lambda 不需協調即可產生相同的 id。
+    """
+    key = f"{normalize_name(keyname)}|{normalize_name(firstname)}"
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def parsed_author_ids(authors_parsed: list[list[str]]) -> list[int]:
+    """authors_parsed 中每位作者的 id (順序與 extract_authors 相同)"""
+    return [author_id(author[0], author[1] if len(author) > 1 else "") for author in authors_parsed]
+
+
+def author_names(doc: dict) -> list[str]:
+    """文件中作者的顯示名稱，支援 full 與 lean 兩種文件格式 (順序與 author_ids 相同)"""
+    if "authors_full_info" in doc:
+        return [author["fullname"] for author in doc["authors_full_info"] or []]
+    return doc.get("authors") or []
+
+
+def paper_version(doc: dict) -> int:
+    """同一篇論文的新舊順序 (update_date 的 YYYYMMDD)，較舊的版本不覆蓋較新的作者清單"""
+    digits = (doc.get("update_date") or "").replace("-", "")
+    return int(digits) if digits.isdigit() else 0
+
+
+class AuthorPostings:
+    """一批論文的作者清單 (論文 id → 版本與作者 id) 與作者的顯示名稱"""
+
+    def __init__(self):
+        self.papers: dict[str, tuple[int, list[int]]] = {}
+        self.names: dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.papers)
+
+    def add_paper(self, paper_id: str, version: int, ids: Iterable[int]) -> None:
+        current = self.papers.get(paper_id)
+        if current is None or version >= current[0]:
+            self.papers[paper_id] = (version, list(dict.fromkeys(ids)))
+
+    def add(self, doc: dict) -> None:
+        ids = doc.get(AUTHOR_IDS_FIELD)
+        if ids is None:
+            return
+        self.add_paper(doc["id"], paper_version(doc), ids)
+        self.names.update(zip(ids, author_names(doc), strict=False))
+
+    def discard(self, paper_ids: Iterable[str]) -> None:
+        for paper_id in paper_ids:
+            self.papers.pop(paper_id, None)
+
+    def update(self, delta: dict) -> None:
+        """併入 write_author_delta 寫入的 delta"""
+        for paper_id, version, ids in delta["papers"]:
+            self.add_paper(paper_id, version, ids)
+        self.names.update((int(author), name) for author, name in delta["names"])
+
+
+def collect_authors(documents: Iterable[dict], postings: AuthorPostings) -> Iterator[dict]:
+    """轉發文件並記錄其作者清單"""
+    for doc in documents:
+        postings.add(doc)
+        yield doc
+
+
+def write_author_delta(
+    s3, bucket: str, postings: AuthorPostings, sources: list[str], prefix: str = AUTHOR_PREFIX
+) -> str | None:
+    """
+    將一批寫入索引的論文的作者清單寫入 {prefix}/deltas/ (由 compact_author_table 併入作者表)
+
+    Returns:
+        str | None: 寫入的 key，沒有論文時回傳 None
+    """
+    if not postings:
+        return None
+    key = f"{prefix}/deltas/{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex}.json.gz"
+    papers = [[paper_id, version, ids] for paper_id, (version, ids) in postings.papers.items()]
+    names = [[author, name] for author, name in postings.names.items()]
+    put_gzip_json(s3, bucket, key, {"sources": sources, "papers": papers, "names": names})
+    return key
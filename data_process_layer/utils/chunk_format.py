@@ -0,0 +1,57 @@
+import gzip
+import json
+from collections.abc import Iterator
+from typing import Any, BinaryIO
+
+FORMAT_NAME = "arxiv-metadata-ndjson"
+SUPPORTED_VERSIONS = {1}
+CHUNK_SUFFIX = ".ndjson.gz"
+
+
+class DeltaChunkError(ValueError):
+    """需要完整快照 (例如重建索引) 時讀到增量輸出或無法確認的 chunk"""
+
+
+def iter_chunk_records(
+    body: BinaryIO, key: str, require_full: bool = False, allow_unmarked: bool = False
+) -> Iterator[dict[str, Any]]:
+    """
+    逐筆讀取 parsed_ chunk 中的記錄
+
+    `.ndjson.gz` 為 gzip 壓縮的 NDJSON (第一行為 header)，邊解壓邊解析，
+    記憶體用量與 chunk 大小無關；其他 key 視為舊格式的 JSON 陣列，整份讀入後解析。
+
+    Args:
+        body (BinaryIO): 具有 read(size) 的串流，例如 S3 get_object 的 Body
+        key (str): chunk 的 S3 key，用於判斷格式
+        require_full (bool): 只接受 header 標記為全量輸出 (delta: false) 的 chunk，否則拋出 DeltaChunkError
+        allow_unmarked (bool): require_full 時仍接受未標記的舊 chunk (由呼叫端確認為完整快照)
+
+    Yields:
+        dict[str, Any]: 單筆 metadata
+    """
+    if not key.endswith(CHUNK_SUFFIX):
+        if require_full and not allow_unmarked:
+            raise DeltaChunkError(f"Chunk {key} has no header: cannot confirm it is a full snapshot")
+        yield from json.loads(body.read().decode("utf-8"))
+        return
+
+    with gzip.GzipFile(fileobj=body, mode="rb") as file:
+        header = json.loads(file.readline())
+        if header.get("format") != FORMAT_NAME or header.get("version") not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported chunk format: {header.get('format')} v{header.get('version')}")
+        delta = header.get("delta")
+        # 未標記的 chunk 可能來自增量模式，無法確認為完整快照
+        if require_full and (delta or (delta is None and not allow_unmarked)):
+            raise DeltaChunkError(f"Chunk {key} is not a full snapshot (delta: {header.get('delta')})")
+
+        record_count = 0
+        for line in file:
+            if not line.strip():
+                continue
+            record_count += 1
+            yield json.loads(line)
+
+    # 筆數不符表示 chunk 不完整 (例如上傳中斷)
+    if record_count != header["record_count"]:
+        raise ValueError(f"Chunk {key} is incomplete: expected {header['record_count']} records, got {record_count}")
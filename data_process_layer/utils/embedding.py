@@ -0,0 +1,252 @@
+"""
+論文向量 (標題 + 摘要)，寫入 knn_vector 欄位供 OpenSearch 的 kNN 搜尋 (推薦相似論文)
+
+預設的 hashed-tfidf 不需要模型檔，結果只由參數決定 (不同行程、不同次執行皆相同)：
+token 以 crc32 雜湊至固定的特徵空間，詞頻取 1 + log(tf) 並乘上 IDF (未提供 IDF 檔時為 1)，
+再以稀疏的隨機投影 (每個特徵對應 density 個 ±1 維度) 降至 dimension 維並正規化為單位向量。
+整批文件的計算以 NumPy 一次完成；只有斷詞與 token 的雜湊 (有快取) 逐筆執行。
+
+只在 EMBEDDING_ENABLED (見 utils.transform_metadata) 時載入，handler 的冷啟動不需 import numpy。
+索引時由 bulk 在比對 content_hash 之後才呼叫 embed_texts，內容未變動而略過的論文不計算向量。
+content_hash 計入 Embedder.name，啟用或更換模型 (含參數與 IDF) 後已索引的論文會重新送出並寫入新的向量。
+"""
+
+import hashlib
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from functools import lru_cache
+from itertools import chain
+from typing import Any, Protocol
+
+import numpy as np
+
+from utils.transform_metadata import VECTOR_FIELD, embedding_text
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "hashed-tfidf")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 256))
+# 一次向量化的文件數 (約等於一個 chunk 的筆數)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 5000))
+# 以內容雜湊快取的向量數上限 (同一個執行環境內重送或重播的論文不再重新計算)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 100_000))
+# 以 fit_idf 由語料產生的 IDF (.npy)，未設定時不加權
+EMBEDDING_IDF_PATH = os.getenv("EMBEDDING_IDF_PATH")
+
+# 寫入索引的小數位數 (縮小 _source，不影響相似度排序)
+VECTOR_DECIMALS = 5
+HASH_FEATURES = 2**18
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9]+")
+# token 快取的上限，超過時清空 (摘要的詞彙量有限，正常情況下不會觸發)
+TOKEN_CACHE_SIZE = 500_000
+STOP_WORDS = frozenset(
+    "a an and are as at be by can for from has have in is it its of on or our that the their these this "
+    "to was we were which with into than then there also such using use used based show shows paper "
+    "results new two one over under between both however".split()
+)
+
+
+class Embedder(Protocol):
+    """整批文字轉為向量: 回傳 (len(texts), dimension) 的 float32 陣列，每一列為單位向量 (空白文字為零向量)"""
+
+    name: str
+    dimension: int
+
+    def embed(self, texts: list[str]) -> np.ndarray: ...
+
+
+class HashedTfidfEmbedder:
+    def __init__(
+        self,
+        dimension: int = EMBEDDING_DIMENSION,
+        features: int = HASH_FEATURES,
+        density: int = 4,
+        seed: int = 0,
+        idf: np.ndarray | None = None,
+    ):
+        rng = np.random.default_rng(seed)
+        self.dimension = dimension
+        self.features = features
+        self.density = density
+        self.targets = rng.integers(0, dimension, size=(features, density), dtype=np.int64)
+        self.signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(features, density))
+        self.signs /= np.sqrt(density)
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+        self.token_ids: dict[str, int] = {}
+        idf_digest = "none" if self.idf is None else hashlib.sha1(self.idf.tobytes()).hexdigest()[:8]
+        self.name = f"hashed-tfidf-{features}-{dimension}-{density}-{seed}-{idf_digest}"
+
+    def token_id(self, token: str) -> int:
+        """token 對應的特徵編號，停用詞為 -1"""
+        if len(self.token_ids) >= TOKEN_CACHE_SIZE:
+            self.token_ids.clear()
+        feature = -1 if token in STOP_WORDS else zlib.crc32(token.encode()) % self.features
+        self.token_ids[token] = feature
+        return feature
+
+    def tokenize(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """回傳每個 token 所屬的文件編號與特徵編號 (已排除停用詞)"""
+        token_ids = self.token_ids
+        lengths = []
+        ids = []
+        for text in texts:
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            lengths.append(len(tokens))
+            ids.append([token_ids[token] if token in token_ids else self.token_id(token) for token in tokens])
+        features = np.fromiter(chain.from_iterable(ids), dtype=np.int64, count=sum(lengths))
+        docs = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        keep = features >= 0
+        return docs[keep], features[keep]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        docs, features = self.tokenize(texts)
+        # 同一文件的相同特徵合併計算詞頻
+        pairs, counts = np.unique(docs * self.features + features, return_counts=True)
+        docs, features = np.divmod(pairs, self.features)
+        weights = 1 + np.log(counts, dtype=np.float32)
+        if self.idf is not None:
+            weights *= self.idf[features]
+
+        rows = (docs[:, None] * self.dimension + self.targets[features]).ravel()
+        values = (weights[:, None] * self.signs[features]).ravel()
+        vectors = np.bincount(rows, weights=values, minlength=len(texts) * self.dimension)
+        vectors = vectors.reshape(len(texts), self.dimension).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def fit_idf(self, texts: Iterable[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """由語料 (例如完整快照的標題 + 摘要) 計算各特徵的 IDF 並套用，回傳 IDF 陣列 (可以 np.save 保存)"""
+        document_frequency = np.zeros(self.features, dtype=np.int64)
+        total = 0
+        batch: list[str] = []
+        for text in chain(texts, [None]):
+            if text is not None:
+                batch.append(text)
+                if len(batch) < batch_size:
+                    continue
+            if batch:
+                docs, features = self.tokenize(batch)
+                pairs = np.unique(docs * self.features + features)
+                document_frequency += np.bincount(pairs % self.features, minlength=self.features)
+                total += len(batch)
+                batch = []
+        self.idf = (np.log((1 + total) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.name = f"{self.name.rsplit('-', 1)[0]}-{hashlib.sha1(self.idf.tobytes()).hexdigest()[:8]}"
+        return self.idf
+
+
+def create_hashed_tfidf() -> HashedTfidfEmbedder:
+    idf = np.load(EMBEDDING_IDF_PATH) if EMBEDDING_IDF_PATH else None
+    return HashedTfidfEmbedder(idf=idf)
+
+
+# 可替換的向量模型: 名稱 → 建立 Embedder 的函式 (例如以 ONNX 執行的 sentence embedding)
+EMBEDDERS: dict[str, Callable[[], Embedder]] = {
+    "hashed-tfidf": create_hashed_tfidf,
+}
+
+
+@lru_cache(maxsize=1)
+def get_embedder(name: str = EMBEDDING_MODEL) -> Embedder:
+    """同一個執行環境共用 Embedder (投影矩陣與 token 快取只建立一次)"""
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unsupported embedding model: {name}")
+    return EMBEDDERS[name]()
+
+
+class EmbeddingCache:
+    """以 (模型, 標題 + 摘要) 的雜湊為 key 的 LRU 快取，內容未變動的論文不再重新計算向量"""
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self.vectors: OrderedDict[bytes, list[float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> list[float] | None:
+        vector = self.vectors.get(key)
+        if vector is None:
+            self.misses += 1
+            return None
+        self.vectors.move_to_end(key)
+        self.hits += 1
+        return vector
+
+    def put(self, key: bytes, vector: list[float]) -> None:
+        self.vectors[key] = vector
+        self.vectors.move_to_end(key)
+        while len(self.vectors) > self.max_size:
+            self.vectors.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache()
+
+
+# bulk 的多個執行緒共用 Embedder 與快取
+EMBED_LOCK = threading.Lock()
+
+
+def embed_texts(
+    texts: list[str], embedder: Embedder | None = None, cache: EmbeddingCache | None = None
+) -> list[list[float] | None]:
+    """整批文字的向量 (空白文字為 None)，快取中已有的向量不重新計算"""
+    embedder = embedder or get_embedder()
+    cache = cache if cache is not None else get_embedding_cache()
+    keys = [hashlib.sha1(f"{embedder.name}\n{text}".encode()).digest() for text in texts]
+    with EMBED_LOCK:
+        vectors = [cache.get(key) if text else None for key, text in zip(keys, texts, strict=True)]
+        missing = [index for index, vector in enumerate(vectors) if vector is None and texts[index]]
+        if missing:
+            computed = embedder.embed([texts[index] for index in missing])
+            for index, vector in zip(missing, np.round(computed, VECTOR_DECIMALS).tolist(), strict=True):
+                vectors[index] = vector
+                cache.put(keys[index], vector)
+    return vectors
+
+
+def embed_batch(documents: list[dict[str, Any]], embedder: Embedder, cache: EmbeddingCache) -> list[dict[str, Any]]:
+    """為整批文件加上 knn_vector (沒有標題與摘要的文件不加)"""
+    vectors = embed_texts([embedding_text(doc) for doc in documents], embedder, cache)
+    for doc, vector in zip(documents, vectors, strict=True):
+        if vector is not None:
+            doc[VECTOR_FIELD] = vector
+    return documents
+
+
+def embed_documents(
+    documents: Iterable[dict[str, Any]],
+    embedder: Embedder | None = None,
+    cache: EmbeddingCache | None = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+) -> Iterator[dict[str, Any]]:
+    """
+    以 batch_size 筆為一批加上向量後依序產出
+
+    Args:
+        documents (Iterable[dict]): transform_metadata_batch 產出的文件 (直接加上欄位)
+        embedder (Embedder | None): 預設為 EMBEDDING_MODEL 對應的 Embedder
+        cache (EmbeddingCache | None): 預設為同一個執行環境共用的快取
+    """
+    embedder = embedder or get_embedder()
+    cache = cache if cache is not None else get_embedding_cache()
+    batch: list[dict[str, Any]] = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield from embed_batch(batch, embedder, cache)
+            batch = []
+    if batch:
+        yield from embed_batch(batch, embedder, cache)
+
+
+def get_vector_mapping(dimension: int = EMBEDDING_DIMENSION) -> dict:
+    """knn_vector 欄位的 mapping (向量已正規化，以內積排序即為 cosine 相似度)"""
+    return {
+        "type": "knn_vector",
+        "dimension": dimension,
+        "method": {"name": "hnsw", "engine": "faiss", "space_type": "innerproduct"},
+    }
@@ -1,16 +1,21 @@
 def extract_authors(authors_parsed: list[list[str]]) -> list[dict[str, str]]:
     authors_obj = []
+    append = authors_obj.append
     for author in authors_parsed:
         if not isinstance(author, list) or len(author) < 2:
             raise ValueError(f"Each author must be a list with at least 2 elements: {author}")
-        author_obj = {
-            "fullname": format_author_to_fullname(author),
-            "keyname": author[0],
-            "firstname": author[1],
-            "suffix": author[2] if len(author) > 2 else "",
-            "affiliation": author[3:],
-        }
-        authors_obj.append(author_obj)
+        # 與 format_author_to_fullname 相同，但直接展開以省去每位作者的函式呼叫與 list 建立
+        keyname, firstname = author[0], author[1]
+        suffix = author[2] if len(author) > 2 else ""
+        append(
+            {
+                "fullname": " ".join([part for part in (keyname, firstname, suffix) if part]).strip(),
+                "keyname": keyname,
+                "firstname": firstname,
+                "suffix": suffix,
+                "affiliation": author[3:],
+            }
+        )
     return authors_obj
 
 
@@ -1,11 +1,20 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def parse_category(category: str) -> dict[str, str]:
+    """
+    解析單一分類，arXiv 的分類只有約兩百種，結果以快取共用
+
+    回傳的 dict 會被多筆記錄共用，呼叫端不可修改。
+    """
+    parts = category.split(".")
+    return {
+        "full_category": category,
+        "category": parts[0],
+        "subcategory": parts[1] if len(parts) > 1 else None,
+    }
+
+
 def extract_categories(categories_str: str) -> list[dict[str, str]]:
-    categories = categories_str.split(" ")
-    categories_obj = []
-    for category in categories:
-        category_obj = {
-            "full_category": category,
-            "category": category.split(".")[0],
-            "subcategory": category.split(".")[1] if len(category.split(".")) > 1 else None,
-        }
-        categories_obj.append(category_obj)
-    return categories_obj
+    return [parse_category(category) for category in categories_str.split(" ")]
@@ -1,8 +1,45 @@
 import logging
 from datetime import datetime
 
+MONTHS = {
+    name: index
+    for index, name in enumerate(
+        ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), start=1
+    )
+}
+WEEKDAYS = frozenset(("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"))
+
 
 def parse_gmt_time(gmt_time_string: str) -> int:
+    """
+    解析 "Mon, 2 Apr 2007 19:18:42 GMT" 格式的時間
+
+    固定格式直接取出各欄位建立 datetime (比 strptime 快數倍)，
+    其他寫法交給 strptime，結果與錯誤皆與 strptime 相同。
+    """
+    parts = gmt_time_string.split(" ")
+    if len(parts) == 6 and parts[5] == "GMT" and parts[0][-1:] == "," and parts[0][:-1] in WEEKDAYS:
+        _, day, month_name, year, clock, _ = parts
+        month = MONTHS.get(month_name)
+        digits = day + year + clock[:2] + clock[3:5] + clock[6:]
+        if (
+            month
+            and len(day) <= 2
+            and len(year) == 4
+            and len(clock) == 8
+            and clock[2] == clock[5] == ":"
+            and digits.isascii()
+            and digits.isdigit()
+        ):
+            try:
+                created = datetime(int(year), month, int(day), int(clock[:2]), int(clock[3:5]), int(clock[6:]))
+                return int(created.timestamp())
+            except ValueError:
+                pass
+    return parse_gmt_time_strptime(gmt_time_string)
+
+
+def parse_gmt_time_strptime(gmt_time_string: str) -> int:
     try:
         time_without_gmt = gmt_time_string.replace(" GMT", "")
         return int(datetime.strptime(time_without_gmt, "%a, %d %b %Y %H:%M:%S").timestamp())
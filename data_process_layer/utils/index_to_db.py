@@ -1,41 +1,475 @@
+import calendar
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import NamedTuple
 
-import boto3
 from dotenv import load_dotenv
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from opensearchpy.helpers import bulk
-from requests_aws4auth import AWS4Auth
+from opensearchpy import OpenSearch
+from opensearchpy.exceptions import ConnectionError, TransportError
+from opensearchpy.helpers import BulkIndexError
+from opensearchpy.serializer import JSONSerializer
+
+from utils.opensearch_client import get_open_search_client
+from utils.rollups import ROLLUP_KEYS_FIELD, add_contribution, rollup_keys
+from utils.transform_metadata import VECTOR_FIELD, embedding_text
 
 load_dotenv()
 
+# 每個 bulk request 的上限 (先達到者為準) 與同時送出的 request 數 (初始值，執行中會自動調整)
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", 5 * 1024 * 1024))
+BULK_MAX_DOCS = int(os.getenv("BULK_MAX_DOCS", 1000))
+BULK_MIN_DOCS = int(os.getenv("BULK_MIN_DOCS", 50))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", 2))
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", 4))
+# 單一 request 超過此延遲 (秒) 視為叢集壓力過大，縮小 batch
+BULK_TARGET_LATENCY = float(os.getenv("BULK_TARGET_LATENCY", 5))
+# 失敗文件的重試次數與 jittered exponential backoff (秒)
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", 5))
+BULK_BACKOFF_BASE = float(os.getenv("BULK_BACKOFF_BASE", 1))
+BULK_BACKOFF_CAP = float(os.getenv("BULK_BACKOFF_CAP", 30))
+# 送出前以 mget 比對 content_hash，內容未變動的文件不再送出 (不需重新分析 abstract / nested 欄位)
+BULK_SKIP_UNCHANGED = os.getenv("BULK_SKIP_UNCHANGED", "true").lower() == "true"
+# 以 update_date 作為 external version，較舊的寫入由引擎以 409 拒絕，不會覆蓋較新的資料
+BULK_EXTERNAL_VERSION = os.getenv("BULK_EXTERNAL_VERSION", "true").lower() == "true"
 
-def get_open_search_client():
-    service = "aoss"
-    region = "ap-northeast-1"
-    credentials = boto3.Session().get_credentials()
-    awsauth = AWS4Auth(
-        credentials.access_key,
-        credentials.secret_key,
-        region,
-        service,
-        session_token=credentials.token,
-    )
-    host = os.getenv("OPENSEARCH_HOST")
-    return OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=awsauth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        timeout=300,
+THROTTLE_STATUS = 429
+CONFLICT_STATUS = 409
+CONTENT_HASH_FIELD = "content_hash"
+# 由 build_entry / add_vectors 附加於 source 的欄位，重播失敗紀錄時先移除再重新計算
+DERIVED_FIELDS = (CONTENT_HASH_FIELD, ROLLUP_KEYS_FIELD, VECTOR_FIELD)
+RETRYABLE_STATUS = {THROTTLE_STATUS, 502, 503, 504}
+
+serializer = JSONSerializer()
+
+
+class BulkEntry(NamedTuple):
+    """一筆文件的 bulk 內容 (action + source 兩行) 與比對用的 id / content_hash / 彙總 key / 向量的文字"""
+
+    doc_id: str
+    content_hash: str
+    data: bytes
+    rollup_keys: tuple[str, ...] = ()
+    text: str | None = None
+
+
+class BulkController:
+    """
+    依觀察到的延遲與節流 (429) 調整每個 request 的筆數與同時送出的 request 數
+
+    採 AIMD: 被節流時 batch 與並行數減半，延遲過高時縮小 batch，
+    連續順利完成一輪 (並行數個 request) 後才逐步放大。
+    """
+
+    def __init__(
+        self,
+        max_docs: int = BULK_MAX_DOCS,
+        concurrency: int = BULK_CONCURRENCY,
+        max_concurrency: int = BULK_MAX_CONCURRENCY,
+        min_docs: int = BULK_MIN_DOCS,
+        target_latency: float = BULK_TARGET_LATENCY,
+        max_rate: float | None = None,
+    ):
+        """
+        Args:
+            max_rate (float | None): 每秒送出的文件數上限 (例如回填時保留叢集的餘裕)，None 為不限制
+        """
+        self.max_docs = max_docs
+        self.min_docs = min(min_docs, max_docs)
+        self.max_concurrency = max(max_concurrency, concurrency, 1)
+        self.target_latency = target_latency
+        self.batch_docs = max_docs
+        self.concurrency = max(concurrency, 1)
+        self.lock = threading.Lock()
+        self.healthy_streak = 0
+        self.requests = 0
+        self.throttled = 0
+        self.latencies: list[float] = []
+        # 內容未變動而略過、因版本較舊被拒絕的筆數
+        self.unchanged = 0
+        self.stale = 0
+        # 計算向量的筆數與耗時 (秒)
+        self.embedded = 0
+        self.embed_seconds = 0.0
+        # 追蹤彙總時為本次寫入造成的 key 計數變化 (由 bulk_index_documents 建立)
+        self.rollups: Counter | None = None
+        self.max_rate = max_rate
+        self.submitted = 0
+        self.started: float | None = None
+
+    def record(self, latency: float, throttled: bool) -> None:
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if throttled:
+                self.throttled += 1
+                self.healthy_streak = 0
+                self.batch_docs = max(self.min_docs, self.batch_docs // 2)
+                self.concurrency = max(1, self.concurrency // 2)
+            elif latency > self.target_latency:
+                self.healthy_streak = 0
+                self.batch_docs = max(self.min_docs, int(self.batch_docs * 0.8))
+            else:
+                self.healthy_streak += 1
+                if self.healthy_streak >= self.concurrency:
+                    self.healthy_streak = 0
+                    self.batch_docs = min(self.max_docs, self.batch_docs + max(self.batch_docs // 10, 1))
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def wait_for_rate(self, docs: int, sleep: Callable[[float], None] = time.sleep) -> None:
+        """送出 docs 筆前等待，使累計送出的筆數不超過 max_rate (第一個 batch 不等待)"""
+        if not self.max_rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if self.started is None:
+                self.started = now
+            delay = self.submitted / self.max_rate - (now - self.started)
+            self.submitted += docs
+        if delay > 0:
+            sleep(delay)
+
+    def record_rollups(self, written: list[BulkEntry], previous: dict[str, list[str]]) -> None:
+        """累加已寫入文件的彙總變化 (扣除索引中舊版本的 key)"""
+        with self.lock:
+            for entry in written:
+                add_contribution(self.rollups, entry.rollup_keys, previous.get(entry.doc_id, ()))
+
+
+@lru_cache(maxsize=16384)
+def date_to_version(update_date: str) -> int:
+    """update_date (YYYY-MM-DD) 轉為 UTC 秒數，與 collection_layer 的 update_timestamp 相同"""
+    return calendar.timegm(time.strptime(update_date, "%Y-%m-%d"))
+
+
+def document_version(doc: dict) -> int | None:
+    update_date = doc.get("update_date")
+    if not update_date:
+        return None
+    try:
+        return date_to_version(update_date)
+    except ValueError:
+        return None
+
+
+def build_entry(
+    index_name: str,
+    doc: dict,
+    external_version: bool = BULK_EXTERNAL_VERSION,
+    track_rollups: bool = False,
+    embed: bool = False,
+) -> BulkEntry:
+    """
+    序列化一筆文件，並在 source 中附加 content_hash (source 本身的 sha1)
+
+    雜湊直接取自要送出的 bytes，不需再序列化一次；重播的失敗紀錄已帶有 content_hash 時先移除。
+    track_rollups 時一併附加此文件的彙總 key (不影響 content_hash)；embed 時保留計算向量的文字，
+    並將 embedder 的名稱計入 content_hash: 啟用或更換 embedder 後，內容未變動的論文也會重新送出並寫入新的向量。
+    """
+    if any(field in doc for field in DERIVED_FIELDS):
+        doc = {key: value for key, value in doc.items() if key not in DERIVED_FIELDS}
+    source = serializer.dumps(doc)
+    digest = hashlib.sha1(source.encode())
+    if embed:
+        from utils.embedding import get_embedder
+
+        digest.update(f"\n{get_embedder().name}".encode())
+    content_hash = digest.hexdigest()[:16]
+    source = f'{source[:-1]}, "{CONTENT_HASH_FIELD}": "{content_hash}"}}'
+    keys = tuple(rollup_keys(doc)) if track_rollups else ()
+    if track_rollups:
+        source = f'{source[:-1]}, "{ROLLUP_KEYS_FIELD}": {serializer.dumps(list(keys))}}}'
+
+    action = {"_index": index_name, "_id": doc["id"]}
+    version = document_version(doc) if external_version else None
+    if version is not None:
+        # external_gte: 相同版本仍可寫入 (同一天內容更正)，較舊的版本才會被拒絕
+        action.update(version=version, version_type="external_gte")
+    data = f"{serializer.dumps({'index': action})}\n{source}\n".encode()
+    return BulkEntry(doc["id"], content_hash, data, keys, embedding_text(doc) if embed else None)
+
+
+def iter_bulk_batches(
+    index_name: str,
+    documents: Iterable[dict],
+    max_bytes: int = BULK_MAX_BYTES,
+    max_docs: int | Callable[[], int] = BULK_MAX_DOCS,
+    track_rollups: bool = False,
+    embed: bool = False,
+) -> Iterator[list[BulkEntry]]:
+    """
+    將文件逐筆序列化為 bulk API 的 NDJSON，依 bytes 或筆數切成 request
+
+    Args:
+        max_docs (int | Callable[[], int]): 每個 request 的筆數上限，可傳入函式以在執行中調整
+
+    Yields:
+        list[BulkEntry]: 單一 bulk request 的內容，每個元素為一筆文件的 action + source 兩行
+    """
+    batch: list[BulkEntry] = []
+    batch_bytes = 0
+    batch_limit = max_docs() if callable(max_docs) else max_docs
+    for doc in documents:
+        entry = build_entry(index_name, doc, track_rollups=track_rollups, embed=embed)
+        if batch and (batch_bytes + len(entry.data) > max_bytes or len(batch) >= batch_limit):
+            yield batch
+            batch, batch_bytes = [], 0
+            batch_limit = max_docs() if callable(max_docs) else max_docs
+        batch.append(entry)
+        batch_bytes += len(entry.data)
+    if batch:
+        yield batch
+
+
+def lookup_indexed(client: OpenSearch, index_name: str, batch: list[BulkEntry], fields: list[str]) -> dict[str, dict]:
+    """
+    以 mget 取回已索引文件的部分欄位
+
+    Returns:
+        dict[str, dict]: 已存在於索引中的文件 id 與其 source (只含 fields)
+    """
+    response = client.mget(
+        index=index_name, body={"ids": [entry.doc_id for entry in batch]}, _source_includes=",".join(fields)
     )
+    return {doc["_id"]: doc.get("_source", {}) for doc in response["docs"] if doc.get("found")}
+
+
+def drop_unchanged(batch: list[BulkEntry], indexed: dict[str, dict]) -> list[BulkEntry]:
+    """移除 content_hash 與已索引文件相同的文件"""
+    return [
+        entry
+        for entry in batch
+        if entry.doc_id not in indexed or indexed[entry.doc_id].get(CONTENT_HASH_FIELD) != entry.content_hash
+    ]
+
+
+def add_vectors(batch: list[BulkEntry], controller: BulkController) -> list[BulkEntry]:
+    """
+    為要送出的文件計算向量並附加於 source 之後 (向量本身不計入 content_hash，embedder 的名稱已計入)
+
+    在 drop_unchanged 之後呼叫，內容未變動而略過的文件不需計算向量 (冷啟動、重播或回填皆同)。
+    """
+    from utils.embedding import embed_texts
+
+    st = time.monotonic()
+    vectors = embed_texts([entry.text or "" for entry in batch])
+    with controller.lock:
+        controller.embedded += len(batch)
+        controller.embed_seconds += time.monotonic() - st
+    return [
+        entry
+        if vector is None
+        else entry._replace(data=entry.data[:-2] + f', "{VECTOR_FIELD}": {serializer.dumps(vector)}}}\n'.encode())
+        for entry, vector in zip(batch, vectors, strict=True)
+    ]
+
+
+def send_bulk(
+    client: OpenSearch, batch: list[BulkEntry]
+) -> tuple[list[BulkEntry], list[tuple[BulkEntry, dict]], bool, int]:
+    """
+    送出一個 bulk request
+
+    整個 request 失敗 (例如 429、連線錯誤) 時視為每筆文件都失敗。
+    版本較舊而被拒絕 (409) 的文件代表索引中已有較新的資料，不視為失敗。
+
+    Returns:
+        tuple[list[BulkEntry], list[tuple[BulkEntry, dict]], bool, int]: 成功寫入的文件、失敗的 (文件, 錯誤)、
+            是否被節流、版本較舊的筆數
+    """
+    try:
+        response = client.bulk(body=b"".join(entry.data for entry in batch))
+    except TransportError as e:
+        status = e.status_code if isinstance(e.status_code, int) else None
+        if status is None and not isinstance(e, ConnectionError):
+            raise
+        error = {"status": status, "error": str(e.error)}
+        return [], [(entry, error) for entry in batch], status == THROTTLE_STATUS, 0
+
+    if not response.get("errors"):
+        return batch, [], False, 0
+
+    written = []
+    failures = []
+    stale = 0
+    for entry, item in zip(batch, response["items"], strict=True):
+        result = next(iter(item.values()))
+        status = result.get("status", 500)
+        if status == CONFLICT_STATUS:
+            stale += 1
+        elif 200 <= status < 300:
+            written.append(entry)
+        else:
+            failures.append((entry, {"status": status, "error": result.get("error")}))
+    throttled = any(error["status"] == THROTTLE_STATUS for _, error in failures)
+    return written, failures, throttled, stale
 
 
-def bulk_index_documents(index_name: str, documents: list[dict]):
-    client = get_open_search_client()
+def is_retryable(error: dict) -> bool:
+    return error["status"] is None or error["status"] in RETRYABLE_STATUS
 
-    actions = [{"_index": index_name, "_id": doc["id"], "_source": doc} for doc in documents]
 
-    success, failed = bulk(client, actions)
+def index_batch(
+    client: OpenSearch,
+    batch: list[BulkEntry],
+    controller: BulkController,
+    sleep: Callable[[float], None] = time.sleep,
+    unchanged_index: str | None = None,
+    rollup_index: str | None = None,
+    embed: bool = False,
+) -> tuple[int, list[tuple[BulkEntry, dict]], int, int]:
+    """
+    索引一個 batch，只重試可重試的失敗文件 (節流、5xx、連線錯誤)
 
-    return success, failed
+    Args:
+        unchanged_index (str | None): 提供時先比對此索引中的 content_hash，略過未變動的文件
+        rollup_index (str | None): 提供時由此索引取回舊的彙總 key，寫入後將變化累加至 controller.rollups
+        embed (bool): 為略過未變動的文件後仍要送出的文件加上向量 (見 add_vectors)
+
+    Returns:
+        tuple[int, list[tuple[BulkEntry, dict]], int, int]: 成功筆數、重試後仍失敗的 (文件, 錯誤)、
+            未變動略過的筆數、版本較舊的筆數
+    """
+    success = 0
+    stale = 0
+    permanent: list[tuple[BulkEntry, dict]] = []
+    indexed: dict[str, dict] = {}
+    lookup_index = rollup_index or unchanged_index
+    if lookup_index:
+        fields = [CONTENT_HASH_FIELD] + ([ROLLUP_KEYS_FIELD] if rollup_index else [])
+        try:
+            indexed = lookup_indexed(client, lookup_index, batch, fields)
+        except TransportError as e:
+            if rollup_index:
+                # 不知道舊的彙總 key 就無法正確計算變化: 整批視為失敗，由呼叫端重送
+                print(f"mget 失敗，整批視為失敗: {e}")
+                error = {"status": e.status_code if isinstance(e.status_code, int) else None, "error": str(e.error)}
+                return 0, [(entry, error) for entry in batch], 0, 0
+            # 不略過任何文件 (仍由 external version 避免覆蓋較新的資料)
+            print(f"mget 失敗，不略過未變動的文件: {e}")
+    pending = drop_unchanged(batch, indexed) if unchanged_index else batch
+    unchanged = len(batch) - len(pending)
+    if embed and pending:
+        pending = add_vectors(pending, controller)
+    previous = {doc_id: source.get(ROLLUP_KEYS_FIELD) or () for doc_id, source in indexed.items()}
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        if not pending:
+            break
+        st = time.monotonic()
+        written, failures, throttled, batch_stale = send_bulk(client, pending)
+        controller.record(time.monotonic() - st, throttled)
+        if rollup_index:
+            controller.record_rollups(written, previous)
+        success += len(written)
+        stale += batch_stale
+
+        retryable = [(entry, error) for entry, error in failures if is_retryable(error)]
+        permanent.extend((entry, error) for entry, error in failures if not is_retryable(error))
+        if not retryable:
+            break
+        if attempt == BULK_MAX_RETRIES:
+            permanent.extend(retryable)
+            break
+
+        pending = [entry for entry, _ in retryable]
+        # full jitter，避免多個 worker 同時重試再次觸發節流
+        sleep(random.uniform(0, min(BULK_BACKOFF_CAP, BULK_BACKOFF_BASE * 2**attempt)))
+    return success, permanent, unchanged, stale
+
+
+def failure_record(entry: BulkEntry, error: dict) -> dict:
+    """將失敗文件轉為可重播的紀錄 (包含原始 action 與 source)"""
+    action_line, source_line = entry.data.decode("utf-8").rstrip("\n").split("\n", 1)
+    action = json.loads(action_line)["index"]
+    return {
+        "_index": action["_index"],
+        "_id": action["_id"],
+        "status": error["status"],
+        "error": error["error"],
+        "_source": json.loads(source_line),
+    }
+
+
+def bulk_index_documents(
+    index_name: str,
+    documents: Iterable[dict],
+    concurrency: int = BULK_CONCURRENCY,
+    max_bytes: int = BULK_MAX_BYTES,
+    max_docs: int = BULK_MAX_DOCS,
+    client: OpenSearch | None = None,
+    controller: BulkController | None = None,
+    failure_sink: Callable[[list[dict]], None] | None = None,
+    skip_unchanged: bool = BULK_SKIP_UNCHANGED,
+    track_rollups: bool = False,
+    embed: bool = False,
+):
+    """
+    以串流方式索引文件: 邊讀取邊切成 bulk request，並依叢集回應調整 batch 大小與並行數
+
+    documents 可為 generator，記憶體中最多只有並行數 + 1 個 request 的資料，與來源的總筆數無關。
+    重試後仍失敗的文件交給 failure_sink (例如寫入 S3 供重播)；未提供時於全部送出後拋出 BulkIndexError。
+    skip_unchanged 時內容未變動的文件不會送出，重播同一批 chunk 幾乎只有 mget 的成本；
+    未變動與版本較舊的筆數記錄於 controller.unchanged / controller.stale，不計入成功或失敗。
+    track_rollups 時文件附帶彙總 key，寫入造成的計數變化累加於 controller.rollups (見 utils.rollups)。
+    embed 時只為實際送出的文件計算向量 (EMBEDDING_ENABLED，見 utils.embedding)。
+
+    Returns:
+        tuple[int, int]: 成功與失敗的筆數
+    """
+    client = client or get_open_search_client()
+    controller = controller or BulkController(max_docs=max_docs, concurrency=concurrency)
+    if track_rollups and controller.rollups is None:
+        controller.rollups = Counter()
+    success = 0
+    failures: list[dict] = []
+    in_flight: set[Future] = set()
+
+    def collect(done: set[Future]) -> None:
+        nonlocal success
+        for future in done:
+            batch_success, batch_failures, unchanged, stale = future.result()
+            success += batch_success
+            controller.unchanged += unchanged
+            controller.stale += stale
+            failures.extend(failure_record(entry, error) for entry, error in batch_failures)
+
+    # 使用 ThreadPoolExecutor 而非 parallel_bulk: 後者的 multiprocessing ThreadPool 在 Lambda (無 /dev/shm) 無法建立
+    with ThreadPoolExecutor(max_workers=controller.max_concurrency) as executor:
+        batches = iter_bulk_batches(
+            index_name, documents, max_bytes, lambda: controller.batch_docs, track_rollups, embed
+        )
+        for batch in batches:
+            while len(in_flight) >= controller.concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            controller.wait_for_rate(len(batch))
+            in_flight.add(
+                executor.submit(
+                    index_batch,
+                    client,
+                    batch,
+                    controller,
+                    unchanged_index=index_name if skip_unchanged else None,
+                    rollup_index=index_name if track_rollups else None,
+                    embed=embed,
+                )
+            )
+        collect(wait(in_flight).done)
+
+    print(
+        f"bulk: {controller.requests} 個 request, 節流 {controller.throttled} 次, "
+        f"未變動略過 {controller.unchanged} 筆, 版本較舊 {controller.stale} 筆, "
+        f"結束時每批 {controller.batch_docs} 筆 / 並行 {controller.concurrency}"
+    )
+    if failures:
+        if failure_sink is None:
+            raise BulkIndexError(f"{len(failures)} document(s) failed to index.", failures)
+        failure_sink(failures)
+    return success, len(failures)
@@ -0,0 +1,160 @@
+import json
+import os
+import resource
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# collection_layer 與 data_process_layer 各有一份相同的 metrics.py (兩者為獨立的 Lambda image)
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "ArxivPipeline")
+# 設定時將指標附加寫入檔案 (本地執行)，否則輸出至 stdout 由 CloudWatch Logs 擷取
+METRICS_FILE = os.getenv("METRICS_FILE")
+PERCENTILES = (50, 90, 99)
+MAX_METRICS_PER_DIRECTIVE = 100
+
+
+@dataclass
+class StageStats:
+    records: int | None = None
+    bytes: int | None = None
+
+
+class Metrics:
+    """
+    收集單次執行的各階段耗時、處理量與記憶體用量，以 CloudWatch Embedded Metric Format 輸出
+
+    stage / timed_iter 記錄的是扣除內層 (巢狀) 計時後的時間，
+    串接的 generator (讀取 -> 轉換 -> 索引) 也能分別得到各自花費的時間。
+    """
+
+    def __init__(self, function: str, namespace: str = METRICS_NAMESPACE, output_path: str | None = METRICS_FILE):
+        """
+        Args:
+            function (str): 維度 Function 的值，例如 collection / data_process
+            namespace (str): CloudWatch 指標的 namespace
+            output_path (str | None): 本地模式的輸出檔案，None 時輸出至 stdout
+        """
+        self.namespace = namespace
+        self.dimensions = {"Function": function}
+        self.output_path = output_path
+        self.values: dict[str, tuple[float, str]] = {}
+        self.samples: dict[str, tuple[list[float], str]] = {}
+        self.properties: dict[str, object] = {}
+        self._nested_seconds = 0.0
+
+    def put(self, name: str, value: float, unit: str = "Count") -> None:
+        self.values[name] = (value, unit)
+
+    def add(self, name: str, value: float, unit: str = "Count") -> None:
+        self.values[name] = (self.value(name) + value, unit)
+
+    def value(self, name: str) -> float:
+        return self.values.get(name, (0, None))[0]
+
+    def observe(self, name: str, value: float, unit: str = "Seconds") -> None:
+        """記錄一個樣本，輸出時轉為百分位數 (例如每個 bulk request 的延遲)"""
+        self.samples.setdefault(name, ([], unit))[0].append(value)
+
+    def set_property(self, name: str, value) -> None:
+        """附加於紀錄中但不作為指標的欄位 (例如處理的 S3 key)"""
+        self.properties[name] = value
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        """
+        記錄一個階段的耗時，可於 block 內設定處理的筆數與 bytes 以計算吞吐量
+
+        Example:
+            with metrics.stage("parse") as stage:
+                stage.records = parse()
+        """
+        stats = StageStats()
+        st = time.perf_counter()
+        nested_before = self._nested_seconds
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - st
+            self._record_stage(name, elapsed - (self._nested_seconds - nested_before), stats)
+            self._nested_seconds = nested_before + elapsed
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """逐筆轉發 iterable，累計產生每一筆所花費的時間與筆數"""
+        iterator = iter(iterable)
+        seconds = 0.0
+        count = 0
+        try:
+            while True:
+                st = time.perf_counter()
+                nested_before = self._nested_seconds
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed = time.perf_counter() - st
+                    seconds += elapsed - (self._nested_seconds - nested_before)
+                    self._nested_seconds = nested_before + elapsed
+                count += 1
+                yield item
+        finally:
+            self._record_stage(name, seconds, StageStats(records=count))
+
+    def _record_stage(self, name: str, seconds: float, stats: StageStats) -> None:
+        self.add(f"{name}_seconds", seconds, "Seconds")
+        seconds = max(self.value(f"{name}_seconds"), 1e-9)
+        if stats.records is not None:
+            self.add(f"{name}_records", stats.records)
+            self.put(f"{name}_records_per_second", self.value(f"{name}_records") / seconds, "Count/Second")
+        if stats.bytes is not None:
+            self.add(f"{name}_bytes", stats.bytes, "Bytes")
+            self.put(
+                f"{name}_megabytes_per_second", self.value(f"{name}_bytes") / 1024 / 1024 / seconds, "Megabytes/Second"
+            )
+
+    def build(self) -> dict:
+        """組成 EMF 文件 (含峰值記憶體與樣本的百分位數)"""
+        values = dict(self.values)
+        # Linux 上 ru_maxrss 的單位為 KB；子行程 (平行解析) 另外記錄
+        values["peak_rss_mb"] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "Megabytes")
+        children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if children_rss:
+            values["children_peak_rss_mb"] = (children_rss / 1024, "Megabytes")
+        for name, (samples, unit) in self.samples.items():
+            ordered = sorted(samples)
+            for percentile in PERCENTILES:
+                index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+                values[f"{name}_p{percentile}"] = (ordered[index], unit)
+
+        names = list(values)
+        directives = [
+            {
+                "Namespace": self.namespace,
+                "Dimensions": [list(self.dimensions)],
+                "Metrics": [
+                    {"Name": name, "Unit": values[name][1]} for name in names[i : i + MAX_METRICS_PER_DIRECTIVE]
+                ],
+            }
+            for i in range(0, len(names), MAX_METRICS_PER_DIRECTIVE)
+        ]
+        return {
+            "_aws": {"Timestamp": int(time.time() * 1000), "CloudWatchMetrics": directives},
+            **self.dimensions,
+            **self.properties,
+            **{name: round(value, 6) for name, (value, _) in values.items()},
+        }
+
+    def flush(self) -> dict:
+        """輸出一行 EMF 紀錄並回傳其內容"""
+        document = self.build()
+        line = json.dumps(document, ensure_ascii=False, default=str) + "\n"
+        if self.output_path:
+            with open(self.output_path, "a", encoding="utf-8") as file:
+                file.write(line)
+        else:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        return document
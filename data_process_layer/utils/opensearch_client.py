@@ -0,0 +1,64 @@
+import os
+from functools import lru_cache
+
+import boto3
+from dotenv import load_dotenv
+from opensearchpy import OpenSearch, RequestsHttpConnection
+from requests_aws4auth import AWS4Auth
+
+load_dotenv()
+
+# OPEN_SEARCH_HOST 為舊的設定名稱，仍可使用
+OPENSEARCH_HOST = os.getenv("OPENSEARCH_HOST") or os.getenv("OPEN_SEARCH_HOST")
+OPENSEARCH_REGION = os.getenv("OPENSEARCH_REGION", "ap-northeast-1")
+OPENSEARCH_SERVICE = os.getenv("OPENSEARCH_SERVICE", "aoss")
+OPENSEARCH_TIMEOUT = int(os.getenv("OPENSEARCH_TIMEOUT", 300))
+# 需不小於同時送出的 bulk request 數，否則多出的連線用完即丟
+OPENSEARCH_POOL_SIZE = int(os.getenv("OPENSEARCH_POOL_SIZE", 10))
+
+
+def create_open_search_client(
+    host: str | None = OPENSEARCH_HOST,
+    region: str = OPENSEARCH_REGION,
+    service: str = OPENSEARCH_SERVICE,
+    timeout: int = OPENSEARCH_TIMEOUT,
+    pool_maxsize: int = OPENSEARCH_POOL_SIZE,
+    credentials=None,
+) -> OpenSearch:
+    """
+    建立以 SigV4 簽章的 OpenSearch client
+
+    簽章使用 refreshable credentials，臨時憑證 (Lambda execution role) 過期前會自動更新，
+    client 可在 warm invocation 間長期重複使用。
+
+    Args:
+        host (str | None): OpenSearch (Serverless) endpoint，不含 https://
+        region (str): endpoint 所在的 region
+        service (str): 簽章的服務名稱，Serverless 為 aoss，託管叢集為 es
+        timeout (int): request timeout (秒)
+        pool_maxsize (int): keep-alive 連線池大小
+        credentials: botocore credentials，預設為 boto3 預設的憑證鏈
+    """
+    if not host:
+        raise ValueError("OPENSEARCH_HOST is not set")
+
+    awsauth = AWS4Auth(
+        refreshable_credentials=credentials or boto3.Session().get_credentials(),
+        region=region,
+        service=service,
+    )
+    return OpenSearch(
+        hosts=[{"host": host, "port": 443}],
+        http_auth=awsauth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection,
+        timeout=timeout,
+        pool_maxsize=pool_maxsize,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_open_search_client() -> OpenSearch:
+    """取得共用的 client，同一個 Lambda 執行環境只建立一次 (TLS 連線與簽章設定皆可重複使用)"""
+    return create_open_search_client()
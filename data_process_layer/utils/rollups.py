@@ -0,0 +1,197 @@
+import gzip
+import heapq
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterable
+
+from dotenv import load_dotenv
+
+from utils.handle_categories import parse_category
+
+load_dotenv()
+
+# 儀表板用的彙總 (每月各分類論文數、版本數分布、作者論文數) 隨索引增量維護，不需每次掃描整個索引
+# 啟用時每個 bulk batch 需多一次 mget 取回舊的 key (失敗時整批重送)，預設關閉
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+# 彙總寫入 s3://{ROLLUP_BUCKET}/{ROLLUP_PREFIX}/，未設定時寫入 chunk 所在的 bucket
+ROLLUP_BUCKET = os.getenv("ROLLUP_BUCKET") or os.getenv("S3_BUCKET_NAME")
+ROLLUP_PREFIX = os.getenv("ROLLUP_PREFIX", "rollups")
+# 輸出的作者排行筆數
+ROLLUP_TOP_AUTHORS = int(os.getenv("ROLLUP_TOP_AUTHORS", 1000))
+# state 中保留計數的作者數上限 (完整語料約有上百萬位作者，全部保留會超過合併用 Lambda 的記憶體)；
+# 未保留的作者再次出現時由該次的變化開始計數，排行為近似值，由完整重建 (compact_rollups 的 counts) 修正
+ROLLUP_AUTHOR_CAPACITY = int(os.getenv("ROLLUP_AUTHOR_CAPACITY", 10 * ROLLUP_TOP_AUTHORS))
+# 版本數超過此值的論文合併為同一組
+MAX_VERSION_BUCKET = 10
+
+# 每篇論文貢獻的彙總 key 存於文件中，更新時以 mget 取回舊的 key 扣除，不需重新計算整個索引
+ROLLUP_KEYS_FIELD = "rollup_keys"
+KEY_SEPARATOR = "|"
+# 彙總表的維度欄位 (key 的格式為 表名|維度1|維度2...)
+TABLES = {
+    "category_month": ("month", "category", "subcategory"),
+    "version_month": ("month", "versions"),
+    "author": ("author",),
+}
+
+
+def paper_month(doc: dict) -> str:
+    """論文首次提交的月份 (YYYY-MM)，沒有版本資訊時使用 update_date"""
+    versions = doc.get("versions") or []
+    created = versions[0]["created_timestamp"] if versions else doc.get("first_version_date")
+    if created is not None:
+        return time.strftime("%Y-%m", time.gmtime(created))
+    return (doc.get("update_date") or "unknown")[:7]
+
+
+def rollup_keys(doc: dict) -> list[str]:
+    """
+    一篇論文在各彙總表中計數的 key (每個 key 計 1 篇)，支援 full 與 lean 兩種文件格式
+
+    Returns:
+        list[str]: 排序後不重複的 key，例如 category_month|2024-01|cs|LG
+    """
+    month = paper_month(doc)
+    keys = {f"version_month|{month}|{min(doc.get('version_count') or 0, MAX_VERSION_BUCKET)}"}
+    for category in doc.get("categories") or []:
+        # lean 格式的分類為完整分類字串
+        if isinstance(category, str):
+            category = parse_category(category)
+        # 分類字串中的連續空白會產生空的分類
+        if category["category"]:
+            keys.add(f"category_month|{month}|{category['category']}|{category['subcategory'] or ''}")
+    if "authors_full_info" in doc:
+        authors = [author["fullname"] for author in doc["authors_full_info"] or []]
+    else:
+        authors = doc.get("authors") or []
+    keys.update(f"author|{fullname}" for fullname in authors if fullname)
+    return sorted(keys)
+
+
+def split_key(key: str) -> tuple[str, list[str]]:
+    table, _, rest = key.partition(KEY_SEPARATOR)
+    # 最後一個維度 (例如作者姓名) 可能包含分隔符號
+    return table, rest.split(KEY_SEPARATOR, len(TABLES[table]) - 1)
+
+
+def add_contribution(delta: Counter, new_keys: Iterable[str], previous_keys: Iterable[str] = ()) -> None:
+    """累加一篇論文寫入後的變化: 新的 key +1、舊的 key -1 (未變動的 key 互相抵銷)"""
+    delta.update(new_keys)
+    delta.subtract(previous_keys)
+
+
+def trim_authors(counts: Counter, capacity: int = ROLLUP_AUTHOR_CAPACITY) -> None:
+    """只保留論文數最多的 capacity 位作者 (直接修改 counts)"""
+    authors = [key for key in counts if key.startswith("author|")]
+    if len(authors) <= capacity:
+        return
+    keep = set(heapq.nlargest(capacity, authors, key=counts.__getitem__))
+    for key in authors:
+        if key not in keep:
+            del counts[key]
+
+
+def build_tables(counts: Counter) -> dict[str, dict]:
+    """
+    將 key 計數轉為儀表板讀取的欄式表格 ({"columns": [...], "data": {欄位: [值...]}})
+
+    作者只輸出論文數前 ROLLUP_TOP_AUTHORS 名 (top_authors)。
+    """
+    rows: dict[str, list[tuple]] = {table: [] for table in TABLES}
+    for key, count in counts.items():
+        if count <= 0:
+            continue
+        table, dimensions = split_key(key)
+        rows[table].append((*dimensions, count))
+
+    for table_rows in rows.values():
+        table_rows.sort()
+    rows["top_authors"] = sorted(rows.pop("author"), key=lambda row: -row[-1])[:ROLLUP_TOP_AUTHORS]
+    dimensions = {**TABLES, "top_authors": TABLES["author"]}
+
+    tables = {}
+    for table, table_rows in rows.items():
+        columns = [*dimensions[table], "papers"]
+        # 欄式: 每個欄位一個陣列，比逐列的 JSON 物件小且易於載入 DataFrame
+        data = [list(values) for values in zip(*table_rows, strict=True)] or [[] for _ in columns]
+        tables[table] = {"columns": columns, "data": dict(zip(columns, data, strict=True))}
+    return tables
+
+
+def put_gzip_json(s3, bucket: str, key: str, data: dict) -> None:
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=gzip.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+        ServerSideEncryption="AES256",
+    )
+
+
+def get_gzip_json(s3, bucket: str, key: str) -> dict | None:
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(gzip.decompress(body))
+
+
+def write_rollup_delta(s3, bucket: str, delta: Counter, sources: list[str], prefix: str = ROLLUP_PREFIX) -> str | None:
+    """
+    將一次執行的彙總變化寫入 {prefix}/deltas/ (每次寫入獨立的檔案，重送的 chunk 只會寫入實際變動的部分)
+
+    Returns:
+        str | None: 寫入的 key，沒有變化時回傳 None
+    """
+    changes = {key: count for key, count in delta.items() if count}
+    if not changes:
+        return None
+    key = f"{prefix}/deltas/{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex}.json.gz"
+    put_gzip_json(s3, bucket, key, {"sources": sources, "keys": list(changes), "deltas": list(changes.values())})
+    return key
+
+
+def compact_rollups(s3, bucket: str, prefix: str = ROLLUP_PREFIX, counts: Counter | None = None) -> dict:
+    """
+    將累積的 delta 併入完整計數，並輸出各彙總表至 {prefix}/tables/{table}.json.gz
+
+    計數與已套用的 delta 清單存於 {prefix}/state.json.gz；刪除 delta 前中斷時，
+    下次執行會略過清單中已套用的 delta，不會重複計算。應只有單一執行者 (排程) 呼叫。
+    作者計數只保留 ROLLUP_AUTHOR_CAPACITY 位 (每套用一個 delta 即裁減)，記憶體用量與語料大小無關。
+
+    Args:
+        counts (Counter | None): 提供時取代 state 中的計數 (由索引重新計算)，既有的 delta 視為已包含在內
+    """
+    state = get_gzip_json(s3, bucket, f"{prefix}/state.json.gz") or {"keys": [], "counts": [], "applied": []}
+    delta_keys = [
+        item["Key"]
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=f"{prefix}/deltas/")
+        for item in page.get("Contents", [])
+    ]
+    applied = set(state["applied"])
+
+    if counts is None:
+        counts = Counter(dict(zip(state["keys"], state["counts"], strict=True)))
+        for delta_key in delta_keys:
+            if delta_key in applied:
+                continue
+            delta = get_gzip_json(s3, bucket, delta_key)
+            counts.update(dict(zip(delta["keys"], delta["deltas"], strict=True)))
+            trim_authors(counts, ROLLUP_AUTHOR_CAPACITY)
+    counts = Counter({key: count for key, count in counts.items() if count > 0})
+    trim_authors(counts, ROLLUP_AUTHOR_CAPACITY)
+
+    state = {"keys": list(counts), "counts": list(counts.values()), "applied": delta_keys}
+    put_gzip_json(s3, bucket, f"{prefix}/state.json.gz", state)
+    tables = build_tables(counts)
+    for table, data in tables.items():
+        put_gzip_json(s3, bucket, f"{prefix}/tables/{table}.json.gz", data)
+    for start in range(0, len(delta_keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in delta_keys[start : start + 1000]]})
+    stats = {"deltas": len(delta_keys), **{table: len(data["data"]["papers"]) for table, data in tables.items()}}
+    print(f"彙總已更新: {stats}")
+    return stats
@@ -1,9 +1,24 @@
+import os
+from collections.abc import Callable, Iterable, Iterator
 from typing import Any
 
+from utils.authors import AUTHOR_IDS_FIELD, AUTHOR_INDEX_ENABLED, parsed_author_ids
 from utils.handle_authors import extract_authors
-from utils.handle_categories import extract_categories
+from utils.handle_categories import extract_categories, parse_category
 from utils.handle_versions import extract_versions
 
+# 文件格式: full 保留所有欄位 (nested 的 categories / versions / authors_full_info)，
+# lean 改為扁平的 keyword 陣列並移除重複的作者欄位；須與索引的 mapping (get_papers_mappings) 一致
+DOCUMENT_PROFILE = os.getenv("DOCUMENT_PROFILE", "full")
+# 轉換後為每篇論文加上標題 + 摘要的向量 (utils.embedding，需要 numpy；須與索引的 mapping 一致)
+EMBEDDING_ENABLED = os.getenv("EMBEDDING_ENABLED", "false").lower() == "true"
+# 向量欄位與計算向量的文字；向量由 bulk 在未變動比對後才計算並附加 (見 utils.index_to_db)，不計入 content_hash
+VECTOR_FIELD = "knn_vector"
+
+
+def embedding_text(doc: dict[str, Any]) -> str:
+    return f"{doc.get('title') or ''}\n{doc.get('abstract') or ''}".strip()
+
 
 def transform_metadata(metadata: dict[str, Any]) -> dict[str, Any]:
     """轉換單筆記錄為 OpenSearch 格式"""
@@ -26,3 +41,61 @@ def transform_metadata(metadata: dict[str, Any]) -> dict[str, Any]:
         "authors_parsed": metadata.get("authors_parsed"),
         "authors_full_info": extract_authors(metadata.get("authors_parsed")),
     }
+
+
+def transform_metadata_lean(metadata: dict[str, Any]) -> dict[str, Any]:
+    """
+    轉換單筆記錄為 lean 格式
+
+    作者只保留全名與機構、分類只保留完整分類與大類，皆為 keyword 陣列 (不建立 nested 的隱藏文件)；
+    版本只保留數量與首次 / 最新版本的時間 (UTC 秒數)。
+    """
+    versions = extract_versions(metadata["versions"])
+    categories = [parse_category(category) for category in (metadata.get("categories") or "").split(" ") if category]
+    authors = extract_authors(metadata.get("authors_parsed") or [])
+    return {
+        "id": str(metadata["id"]),
+        "submitter": metadata.get("submitter"),
+        "title": metadata.get("title"),
+        "comments": metadata.get("comments"),
+        "journal-ref": metadata.get("journal-ref"),
+        "doi": metadata.get("doi"),
+        "report-no": metadata.get("report-no"),
+        "license": metadata.get("license"),
+        "abstract": metadata.get("abstract"),
+        "version_count": len(metadata.get("versions", [])),
+        "first_version_date": versions[0]["created_timestamp"] if versions else None,
+        "latest_version_date": versions[-1]["created_timestamp"] if versions else None,
+        "categories": [category["full_category"] for category in categories],
+        "category_groups": list(dict.fromkeys(category["category"] for category in categories)),
+        "update_date": metadata.get("update_date"),
+        "update_date_datetime": metadata.get("update_date_datetime"),
+        "authors": [author["fullname"] for author in authors],
+        "affiliations": list(dict.fromkeys(affiliation for author in authors for affiliation in author["affiliation"])),
+    }
+
+
+PROFILES: dict[str, Callable[[dict[str, Any]], dict[str, Any]]] = {
+    "full": transform_metadata,
+    "lean": transform_metadata_lean,
+}
+
+
+def transform_metadata_batch(
+    metadata_list: Iterable[dict[str, Any]], profile: str = DOCUMENT_PROFILE, author_ids: bool = AUTHOR_INDEX_ENABLED
+) -> Iterator[dict[str, Any]]:
+    """
+    逐筆轉換整個 chunk，結果與 profile 對應的轉換函式相同
+
+    分類的解析結果在同一個 Lambda 執行環境內共用快取；
+    以 generator 產出，不會同時保留整個 chunk 的轉換結果。
+    author_ids 時另外加上作者實體的 id (順序與文件中的作者相同，見 utils.authors)。
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unsupported document profile: {profile}")
+    transform = PROFILES[profile]
+    for metadata in metadata_list:
+        doc = transform(metadata)
+        if author_ids:
+            doc[AUTHOR_IDS_FIELD] = parsed_author_ids(metadata.get("authors_parsed") or [])
+        yield doc
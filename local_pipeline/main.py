@@ -0,0 +1,348 @@
+"""
+本機端到端 pipeline: 在單一機器上完成 快照 → 解析 / 去重 → chunk → 轉換 → 索引，不經由 Lambda 與 S3 事件
+
+    python -m local_pipeline.main arxiv-metadata-oai-snapshot.json --sink opensearch --index-workers 8
+    python -m local_pipeline.main arxiv-metadata-oai-snapshot.json --sink dir:./output --manifest ./manifest.bin
+    python -m local_pipeline.main arxiv-metadata-oai-snapshot.json --sink memory
+
+主行程以 collection_layer 的 process_metadata 解析快照，輸出階段的行程將 chunk 放入有上限的佇列 (取代上傳)，
+索引行程同時以 data_process_layer 的轉換與 bulk 流程消化佇列，兩個階段重疊進行；佇列滿時輸出階段等待。
+兩個 layer 各自以 utils 為頂層套件，因此索引行程以 spawn 建立並只載入 data_process_layer。
+
+sink:
+    opensearch  寫入 OPENSEARCH_HOST 的索引 (INDEX_ALIAS)，失敗的文件寫入 --failures-dir
+    memory      寫入行程內的替身 (執行相同的 bulk 流程，只回傳筆數)，供離線測試
+    dir:PATH    將轉換後的文件以 gzip NDJSON 寫入 PATH/<chunk key>
+    s3://BUCKET 與 Lambda 相同，將 chunk 上傳至 BUCKET/parsed_<ts>/ (由 S3 事件觸發索引)
+"""
+
+import argparse
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import Counter
+from functools import partial
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+LAYERS = ("collection_layer", "data_process_layer")
+SUMMARY_FIELDS = ("chunks", "documents", "indexed", "failed", "unchanged", "stale")
+# 佇列中尚未索引的 chunk 數上限 (每個 chunk 約 CHUNK_TARGET_BYTES)
+QUEUE_SIZE = int(os.getenv("LOCAL_QUEUE_SIZE", 16))
+DONE = None
+
+
+def use_layer(layer: str) -> None:
+    """讓 `layer` 的 utils / arxiv_metadata 成為可 import 的模組 (必須在 import 前呼叫)"""
+    for other in LAYERS:
+        path = str(ROOT / other)
+        if path in sys.path:
+            sys.path.remove(path)
+    sys.path.insert(0, str(ROOT / layer))
+
+
+class MemoryBulkClient:
+    """只實作 bulk / mget 的 OpenSearch 替身，文件保存在行程內"""
+
+    def __init__(self):
+        self.documents: dict[str, dict] = {}
+
+    def bulk(self, body):
+        lines = body.decode("utf-8").splitlines()
+        items = []
+        for action_line, source_line in zip(lines[::2], lines[1::2], strict=True):
+            action = json.loads(action_line)["index"]
+            current = self.documents.get(action["_id"])
+            if current and action.get("version", 0) < current["version"]:
+                status = 409
+            else:
+                self.documents[action["_id"]] = {
+                    "version": action.get("version", 0),
+                    "_source": json.loads(source_line),
+                }
+                status = 201
+            items.append({"index": {"_id": action["_id"], "status": status}})
+        return {"errors": any(item["index"]["status"] >= 300 for item in items), "items": items}
+
+    def mget(self, index, body, _source_includes):
+        docs = []
+        for doc_id in body["ids"]:
+            document = self.documents.get(doc_id)
+            if document is None:
+                docs.append({"_id": doc_id, "found": False})
+                continue
+            source = {field: document["_source"].get(field) for field in _source_includes.split(",")}
+            docs.append({"_id": doc_id, "found": True, "_source": source})
+        return {"docs": docs}
+
+
+class BulkSink:
+    """以 data_process_layer 的 bulk 流程寫入索引，同一個行程的所有 chunk 共用 BulkController"""
+
+    def __init__(self, client=None, failures_dir: str = "failures", max_rate: float | None = None):
+        from arxiv_metadata import INDEX_ALIAS
+        from utils.authors import AUTHOR_INDEX_ENABLED, AuthorPostings
+        from utils.index_to_db import BulkController
+        from utils.opensearch_client import get_open_search_client
+        from utils.rollups import ROLLUP_BUCKET, ROLLUPS_ENABLED
+
+        self.index = INDEX_ALIAS
+        self.client = client or get_open_search_client()
+        self.controller = BulkController(max_rate=max_rate)
+        self.failures_dir = Path(failures_dir)
+        # 替身不寫入彙總與作者清單 (沒有對應的 S3 bucket)
+        self.track_rollups = ROLLUPS_ENABLED and bool(ROLLUP_BUCKET) and client is None
+        self.rollup_bucket = ROLLUP_BUCKET
+        self.track_authors = AUTHOR_INDEX_ENABLED and client is None
+        self.postings = AuthorPostings()
+        self.keys: list[str] = []
+        self.stats: Counter = Counter()
+
+    def write(self, key: str, documents) -> None:
+        from utils.authors import collect_authors
+        from utils.index_to_db import bulk_index_documents
+        from utils.transform_metadata import EMBEDDING_ENABLED
+
+        if self.track_authors:
+            documents = collect_authors(documents, self.postings)
+        failures: list[dict] = []
+        success, failed = bulk_index_documents(
+            self.index,
+            documents,
+            client=self.client,
+            controller=self.controller,
+            failure_sink=failures.extend,
+            track_rollups=self.track_rollups,
+            embed=EMBEDDING_ENABLED,
+        )
+        self.postings.discard(failure["_id"] for failure in failures)
+        if failures:
+            path = self.failures_dir / key.removesuffix(".ndjson.gz")
+            path = path.with_name(f"{path.name}.ndjson")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                file.writelines(json.dumps(failure, ensure_ascii=False) + "\n" for failure in failures)
+            print(f"{key}: {failed} 筆索引失敗，已寫入 {path}")
+        self.keys.append(key)
+        self.stats.update(indexed=success, failed=failed)
+
+    def close(self) -> dict:
+        from arxiv_metadata import ChunkRef, write_deltas
+
+        # 與 Lambda 相同寫入彙總變化與作者清單 (寫入 ROLLUP_BUCKET / AUTHOR_BUCKET，失敗時只記錄)
+        chunks = [ChunkRef(None, self.rollup_bucket, key) for key in self.keys]
+        if chunks:
+            write_deltas(chunks, self.controller, self.postings)
+        return {**self.stats, "unchanged": self.controller.unchanged, "stale": self.controller.stale}
+
+
+class DirectorySink:
+    """將轉換後的文件寫入本機目錄，每個 chunk 一個 gzip NDJSON 檔"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.stats: Counter = Counter()
+
+    def write(self, key: str, documents) -> None:
+        path = self.output_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as file:
+            for document in documents:
+                file.write(json.dumps(document, ensure_ascii=False) + "\n")
+                count += 1
+        self.stats.update(indexed=count)
+
+    def close(self) -> dict:
+        return dict(self.stats)
+
+
+def create_sink(spec: str, failures_dir: str = "failures", max_rate: float | None = None):
+    if spec == "opensearch":
+        return BulkSink(failures_dir=failures_dir, max_rate=max_rate)
+    if spec == "memory":
+        return BulkSink(client=MemoryBulkClient(), failures_dir=failures_dir)
+    if spec.startswith("dir:"):
+        return DirectorySink(spec.removeprefix("dir:"))
+    raise ValueError(f"不支援的 sink: {spec}")
+
+
+def index_worker(spec: str, chunk_queue, result_queue, failures_dir: str, max_rate: float | None) -> None:
+    """
+    索引行程: 從佇列取出 chunk，轉換後寫入 sink，直到收到結束標記
+
+    結果 (各項筆數) 放入 result_queue；發生錯誤時放入錯誤訊息並繼續消化佇列，避免輸出階段因佇列已滿而卡住。
+    """
+    use_layer("data_process_layer")
+    from utils.chunk_format import iter_chunk_records
+    from utils.transform_metadata import EMBEDDING_ENABLED, transform_metadata_batch
+
+    stats: Counter = Counter()
+    error = None
+    try:
+        sink = create_sink(spec, failures_dir, max_rate)
+    except Exception as e:
+        sink, error = None, f"sink 建立失敗: {e!r}"
+
+    while (item := chunk_queue.get()) is not DONE:
+        key, body = item
+        if error:
+            continue
+        try:
+            records = list(iter_chunk_records(io.BytesIO(body), key))
+            documents = transform_metadata_batch(records)
+            if EMBEDDING_ENABLED and not isinstance(sink, BulkSink):
+                # BulkSink 在略過未變動的文件後才計算向量
+                from utils.embedding import embed_documents
+
+                documents = embed_documents(documents)
+            sink.write(key, documents)
+            stats.update(chunks=1, documents=len(records))
+        except Exception as e:
+            error = f"{key}: {e!r}"
+
+    if sink is not None and error is None:
+        stats.update(sink.close())
+    result_queue.put({"stats": dict(stats), "error": error})
+
+
+def enqueue_chunk(chunk_queue, uploader, key: str, body: bytes, metadata: dict[str, str]) -> None:
+    """取代 collection_layer 的 upload_chunk: 在輸出階段的行程中將 chunk 交給索引行程"""
+    chunk_queue.put((key, body))
+
+
+def collect_results(result_queue, workers: list) -> list[dict]:
+    """等待每個索引行程的結果；行程異常結束 (沒有回傳結果) 時以錯誤訊息代替"""
+    results = []
+    while len(results) < len(workers):
+        try:
+            results.append(result_queue.get(timeout=1))
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                exitcodes = [worker.exitcode for worker in workers]
+                missing = len(workers) - len(results)
+                results += [{"stats": {}, "error": f"索引行程異常結束 (exitcode={exitcodes})"}] * missing
+    return results
+
+
+def run(
+    snapshot_path: str,
+    sink: str = "memory",
+    index_workers: int = os.cpu_count() or 1,
+    parse_workers: int | None = None,
+    timestamp: str | None = None,
+    manifest_path: str | None = None,
+    failures_dir: str = "failures",
+    rate: float | None = None,
+    queue_size: int = QUEUE_SIZE,
+) -> dict:
+    """
+    執行本機 pipeline
+
+    Args:
+        sink (str): opensearch、memory、dir:PATH 或 s3://BUCKET
+        index_workers (int): 索引行程數
+        parse_workers (int | None): 解析 / 輸出階段的行程數，None 為 PARSE_WORKERS
+        timestamp (str | None): 來源版本時間戳 (chunk 的資料夾名稱)，None 為目前時間 (ms)
+        manifest_path (str | None): 本機的 manifest 檔案，存在時只處理新增或變動的論文，完成後更新
+        rate (float | None): 所有索引行程合計每秒送出的文件數上限
+
+    Returns:
+        dict: 解析與各項索引筆數的合計
+    """
+    # 索引行程的 Queue 須在 fork 出輸出階段的行程前建立，子行程才會繼承
+    use_layer("collection_layer")
+    import arxiv_metadata as collection
+    from utils.manifest import StateManifest
+
+    timestamp = timestamp or str(int(time.time() * 1000))
+    parse_workers = parse_workers or collection.PARSE_WORKERS
+    previous = None
+    if manifest_path and os.path.exists(manifest_path):
+        previous = StateManifest.load(manifest_path)
+        print(f"載入 manifest {manifest_path}: {len(previous)} 筆")
+
+    st = time.time()
+    totals: Counter = Counter()
+    errors = []
+    if sink.startswith("s3://"):
+        collection.S3_BUCKET_NAME = sink.removeprefix("s3://").strip("/")
+        processed, manifest = collection.process_metadata(snapshot_path, timestamp, previous, workers=parse_workers)
+    else:
+        context = multiprocessing.get_context("spawn")
+        chunk_queue = context.Queue(maxsize=max(queue_size, 1))
+        result_queue = context.Queue()
+        max_rate = rate / index_workers if rate else None
+        workers = [
+            context.Process(
+                target=index_worker, args=(sink, chunk_queue, result_queue, failures_dir, max_rate), daemon=True
+            )
+            for _ in range(max(index_workers, 1))
+        ]
+        for worker in workers:
+            worker.start()
+
+        original_upload = collection.upload_chunk
+        collection.upload_chunk = partial(enqueue_chunk, chunk_queue)
+        try:
+            processed, manifest = collection.process_metadata(snapshot_path, timestamp, previous, workers=parse_workers)
+        finally:
+            collection.upload_chunk = original_upload
+            for _ in workers:
+                chunk_queue.put(DONE)
+            results = collect_results(result_queue, workers)
+            for worker in workers:
+                worker.join()
+
+        for result in results:
+            totals.update(result["stats"])
+            if result["error"]:
+                errors.append(result["error"])
+
+    if manifest_path and not errors:
+        manifest.save(manifest_path)
+
+    summary = {
+        "processed": processed,
+        **{field: totals[field] for field in SUMMARY_FIELDS},
+        "errors": errors,
+        "elapsed": round(time.time() - st, 2),
+    }
+    print(f"本機 pipeline 完成: {json.dumps(summary, ensure_ascii=False)}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在本機執行 解析 → 轉換 → 索引 的完整流程")
+    parser.add_argument("snapshot", help="arxiv-metadata-oai-snapshot.json 的路徑")
+    parser.add_argument("--sink", default="opensearch", help="opensearch、memory、dir:PATH 或 s3://BUCKET")
+    parser.add_argument("--index-workers", type=int, default=os.cpu_count() or 1, help="索引行程數")
+    parser.add_argument("--parse-workers", type=int, help="解析 / 輸出階段的行程數")
+    parser.add_argument("--timestamp", help="來源版本時間戳，預設為目前時間 (ms)")
+    parser.add_argument("--manifest", help="本機 manifest 檔案，提供時以增量模式處理並於完成後更新")
+    parser.add_argument("--failures-dir", default="failures", help="索引失敗的文件寫入的目錄")
+    parser.add_argument("--rate", type=float, help="每秒送出的文件數上限 (所有索引行程合計)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="等待索引的 chunk 數上限")
+    args = parser.parse_args()
+
+    summary = run(
+        args.snapshot,
+        args.sink,
+        args.index_workers,
+        args.parse_workers,
+        args.timestamp,
+        args.manifest,
+        args.failures_dir,
+        args.rate,
+        args.queue_size,
+    )
+    raise SystemExit(1 if summary["errors"] or summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import os
 
-from aws_cdk import CfnParameter, Duration, Stack
+from aws_cdk import ArnFormat, CfnParameter, Duration, Stack
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as targets
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as _lambda
+from aws_cdk import aws_lambda_event_sources as event_sources
+from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_s3_notifications as s3n
+from aws_cdk import aws_sqs as sqs
 from constructs import Construct
 from dotenv import load_dotenv
 
@@ -10,6 +16,21 @@ load_dotenv()
 
 
 EXCLUDE_FILES = ["*.env", ".env*", "*.pyc", "*.pyo", "*.pyd", "*.pyw", "*.pyz"]
+# coordinator 與 worker 必須以相同設定切分與上傳 chunk，兩個函式傳入同一組設定 (未設定時皆使用程式的預設值)
+COLLECTION_SETTINGS = (
+    "DELTA_MODE",
+    "MANIFEST_KEY",
+    "PARSE_WORKERS",
+    "SCAN_SEGMENT_BYTES",
+    "CHUNK_TARGET_BYTES",
+    "CHUNK_MAX_RECORDS",
+    "CHUNK_COMPRESSION_LEVEL",
+    "UPLOAD_WORKERS",
+    "UPLOAD_MAX_PENDING",
+    "FANOUT_PARTITIONS",
+    "FANOUT_PREFIX",
+    "FANOUT_WORKER_TIMEOUT",
+)
 
 
 class PipelineCdkStack(Stack):
@@ -39,10 +60,42 @@ class PipelineCdkStack(Stack):
             no_echo=True,  # 配置参数不顯示
         )
 
+        collection_settings = {name: os.environ[name] for name in COLLECTION_SETTINGS if os.environ.get(name)}
+
         # 透過角色 ARN 來取得現有的 IAM 角色
         existing_role_arn = f"arn:aws:iam::{os.environ['AWS_ACCOUNT']}:role/{os.environ['AWS_ROLE']}"
         existing_role = iam.Role.from_role_arn(self, "ExistingRole", role_arn=existing_role_arn)
 
+        # 水平擴展模式的 worker: 與 collection layer 使用同一個 image，由 coordinator 以同步呼叫分派 shard
+        # (只在設定 FANOUT_WORKERS 時建立；timeout 須小於 coordinator 扣除 RESUME_MARGIN_SECONDS 後的時間)
+        fanout_workers = int(os.environ.get("FANOUT_WORKERS", "0"))
+        fanout_settings = {}
+        if fanout_workers > 0:
+            collection_worker = _lambda.DockerImageFunction(
+                self,
+                "collection_worker",
+                code=_lambda.DockerImageCode.from_image_asset("./collection_layer"),
+                role=existing_role,
+                timeout=Duration.seconds(int(os.environ.get("FANOUT_WORKER_TIMEOUT", 600))),
+                memory_size=3008,
+                environment={
+                    "S3_BUCKET_NAME": os.environ["S3_BUCKET_NAME"],
+                    "S3_FOLDER_PREFIX": os.environ["S3_FOLDER_PREFIX"],
+                    **collection_settings,
+                },
+                description="collection layer fan-out worker deployed with Docker image via CDK",
+            )
+            # coordinator 呼叫 worker 的權限 (獨立的 policy，避免 role 與函式之間的循環相依)
+            iam.Policy(
+                self,
+                "CollectionFanoutInvokePolicy",
+                roles=[existing_role],
+                statements=[
+                    iam.PolicyStatement(actions=["lambda:InvokeFunction"], resources=[collection_worker.function_arn])
+                ],
+            )
+            fanout_settings["FANOUT_FUNCTION_NAME"] = collection_worker.function_name
+
         # Defines an AWS Lambda resource
         collection_layer = _lambda.DockerImageFunction(
             self,
@@ -58,9 +111,33 @@ class PipelineCdkStack(Stack):
                 "KAGGLE_USERNAME": KAGGLE_USERNAME.value_as_string,
                 "KAGGLE_KEY": KAGGLE_KEY.value_as_string,
                 "KAGGLE_CONFIG_DIR": "/tmp",
+                # 水平擴展模式須明確設定才啟用 (預設以 checkpoint 接續的單一函式執行)
+                "FANOUT_WORKERS": str(fanout_workers),
+                **collection_settings,
+                **fanout_settings,
             },
             description="collection layer function deployed with Docker image via CDK",
         )
+        # 執行時間不足時，collection layer 會記錄 checkpoint 並以非同步呼叫自己接續
+        # (以函式名稱的前綴授權，直接引用函式 ARN 會與 role 的 policy 形成循環相依)
+        iam.Policy(
+            self,
+            "CollectionSelfInvokePolicy",
+            roles=[existing_role],
+            statements=[
+                iam.PolicyStatement(
+                    actions=["lambda:InvokeFunction"],
+                    resources=[
+                        self.format_arn(
+                            service="lambda",
+                            resource="function",
+                            resource_name=f"{self.stack_name}-collectionlayer*",
+                            arn_format=ArnFormat.COLON_RESOURCE_NAME,
+                        )
+                    ],
+                )
+            ],
+        )
 
         data_process_layer = _lambda.DockerImageFunction(
             self,
@@ -71,6 +148,64 @@ class PipelineCdkStack(Stack):
             memory_size=512,
             environment={
                 "OPENSEARCH_HOST": OPENSEARCH_HOST.value_as_string,
+                "S3_BUCKET_NAME": os.environ["S3_BUCKET_NAME"],
+                "ROLLUPS_ENABLED": os.environ.get("ROLLUPS_ENABLED", "false"),
+                "AUTHOR_INDEX_ENABLED": os.environ.get("AUTHOR_INDEX_ENABLED", "false"),
             },
             description="data process layer function deployed with Docker image via CDK",
         )
+        # 啟用彙總時，定期將索引時寫入的彙總變化合併為儀表板用的表格 (單一排程執行，不與其他合併同時進行)
+        if os.environ.get("ROLLUPS_ENABLED", "false").lower() == "true":
+            events.Rule(
+                self,
+                "RollupCompactionSchedule",
+                schedule=events.Schedule.rate(Duration.minutes(int(os.environ.get("ROLLUP_COMPACT_MINUTES", 60)))),
+                targets=[
+                    targets.LambdaFunction(
+                        data_process_layer,
+                        event=events.RuleTargetInput.from_object({"rollups": "compact"}),
+                        retry_attempts=0,
+                    )
+                ],
+            )
+        # 啟用作者表時，定期將各次索引寫入的作者清單併入作者表 (與彙總相同由單一排程執行)
+        if os.environ.get("AUTHOR_INDEX_ENABLED", "false").lower() == "true":
+            events.Rule(
+                self,
+                "AuthorTableCompactionSchedule",
+                schedule=events.Schedule.rate(Duration.minutes(int(os.environ.get("AUTHOR_COMPACT_MINUTES", 360)))),
+                targets=[
+                    targets.LambdaFunction(
+                        data_process_layer,
+                        event=events.RuleTargetInput.from_object({"authors": "compact"}),
+                        retry_attempts=0,
+                    )
+                ],
+            )
+
+        # S3 的 chunk 上傳通知先進入 SQS，data process layer 每次批次處理多個 chunk
+        # (visibility timeout 依 AWS 建議設為函式 timeout 的 6 倍；多次失敗的訊息移至 DLQ)
+        chunk_dlq = sqs.Queue(self, "ChunkDeadLetterQueue", retention_period=Duration.days(14))
+        chunk_queue = sqs.Queue(
+            self,
+            "ChunkQueue",
+            visibility_timeout=Duration.seconds(900 * 6),
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=chunk_dlq),
+        )
+        bucket = s3.Bucket.from_bucket_name(self, "PipelineBucket", os.environ["S3_BUCKET_NAME"])
+        bucket.add_event_notification(
+            s3.EventType.OBJECT_CREATED,
+            s3n.SqsDestination(chunk_queue),
+            s3.NotificationKeyFilter(prefix="parsed_", suffix=".ndjson.gz"),
+        )
+        data_process_layer.add_event_source(
+            event_sources.SqsEventSource(
+                chunk_queue,
+                batch_size=int(os.environ.get("CHUNK_BATCH_SIZE", 10)),
+                max_batching_window=Duration.seconds(int(os.environ.get("CHUNK_BATCHING_WINDOW", 30))),
+                report_batch_item_failures=True,
+                # 避免大量 chunk 同時上傳時壓垮 OpenSearch
+                max_concurrency=int(os.environ.get("CHUNK_MAX_CONCURRENCY", 10)),
+            )
+        )
@@ -0,0 +1,99 @@
+"""
+去重階段的峰值記憶體 benchmark
+
+    python -m tests.benchmarks.bench_dedup --records 3000000
+
+以合成的快照比較原本以 dict 保存每個 id 的作法與定長欄位 + spill 檔 + 原地排序去重的作法，
+兩者各自在獨立的子行程中執行，分別回報峰值 RSS 與花費時間。
+compact 在單一行程內同時包含掃描 (worker) 與去重 (主行程) 的記憶體用量。
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from tests.benchmarks.synthetic import generate_snapshot
+from tests.layers import import_layer_module
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的單位為 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_dict(file_path: str) -> int:
+    """原本 process_metadata 的作法: 以 dict 保存每個 id 的最新 update_timestamp"""
+    arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+    id_update_map = {}
+    with open(file_path, encoding="utf-8") as file:
+        for line in file:
+            result = arxiv_metadata.process_single_item(json.loads(line))
+            if result["update_timestamp"] >= id_update_map.get(result["id"], 0):
+                id_update_map[result["id"]] = result["update_timestamp"]
+    return len(id_update_map)
+
+
+def run_compact(file_path: str) -> int:
+    arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+    dedup = import_layer_module("collection_layer", "utils.dedup")
+    snapshot_parser = import_layer_module("collection_layer", "utils.snapshot_parser")
+
+    byte_range = snapshot_parser.split_byte_ranges(file_path, 1)[0]
+    scan = arxiv_metadata.scan_range(byte_range, file_path)
+    return len(dedup.select_latest(dedup.load_spill_files([scan["spill"]])))
+
+
+METHODS = {"dict": run_dict, "compact": run_compact}
+
+
+def run_method(method: str, file_path: str) -> dict:
+    import_layer_module("collection_layer", "arxiv_metadata")
+    baseline_mb = peak_rss_mb()
+    st = time.time()
+    unique = METHODS[method](file_path)
+    return {
+        "method": method,
+        "unique_ids": unique,
+        "seconds": round(time.time() - st, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "import_rss_mb": round(baseline_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=3_000_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.02)
+    parser.add_argument("--abstract-words", type=int, default=150, help="每筆 abstract 的平均字數")
+    parser.add_argument("--method", choices=METHODS, help="僅執行單一方法 (供子行程使用)")
+    parser.add_argument("--file")
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(run_method(args.method, args.file)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "snapshot.json")
+        generate_snapshot(
+            file_path, args.records, duplicate_rate=args.duplicate_rate, abstract_words=args.abstract_words
+        )
+        print(f"synthetic snapshot: {args.records} records, {os.path.getsize(file_path) / 1024 / 1024:.0f} MB")
+
+        for method in METHODS:
+            output = subprocess.run(
+                [sys.executable, "-m", "tests.benchmarks.bench_dedup", "--method", method, "--file", file_path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            print(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+向量化 (utils.embedding) 的吞吐量 (papers/s)
+
+    python -m tests.benchmarks.bench_embedding --records 20000
+    python -m tests.benchmarks.bench_embedding --records 20000 --batch-sizes 500 5000 --dimensions 128 256 384
+
+對每個 batch 大小 / 維度量測: 首次計算 (含斷詞與 token 雜湊快取的建立)、token 快取已建立後的計算，
+以及內容未變動時直接由向量快取取得 (重送 / 重播的情況)。
+"""
+
+import argparse
+import json
+import time
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+
+
+def measure_embedding(records: list[dict], batch_size: int, dimension: int) -> dict:
+    embedding = import_layer_module("data_process_layer", "utils.embedding")
+    transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+    embedder = embedding.HashedTfidfEmbedder(dimension=dimension)
+    cache = embedding.EmbeddingCache(max_size=len(records))
+
+    def run(cache) -> float:
+        documents = list(transform_metadata.transform_metadata_batch(records))
+        st = time.perf_counter()
+        for _ in embedding.embed_documents(documents, embedder, cache, batch_size):
+            pass
+        return len(records) / max(time.perf_counter() - st, 1e-9)
+
+    # 前兩次不使用向量快取，第二次只省去 token 的雜湊
+    cold = run(embedding.EmbeddingCache(max_size=0))
+    warm = run(cache)
+    cached = run(cache)
+    return {
+        "cold_papers_per_s": round(cold),
+        "papers_per_s": round(warm),
+        "cached_papers_per_s": round(cached),
+        "cache_hits": cache.hits,
+    }
+
+
+def compare_embedding(records: list[dict], batch_sizes=(5000,), dimensions=(256,)) -> dict:
+    return {
+        f"batch{batch_size}_dim{dimension}": measure_embedding(records, batch_size, dimension)
+        for batch_size in batch_sizes
+        for dimension in dimensions
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[500, 5000])
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[128, 256])
+    args = parser.parse_args()
+
+    records = list(synthetic.iter_records(args.records))
+    for name, result in compare_embedding(records, args.batch_sizes, args.dimensions).items():
+        print(f"{name}: {json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main()
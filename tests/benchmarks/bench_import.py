@@ -0,0 +1,79 @@
+"""
+Lambda handler 的 import 時間 (冷啟動) benchmark
+
+    python -m tests.benchmarks.bench_import --repeat 5
+
+每次在新的直譯器中 import 各 layer 的 arxiv_metadata，取最短時間；
+超過預算或載入了應延遲載入的模組時以非 0 結束，可用於 CI 檢查冷啟動是否退化。
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from tests.layers import ROOT
+
+# 預算保留數倍於目前量測值的餘裕 (容許機器差異)，超過表示 import 路徑上多了重的依賴
+IMPORT_BUDGET_MS = {"collection_layer": 1000, "data_process_layer": 150}
+# 只在需要時才 import 的模組 (沒有新版本 / 沒有 chunk 時不會載入)
+LAZY_MODULES = {
+    "collection_layer": ["kaggle"],
+    "data_process_layer": ["boto3", "opensearchpy", "requests_aws4auth"],
+}
+
+PROBE = """
+import json, sys, time
+st = time.perf_counter()
+import arxiv_metadata
+elapsed = time.perf_counter() - st
+print(json.dumps({"ms": elapsed * 1000, "loaded": [name for name in sys.argv[1:] if name in sys.modules]}))
+"""
+
+
+def measure_import(layer: str, repeat: int = 3) -> dict:
+    """
+    在新的直譯器中 import layer 的 handler
+
+    Returns:
+        dict: 最短的 import 時間 (ms) 與已載入的延遲載入模組
+    """
+    runs = []
+    for _ in range(max(repeat, 1)):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE, *LAZY_MODULES[layer]],
+            cwd=ROOT / layer,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {"ms": round(min(run["ms"] for run in runs), 1), "loaded": runs[-1]["loaded"]}
+
+
+def check_budget(layer: str, result: dict) -> list[str]:
+    problems = []
+    if result["ms"] > IMPORT_BUDGET_MS[layer]:
+        problems.append(f"{layer}: import {result['ms']} ms 超過預算 {IMPORT_BUDGET_MS[layer]} ms")
+    if result["loaded"]:
+        problems.append(f"{layer}: import 時載入了應延遲載入的模組 {result['loaded']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    problems = []
+    for layer in IMPORT_BUDGET_MS:
+        result = measure_import(layer, args.repeat)
+        print(f"{layer}: {json.dumps(result)} (預算 {IMPORT_BUDGET_MS[layer]} ms)")
+        problems += check_budget(layer, result)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
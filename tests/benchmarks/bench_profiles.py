@@ -0,0 +1,106 @@
+"""
+比較各文件格式 (DOCUMENT_PROFILE) 的索引大小與索引速度
+
+    python -m tests.benchmarks.bench_profiles --records 20000
+    python -m tests.benchmarks.bench_profiles --records 20000 --opensearch
+
+預設對 _bulk 替身索引，只量測轉換 + 索引的吞吐量與送出的 source 大小；
+--opensearch 時以 .env 的 OPENSEARCH_* 設定連線至實際的叢集，為每個格式建立暫時的索引，
+額外回報 Lucene 文件數 (含 nested 的隱藏文件) 與 primary 的儲存大小，量測後刪除索引。
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import time
+
+from tests.benchmarks import synthetic
+from tests.benchmarks.standins import local_opensearch
+from tests.layers import ROOT, activate_layer, import_layer_module
+
+
+def load_mappings():
+    """create_index_with_mapping/main.py 不是套件，以檔案路徑載入"""
+    activate_layer("data_process_layer")
+    spec = importlib.util.spec_from_file_location("create_index_main", ROOT / "create_index_with_mapping" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.get_papers_mappings
+
+
+def measure_profile(client, profile: str, records: list[dict], index_stats: bool = False) -> dict:
+    """
+    以 profile 轉換並索引 records
+
+    Args:
+        index_stats (bool): client 為實際的叢集時，建立暫時的索引並回報文件數與儲存大小
+
+    Returns:
+        dict: 吞吐量、平均 source 大小與 (index_stats 時) 索引統計
+    """
+    transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+    index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+    index_name = f"arxiv-papers-bench-{profile}"
+    source_bytes = sum(
+        len(index_to_db.build_entry(index_name, doc).data)
+        for doc in transform_metadata.transform_metadata_batch(records, profile)
+    )
+
+    if index_stats:
+        if client.indices.exists(index=index_name):
+            client.indices.delete(index=index_name)
+        client.indices.create(index=index_name, body=load_mappings()(profile))
+    try:
+        st = time.perf_counter()
+        success, failed = index_to_db.bulk_index_documents(
+            index_name,
+            transform_metadata.transform_metadata_batch(records, profile),
+            client=client,
+            skip_unchanged=False,
+        )
+        seconds = max(time.perf_counter() - st, 1e-9)
+        result = {
+            "docs_per_s": round(success / seconds),
+            "failed": failed,
+            "avg_source_bytes": round(source_bytes / len(records)),
+        }
+        if index_stats:
+            client.indices.refresh(index=index_name)
+            client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+            primaries = client.indices.stats(index=index_name, metric="docs,store")["_all"]["primaries"]
+            result.update(
+                lucene_docs=primaries["docs"]["count"],
+                store_mb=round(primaries["store"]["size_in_bytes"] / 1024 / 1024, 2),
+            )
+        return result
+    finally:
+        if index_stats:
+            client.indices.delete(index=index_name)
+
+
+def compare_profiles(client, records: list[dict], index_stats: bool = False) -> dict:
+    transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+    return {profile: measure_profile(client, profile, records, index_stats) for profile in transform_metadata.PROFILES}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--opensearch", action="store_true", help="連線至 .env 設定的 OpenSearch 叢集量測索引大小")
+    args = parser.parse_args()
+    logging.getLogger("opensearch").setLevel(logging.WARNING)
+
+    records = list(synthetic.iter_records(args.records))
+    if args.opensearch:
+        opensearch_client = import_layer_module("data_process_layer", "utils.opensearch_client")
+        results = compare_profiles(opensearch_client.get_open_search_client(), records, index_stats=True)
+    else:
+        with local_opensearch() as (client, _):
+            results = compare_profiles(client, records)
+    for profile, result in results.items():
+        print(f"{profile}: {json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main()
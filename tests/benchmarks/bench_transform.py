@@ -0,0 +1,129 @@
+"""
+transform_metadata 的 micro-benchmark
+
+    python -m tests.benchmarks.bench_transform --records 50000
+
+以合成記錄比較原本的實作 (strptime 解析每個版本時間、每個分類 split 三次、
+每位作者呼叫 format_author_to_fullname) 與目前的實作，並確認兩者輸出相同。
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+
+
+def legacy_parse_gmt_time(gmt_time_string: str) -> int:
+    time_without_gmt = gmt_time_string.replace(" GMT", "")
+    return int(datetime.strptime(time_without_gmt, "%a, %d %b %Y %H:%M:%S").timestamp())
+
+
+def legacy_extract_versions(versions):
+    outputs = []
+    for version in versions:
+        created_time = legacy_parse_gmt_time(version["created"])
+        if created_time:
+            outputs.append(
+                {"version": version["version"], "created_str": version["created"], "created_timestamp": created_time}
+            )
+    return outputs
+
+
+def legacy_extract_categories(categories_str):
+    categories_obj = []
+    for category in categories_str.split(" "):
+        categories_obj.append(
+            {
+                "full_category": category,
+                "category": category.split(".")[0],
+                "subcategory": category.split(".")[1] if len(category.split(".")) > 1 else None,
+            }
+        )
+    return categories_obj
+
+
+def legacy_format_author_to_fullname(author_data):
+    suffix = author_data[2] if len(author_data) > 2 else ""
+    parts = [author_data[0], author_data[1]]
+    if suffix:
+        parts.append(suffix)
+    return " ".join(filter(None, parts)).strip()
+
+
+def legacy_extract_authors(authors_parsed):
+    authors_obj = []
+    for author in authors_parsed:
+        if not isinstance(author, list) or len(author) < 2:
+            raise ValueError(f"Each author must be a list with at least 2 elements: {author}")
+        authors_obj.append(
+            {
+                "fullname": legacy_format_author_to_fullname(author),
+                "keyname": author[0],
+                "firstname": author[1],
+                "suffix": author[2] if len(author) > 2 else "",
+                "affiliation": author[3:],
+            }
+        )
+    return authors_obj
+
+
+def legacy_transform_metadata(metadata):
+    """原本 (最佳化前) 的 transform_metadata，作為輸出一致性的基準"""
+    return {
+        "id": str(metadata["id"]),
+        "submitter": metadata.get("submitter"),
+        "title": metadata.get("title"),
+        "comments": metadata.get("comments"),
+        "journal-ref": metadata.get("journal-ref"),
+        "doi": metadata.get("doi"),
+        "report-no": metadata.get("report-no"),
+        "license": metadata.get("license"),
+        "abstract": metadata.get("abstract"),
+        "versions": legacy_extract_versions(metadata["versions"]),
+        "version_count": len(metadata.get("versions", [])),
+        "categories": legacy_extract_categories(metadata.get("categories")),
+        "update_date": metadata.get("update_date"),
+        "update_date_datetime": metadata.get("update_date_datetime"),
+        "authors": metadata.get("authors"),
+        "authors_parsed": metadata.get("authors_parsed"),
+        "authors_full_info": legacy_extract_authors(metadata.get("authors_parsed")),
+    }
+
+
+def make_records(count: int, seed: int = 42) -> list[dict]:
+    return list(synthetic.iter_records(count, seed=seed))
+
+
+def measure(transform, records: list[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        st = time.perf_counter()
+        for _ in transform(records):
+            pass
+        best = min(best, time.perf_counter() - st)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+    records = make_records(args.records)
+    assert list(transform_metadata.transform_metadata_batch(records)) == [
+        legacy_transform_metadata(record) for record in records
+    ]
+
+    legacy = measure(lambda items: map(legacy_transform_metadata, items), records, args.repeat)
+    current = measure(transform_metadata.transform_metadata_batch, records, args.repeat)
+    print(f"legacy : {args.records / legacy:,.0f} records/s")
+    print(f"current: {args.records / current:,.0f} records/s")
+    print(f"speedup: {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
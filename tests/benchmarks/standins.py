@@ -0,0 +1,98 @@
+"""benchmark 使用的本機 S3 / OpenSearch 替身"""
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+
+
+@contextmanager
+def local_s3(bucket: str = "arxiv-benchmark", endpoint_url: str | None = None):
+    """
+    提供可上傳的 S3 bucket
+
+    未指定 endpoint_url 時以 moto 在行程內模擬 (fork 出的子行程各自保有一份狀態)；
+    指定時連線至實際的本機 S3 相容服務 (例如 MinIO)。
+    """
+    from tests.layers import import_layer_module
+
+    s3 = import_layer_module("collection_layer", "utils.s3")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    s3._clients.clear()
+
+    if endpoint_url:
+        os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+        try:
+            boto3.client("s3").create_bucket(Bucket=bucket)
+            yield bucket
+        finally:
+            del os.environ["AWS_ENDPOINT_URL"]
+            s3._clients.clear()
+        return
+
+    from moto import mock_aws
+
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=bucket)
+        yield bucket
+    s3._clients.clear()
+
+
+class BulkStandIn(BaseHTTPRequestHandler):
+    """只實作 _bulk (與回傳皆不存在的 _mget) 的 OpenSearch 替身，可設定每個 request 的延遲與整批回傳 429 的比例"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        time.sleep(server.latency)
+        if self.path.split("?")[0].endswith("/_mget"):
+            # 替身不保存文件，每次都視為新文件 (與首次載入相同，沒有可略過的文件)
+            ids = json.loads(body)["ids"]
+            return self.respond(200, {"docs": [{"_id": doc_id, "found": False} for doc_id in ids]})
+        with server.lock:
+            server.requests += 1
+            throttled = server.rng.random() < server.throttle_rate
+        if throttled:
+            return self.respond(429, {"error": "Too Many Requests", "status": 429})
+
+        items = [{"index": {"_id": json.loads(line)["index"]["_id"], "status": 201}} for line in body.splitlines()[::2]]
+        with server.lock:
+            server.indexed += len(items)
+        self.respond(200, {"took": 1, "errors": False, "items": items})
+
+    def respond(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_opensearch(latency: float = 0.0, throttle_rate: float = 0.0, seed: int = 42):
+    """啟動 _bulk 替身並回傳指向它的 OpenSearch client 與 server (可讀取 requests / indexed 統計)"""
+    from opensearchpy import OpenSearch
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BulkStandIn)
+    server.lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.latency = latency
+    server.throttle_rate = throttle_rate
+    server.requests = 0
+    server.indexed = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield OpenSearch(hosts=[{"host": "127.0.0.1", "port": server.server_port}], max_retries=0), server
+    finally:
+        server.shutdown()
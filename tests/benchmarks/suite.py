@@ -0,0 +1,237 @@
+"""
+效能 benchmark suite
+
+    python -m tests.benchmarks.suite --records 20000
+    python -m tests.benchmarks.suite --records 20000 --compare tests/benchmarks/results/<commit>.json
+
+以合成快照量測各階段的吞吐量，S3 與 OpenSearch 皆使用本機替身 (tests/benchmarks/standins.py)：
+- process_metadata: 掃描、去重與輸出 chunk 的完整流程，以及未變動時的增量執行
+- transform: transform_metadata_batch 與各個 extract_* 函式
+- chunk_format: NDJSON chunk 的寫入 (壓縮) 與逐筆讀取
+- bulk_index: bulk_index_documents 對 _bulk 替身的索引速度
+- profiles: 各文件格式的索引速度與 source 大小 (tests/benchmarks/bench_profiles.py，索引大小須以實際叢集量測)
+- embedding: 標題 + 摘要向量化的吞吐量 (papers/s，tests/benchmarks/bench_embedding.py)
+- import_time: 各 layer handler 的 import 時間 (tests/benchmarks/bench_import.py)
+
+結果以 JSON 寫入 tests/benchmarks/results/<commit>.json，--compare 可與先前的結果比較。
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+from tests.benchmarks import synthetic
+from tests.benchmarks.bench_embedding import compare_embedding
+from tests.benchmarks.bench_import import IMPORT_BUDGET_MS, measure_import
+from tests.benchmarks.bench_profiles import compare_profiles
+from tests.benchmarks.standins import local_opensearch, local_s3
+from tests.layers import import_layer_module
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def timed(func, *args, **kwargs) -> tuple[object, float]:
+    st = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, max(time.perf_counter() - st, 1e-9)
+
+
+def bench_process_metadata(args, tmp_dir: str) -> dict:
+    arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+    file_path = os.path.join(tmp_dir, "snapshot.json")
+    snapshot = synthetic.generate_snapshot(file_path, args.records, duplicate_rate=args.duplicate_rate)
+    megabytes = snapshot["bytes"] / 1024 / 1024
+
+    with local_s3(endpoint_url=args.s3_endpoint) as bucket:
+        arxiv_metadata.S3_BUCKET_NAME = bucket
+        (processed, manifest), full_seconds = timed(
+            arxiv_metadata.process_metadata, file_path, "1", None, workers=args.workers
+        )
+        # 相同快照再執行一次增量模式: 只掃描與比對，不輸出任何 chunk
+        (unchanged, _), delta_seconds = timed(
+            arxiv_metadata.process_metadata, file_path, "2", manifest, workers=args.workers
+        )
+
+    return {
+        "records": args.records,
+        "unique_ids": len(manifest),
+        "processed": processed,
+        "snapshot_mb": round(megabytes, 1),
+        "seconds": round(full_seconds, 3),
+        "records_per_s": round(args.records / full_seconds),
+        "mb_per_s": round(megabytes / full_seconds, 1),
+        "delta_seconds": round(delta_seconds, 3),
+        "delta_emitted": unchanged,
+    }
+
+
+def bench_transform(args, records: list[dict]) -> dict:
+    transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+    handle_versions = import_layer_module("data_process_layer", "utils.handle_versions")
+    handle_categories = import_layer_module("data_process_layer", "utils.handle_categories")
+    handle_authors = import_layer_module("data_process_layer", "utils.handle_authors")
+
+    _, batch_seconds = timed(lambda: sum(1 for _ in transform_metadata.transform_metadata_batch(records)))
+    _, versions_seconds = timed(lambda: [handle_versions.extract_versions(r["versions"]) for r in records])
+    _, categories_seconds = timed(lambda: [handle_categories.extract_categories(r["categories"]) for r in records])
+    _, authors_seconds = timed(lambda: [handle_authors.extract_authors(r["authors_parsed"]) for r in records])
+    return {
+        "records": len(records),
+        "transform_records_per_s": round(len(records) / batch_seconds),
+        "extract_versions_records_per_s": round(len(records) / versions_seconds),
+        "extract_categories_records_per_s": round(len(records) / categories_seconds),
+        "extract_authors_records_per_s": round(len(records) / authors_seconds),
+    }
+
+
+def bench_chunk_format(args, records: list[dict]) -> dict:
+    writer_format = import_layer_module("collection_layer", "utils.chunk_format")
+    reader_format = import_layer_module("data_process_layer", "utils.chunk_format")
+    uploads = []
+
+    def write():
+        writer = writer_format.NdjsonChunkWriter("parsed_1/metadata-000", upload=lambda *upload: uploads.append(upload))
+        for record in records:
+            writer.append(record)
+        writer.flush()
+
+    _, write_seconds = timed(write)
+    raw_bytes = sum(int(metadata["uncompressed-bytes"]) for _, _, metadata in uploads)
+    compressed_bytes = sum(len(body) for _, body, _ in uploads)
+
+    def read():
+        return sum(1 for key, body, _ in uploads for _ in reader_format.iter_chunk_records(io.BytesIO(body), key))
+
+    read_count, read_seconds = timed(read)
+    assert read_count == len(records)
+    return {
+        "records": len(records),
+        "chunks": len(uploads),
+        "compression_ratio": round(raw_bytes / compressed_bytes, 2),
+        "write_mb_per_s": round(raw_bytes / 1024 / 1024 / write_seconds, 1),
+        "read_records_per_s": round(read_count / read_seconds),
+    }
+
+
+def bench_bulk_index(args, records: list[dict]) -> dict:
+    transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+    index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+    index_to_db.BULK_BACKOFF_BASE = 0.01
+
+    results = {}
+    for name, throttle_rate in (("healthy", 0.0), ("throttled", args.throttle_rate)):
+        with local_opensearch(latency=args.bulk_latency, throttle_rate=throttle_rate) as (client, server):
+            controller = index_to_db.BulkController()
+            (success, failed), seconds = timed(
+                index_to_db.bulk_index_documents,
+                "arxiv-papers",
+                transform_metadata.transform_metadata_batch(records),
+                client=client,
+                controller=controller,
+            )
+        results[name] = {
+            "docs_per_s": round(success / seconds),
+            "failed": failed,
+            "requests": server.requests,
+            "throttled": controller.throttled,
+            "final_batch_docs": controller.batch_docs,
+            "final_concurrency": controller.concurrency,
+        }
+    return results
+
+
+def bench_profiles(args, records: list[dict]) -> dict:
+    with local_opensearch(latency=args.bulk_latency) as (client, _):
+        return compare_profiles(client, records)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, int | float) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(current: dict, previous_path: str) -> None:
+    with open(previous_path, encoding="utf-8") as file:
+        previous = json.load(file)
+    before, after = flatten(previous["results"]), flatten(current["results"])
+    print(f"\n與 {previous['commit']} 比較:")
+    for key in sorted(before.keys() & after.keys()):
+        if before[key]:
+            print(f"  {key}: {before[key]} -> {after[key]} ({(after[key] - before[key]) / before[key]:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bulk-latency", type=float, default=0.005, help="_bulk 替身每個 request 的延遲 (秒)")
+    parser.add_argument("--throttle-rate", type=float, default=0.2, help="_bulk 替身整批回傳 429 的比例")
+    parser.add_argument("--s3-endpoint", help="本機 S3 相容服務的 endpoint，未指定時使用 moto")
+    parser.add_argument("--only", nargs="*", help="只執行指定的 benchmark")
+    parser.add_argument("--output", help="結果 JSON 路徑，預設為 tests/benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="先前的結果 JSON，列出各項指標的變化")
+    args = parser.parse_args()
+    logging.getLogger("opensearch").setLevel(logging.WARNING)
+
+    records = list(synthetic.iter_records(args.records, duplicate_rate=args.duplicate_rate))
+    benchmarks = {
+        "process_metadata": lambda tmp_dir: bench_process_metadata(args, tmp_dir),
+        "transform": lambda tmp_dir: bench_transform(args, records),
+        "chunk_format": lambda tmp_dir: bench_chunk_format(args, records),
+        "bulk_index": lambda tmp_dir: bench_bulk_index(args, records),
+        "profiles": lambda tmp_dir: bench_profiles(args, records),
+        "embedding": lambda tmp_dir: compare_embedding(records),
+        "import_time": lambda tmp_dir: {layer: measure_import(layer)["ms"] for layer in IMPORT_BUDGET_MS},
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, benchmark in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = benchmark(tmp_dir)
+            print(f"{name}: {json.dumps(results[name], ensure_ascii=False)}")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    print(f"結果已寫入 {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+產生與 arxiv-metadata-oai-snapshot.json 格式相同的合成快照
+
+    python -m tests.benchmarks.synthetic --records 100000 --output /tmp/snapshot.json
+
+每篇論文的內容由 (seed, 論文編號) 決定；重複出現的論文會多一個版本並更新 update_date，
+與實際快照中同一 id 被更新的情況相同。
+"""
+
+import argparse
+import json
+import os
+import random
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+CATEGORIES = [
+    "hep-ph",
+    "hep-th",
+    "hep-ex",
+    "gr-qc",
+    "quant-ph",
+    "math.CO",
+    "math.AG",
+    "math.PR",
+    "cs.LG",
+    "cs.CL",
+    "cs.CV",
+    "stat.ML",
+    "astro-ph.GA",
+    "astro-ph.CO",
+    "cond-mat.str-el",
+    "cond-mat.mes-hall",
+    "physics.optics",
+    "q-bio.NC",
+    "econ.EM",
+    "eess.SP",
+]
+KEYNAMES = ["Smith", "Wang", "Müller", "Kim", "García", "Nakamura", "Rossi", "Ivanov", "Chen", "Dubois", "Balázs"]
+FIRSTNAMES = ["A.", "J.", "Maria", "Wei", "E. L.", "Hiroshi", "Anna", "P.", "Jean-Pierre", "Li"]
+SUFFIXES = ["", "", "", "", "", "", "Jr", "III"]
+AFFILIATIONS = ["MIT", "CERN", "University of Tokyo", "ETH Zurich", "Academia Sinica"]
+WORDS = (
+    "we study the quantum graph neural lattice galaxy entropy operator manifold model field theory "
+    "spectrum network learning bound estimate symmetry dynamics observation data phase transition"
+).split()
+LICENSES = [None, "http://arxiv.org/licenses/nonexclusive-distrib/1.0/", "http://creativecommons.org/licenses/by/4.0/"]
+FIRST_SUBMISSION = datetime(1991, 8, 14)
+SUBMISSION_SPAN_SECONDS = 34 * 365 * 86400
+
+
+def make_paper(
+    paper_index: int,
+    revision: int = 0,
+    max_versions: int = 3,
+    max_authors: int = 6,
+    abstract_words: int = 150,
+    seed: int = 42,
+) -> dict:
+    """
+    產生單篇論文的 metadata
+
+    Args:
+        paper_index (int): 論文編號，決定 id 與內容
+        revision (int): 第幾次更新，每次更新多一個版本並延後 update_date
+        max_versions (int): 初始版本數上限
+        max_authors (int): 作者數上限
+        abstract_words (int): abstract 的平均字數
+        seed (int): 亂數種子
+    """
+    rng = random.Random(seed * 1_000_003 + paper_index)
+    created = FIRST_SUBMISSION + timedelta(seconds=rng.randrange(SUBMISSION_SPAN_SECONDS))
+    version_count = rng.randint(1, max(max_versions, 1)) + revision
+    version_times = [
+        created + timedelta(days=45 * number, seconds=rng.randrange(86400)) for number in range(version_count)
+    ]
+
+    authors_parsed = []
+    for _ in range(rng.randint(1, max(max_authors, 1))):
+        author = [rng.choice(KEYNAMES), rng.choice(FIRSTNAMES), rng.choice(SUFFIXES)]
+        if rng.random() < 0.15:
+            author.append(rng.choice(AFFILIATIONS))
+        authors_parsed.append(author)
+
+    words = rng.choices(WORDS, k=max(rng.randint(abstract_words // 2, abstract_words * 3 // 2), 1))
+    return {
+        "id": f"{created:%y%m}.{paper_index:05d}",
+        "submitter": f"{authors_parsed[0][1]} {authors_parsed[0][0]}",
+        "authors": ", ".join(f"{author[1]} {author[0]}" for author in authors_parsed),
+        "title": " ".join(rng.choices(WORDS, k=rng.randint(4, 12))).capitalize(),
+        "comments": f"{rng.randint(4, 60)} pages, {rng.randint(0, 20)} figures" if rng.random() < 0.7 else None,
+        "journal-ref": f"Phys.Rev.D{rng.randint(1, 110)}:{rng.randint(1, 99999):06d},{created.year}"
+        if rng.random() < 0.3
+        else None,
+        "doi": f"10.1103/PhysRevD.{rng.randint(1, 110)}.{rng.randint(1, 99999):06d}" if rng.random() < 0.4 else None,
+        "report-no": None,
+        "categories": " ".join(rng.sample(CATEGORIES, rng.randint(1, 3))),
+        "license": rng.choice(LICENSES),
+        "abstract": "  " + " ".join(words) + ".\n",
+        "versions": [
+            {"version": f"v{number + 1}", "created": f"{time:%a}, {time.day} {time:%b %Y %H:%M:%S} GMT"}
+            for number, time in enumerate(version_times)
+        ],
+        "update_date": f"{version_times[-1] + timedelta(days=rng.randint(0, 30)):%Y-%m-%d}",
+        "authors_parsed": authors_parsed,
+    }
+
+
+def iter_records(
+    count: int,
+    duplicate_rate: float = 0.02,
+    max_versions: int = 3,
+    max_authors: int = 6,
+    abstract_words: int = 150,
+    seed: int = 42,
+) -> Iterator[dict]:
+    """
+    依序產生 count 筆記錄，其中約 duplicate_rate 比例為先前論文的更新版本
+
+    Yields:
+        dict: 單筆 metadata
+    """
+    rng = random.Random(seed)
+    revisions: dict[int, int] = {}
+    paper_count = 0
+    for _ in range(count):
+        if paper_count and rng.random() < duplicate_rate:
+            paper_index = rng.randrange(paper_count)
+            revisions[paper_index] = revisions.get(paper_index, 0) + 1
+            revision = revisions[paper_index]
+        else:
+            paper_index, revision = paper_count, 0
+            paper_count += 1
+        yield make_paper(paper_index, revision, max_versions, max_authors, abstract_words, seed)
+
+
+def generate_snapshot(file_path: str, records: int, **options) -> dict:
+    """
+    寫出 NDJSON 格式的合成快照
+
+    Returns:
+        dict: 筆數、不重複論文數與檔案大小
+    """
+    ids = set()
+    with open(file_path, "w", encoding="utf-8") as file:
+        for record in iter_records(records, **options):
+            ids.add(record["id"])
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return {"records": records, "unique_ids": len(ids), "bytes": os.path.getsize(file_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.02)
+    parser.add_argument("--max-versions", type=int, default=3)
+    parser.add_argument("--max-authors", type=int, default=6)
+    parser.add_argument("--abstract-words", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    stats = generate_snapshot(
+        args.output,
+        args.records,
+        duplicate_rate=args.duplicate_rate,
+        max_versions=args.max_versions,
+        max_authors=args.max_authors,
+        abstract_words=args.abstract_words,
+        seed=args.seed,
+    )
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
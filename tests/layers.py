@@ -0,0 +1,38 @@
+"""
+兩個 Lambda 的程式碼各自以 `utils` 為頂層套件 (Docker image 的 LAMBDA_TASK_ROOT)，
+測試時需切換 sys.path / sys.modules 才能分別載入。
+"""
+
+import importlib
+import sys
+from pathlib import Path
+from types import ModuleType
+
+ROOT = Path(__file__).resolve().parents[1]
+LAYERS = ("collection_layer", "data_process_layer")
+
+_layer_modules: dict[str, dict[str, ModuleType]] = {}
+
+
+def _is_layer_module(name: str) -> bool:
+    return name in ("utils", "arxiv_metadata") or name.startswith("utils.")
+
+
+def activate_layer(layer: str) -> None:
+    """讓 `layer` 的 utils / arxiv_metadata 成為目前可 import 的模組"""
+    for name in [name for name in sys.modules if _is_layer_module(name)]:
+        del sys.modules[name]
+    sys.modules.update(_layer_modules.get(layer, {}))
+
+    for other in LAYERS:
+        path = str(ROOT / other)
+        if path in sys.path:
+            sys.path.remove(path)
+    sys.path.insert(0, str(ROOT / layer))
+
+
+def import_layer_module(layer: str, module: str) -> ModuleType:
+    activate_layer(layer)
+    imported = importlib.import_module(module)
+    _layer_modules[layer] = {name: mod for name, mod in sys.modules.items() if _is_layer_module(name)}
+    return imported
@@ -0,0 +1,38 @@
+import gzip
+import json
+
+import pytest
+
+from tests.layers import activate_layer, import_layer_module
+
+
+@pytest.fixture(autouse=True)
+def _collection_layer():
+    activate_layer("collection_layer")
+
+
+@pytest.fixture
+def uploaded_chunks(tmp_path, monkeypatch):
+    """
+    以寫入本機檔案取代 chunk 上傳 (子行程也能寫入)，回傳讀取已上傳記錄的函式
+
+    讀取函式回傳上次讀取後上傳的記錄 (依 key 排序後串接)，並清除已讀取的 chunk。
+    """
+    arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+    output_dir = tmp_path / "chunks"
+    output_dir.mkdir()
+
+    def fake_upload(uploader, key, body, metadata):
+        (output_dir / key.replace("/", "_")).write_bytes(body)
+
+    def read_records():
+        records = []
+        for chunk in sorted(output_dir.iterdir()):
+            header, *lines = gzip.decompress(chunk.read_bytes()).splitlines()
+            assert json.loads(header)["record_count"] == len(lines)
+            records.extend(json.loads(line) for line in lines)
+            chunk.unlink()
+        return records
+
+    monkeypatch.setattr(arxiv_metadata, "upload_chunk", fake_upload)
+    return read_records
@@ -0,0 +1,70 @@
+import gzip
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.layers import import_layer_module
+
+s3 = import_layer_module("collection_layer", "utils.s3")
+checkpoint = import_layer_module("collection_layer", "utils.checkpoint")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+
+BUCKET = "arxiv-test"
+
+
+@pytest.fixture
+def chunk_uploads(monkeypatch):
+    """在同一行程中執行各 range (moto 的狀態不會跨 fork)，記錄每次上傳的 chunk"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    uploads = []
+    monkeypatch.setattr(
+        arxiv_metadata, "upload_chunk", lambda uploader, key, body, metadata: uploads.append((key, body))
+    )
+    monkeypatch.setattr(arxiv_metadata, "run_in_processes", lambda func, tasks, workers: [func(task) for task in tasks])
+    monkeypatch.setattr(arxiv_metadata, "CHUNK_MAX_RECORDS", 4)
+    with mock_aws():
+        monkeypatch.setattr(s3, "_clients", {})
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield uploads
+
+
+def read_ids(uploads):
+    return [json.loads(line)["id"] for _, body in uploads for line in gzip.decompress(body).splitlines()[1:]]
+
+
+def test_suspended_runs_resume_without_duplicate_chunks(tmp_path, chunk_uploads):
+    file_path = tmp_path / "snapshot.json"
+    lines = [json.dumps({"id": f"{index:04d}", "update_date": "2024-01-02"}) for index in range(50)]
+    file_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    full_count, _ = arxiv_metadata.process_metadata(str(file_path), "1", workers=3)
+    expected = sorted(chunk_uploads)
+    chunk_uploads.clear()
+
+    run = checkpoint.RunCheckpoint(BUCKET, "1")
+    suspensions = 0
+    while True:
+        try:
+            # deadline 已過: 每個 range 每次只輸出一個 chunk 就停止
+            processed, manifest = arxiv_metadata.process_metadata(
+                str(file_path), "1", workers=3, checkpoint=run, deadline=0
+            )
+            break
+        except checkpoint.RunSuspended:
+            suspensions += 1
+            assert suspensions < 20
+
+    keys = [key for key, _ in chunk_uploads]
+    assert len(keys) == len(set(keys))
+    assert sorted(chunk_uploads) == expected
+    assert processed == full_count == 50
+    assert sorted(read_ids(chunk_uploads)) == [f"{index:04d}" for index in range(50)]
+    assert len(manifest) == 50
+    assert suspensions >= 3
+
+    run.clear()
+    assert run.load_state() is None
@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+
+from tests.layers import import_layer_module
+
+dedup = import_layer_module("collection_layer", "utils.dedup")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+
+
+def test_select_latest_keeps_newest_then_last_occurrence():
+    buffer = dedup.ScanBuffer()
+    buffer.add(1, 10, 100, 0)
+    buffer.add(2, 10, 200, 10)
+    buffer.add(1, 30, 101, 20)
+    buffer.add(1, 20, 102, 30)
+    buffer.add(2, 10, 201, 40)
+
+    latest = dedup.select_latest(buffer.to_array())
+    assert latest["id_hash"].tolist() == [1, 2]
+    assert latest["content_hash"].tolist() == [101, 201]
+    assert len(dedup.select_latest(np.empty(0, dtype=dedup.SCAN_DTYPE))) == 0
+
+
+def test_duplicates_across_chunks_and_ranges_emit_only_latest(tmp_path, uploaded_chunks):
+    lines = [json.dumps({"id": f"{i:04d}", "update_date": "2024-01-01", "title": "old"}) for i in range(3000)]
+    # 較新的版本出現在檔案後段 (不同 chunk / range)，較舊的重複出現在最後
+    lines.append(json.dumps({"id": "0005", "update_date": "2024-02-01", "title": "new"}))
+    lines.append(json.dumps({"id": "0006", "update_date": "2023-12-01", "title": "older"}))
+    file_path = tmp_path / "snapshot.json"
+    file_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    processed, next_manifest = arxiv_metadata.process_metadata(str(file_path), "1", workers=3)
+
+    records = uploaded_chunks()
+    by_id = {record["id"]: record for record in records}
+    assert processed == len(records) == len(by_id) == len(next_manifest) == 3000
+    assert by_id["0005"]["title"] == "new"
+    assert by_id["0006"]["title"] == "old"
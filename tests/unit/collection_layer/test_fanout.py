@@ -0,0 +1,155 @@
+import json
+
+import boto3
+import numpy as np
+import pytest
+from moto import mock_aws
+
+from tests.layers import import_layer_module
+
+s3 = import_layer_module("collection_layer", "utils.s3")
+fanout = import_layer_module("collection_layer", "utils.fanout")
+dedup = import_layer_module("collection_layer", "utils.dedup")
+manifest = import_layer_module("collection_layer", "utils.manifest")
+snapshot_parser = import_layer_module("collection_layer", "utils.snapshot_parser")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+
+BUCKET = "arxiv-test"
+SNAPSHOT_KEY = "fanout/1/arxiv-metadata-oai-snapshot.json"
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    """將快照放上 moto S3 (worker 在同一行程中執行，moto 的狀態不會跨 fork)"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(fanout, "PROBE_SIZE", 16)
+    # 同一 id 的更新版本分散在不同 shard，並夾雜一行錯誤資料
+    lines = [
+        json.dumps({"id": f"{index % 40:04d}", "update_date": f"2024-01-{index // 40 + 1:02d}"}) for index in range(100)
+    ]
+    lines[57] = "{broken"
+    file_path = tmp_path / "snapshot.json"
+    file_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    with mock_aws():
+        monkeypatch.setattr(s3, "_clients", {})
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        client.upload_file(str(file_path), BUCKET, SNAPSHOT_KEY)
+        yield file_path
+
+
+def test_s3_byte_ranges_match_local_split(snapshot):
+    size = snapshot.stat().st_size
+    for parts in (1, 3, 7):
+        expected = snapshot_parser.split_byte_ranges(str(snapshot), parts)
+        assert fanout.split_s3_byte_ranges(BUCKET, SNAPSHOT_KEY, size, parts) == expected
+
+    byte_range = expected[2]
+    offsets = np.array([offset for offset, _ in snapshot_parser.iter_range_lines(str(snapshot), byte_range)][1::2])
+    assert list(fanout.iter_s3_lines_at(BUCKET, SNAPSHOT_KEY, byte_range, offsets)) == list(
+        snapshot_parser.iter_lines_at(str(snapshot), offsets)
+    )
+
+
+def test_fanout_matches_single_process(snapshot, uploaded_chunks, monkeypatch):
+    monkeypatch.setattr(arxiv_metadata, "CHUNK_MAX_RECORDS", 4)
+    # 上一次已處理過相同內容的 0003，不再輸出
+    unchanged_line = snapshot.read_bytes().splitlines()[83]
+    previous = manifest.StateManifest.from_entries(
+        np.array(
+            [
+                (
+                    manifest.hash_id("0003"),
+                    arxiv_metadata.date_to_timestamp("2024-01-03"),
+                    manifest.hash_content(unchanged_line),
+                    0,
+                )
+            ],
+            dtype=dedup.SCAN_DTYPE,
+        )
+    )
+    expected_count, expected_manifest = arxiv_metadata.process_metadata(str(snapshot), "1", previous, workers=1)
+    expected = uploaded_chunks()
+
+    manifest.save_manifest_to_s3(previous, BUCKET, "state/manifest.bin", str(snapshot.parent / "previous.bin"))
+    processed, next_manifest = arxiv_metadata.process_metadata_fanout(
+        BUCKET,
+        SNAPSHOT_KEY,
+        "1",
+        fanout.ProcessFanout(arxiv_metadata.run_fanout_task, workers=1),
+        shards=3,
+        partitions=4,
+        manifest_key="state/manifest.bin",
+    )
+    records = uploaded_chunks()
+
+    assert processed == expected_count == 39
+    assert sorted(records, key=lambda record: record["id"]) == sorted(expected, key=lambda record: record["id"])
+    assert "0003" not in {record["id"] for record in records}
+    np.testing.assert_array_equal(next_manifest.entries, expected_manifest.entries)
+
+
+class FakeContext:
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:collection"
+
+    def get_remaining_time_in_millis(self):
+        return 900_000
+
+
+def test_coordinator_resumes_between_rounds(snapshot, uploaded_chunks, monkeypatch):
+    run_state = import_layer_module("collection_layer", "utils.run_state")
+    metrics = import_layer_module("collection_layer", "utils.metrics")
+
+    class FakeSource:
+        def check_source(self, etag=None):
+            return run_state.SourceVersion(300, '"v300"')
+
+        def stream_latest_metadata(self, file_path):
+            with open(file_path, "wb") as file:
+                file.write(snapshot.read_bytes())
+            yield 0, b""
+
+    class OneRoundFanout(fanout.ProcessFanout):
+        """每次呼叫只有時間執行一輪: 完成一輪後剩餘時間即不足"""
+
+        def map(self, tasks):
+            rounds.append(tasks[0]["task"])
+            results = super().map(tasks)
+            monkeypatch.setattr(arxiv_metadata, "FANOUT_WORKER_TIMEOUT", 10**6)
+            return results
+
+    monkeypatch.setattr(arxiv_metadata, "S3_BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(arxiv_metadata, "S3_FOLDER_PREFIX", "arxiv")
+    monkeypatch.setattr(arxiv_metadata, "STREAM_DOWNLOAD", True)
+    monkeypatch.setattr(arxiv_metadata, "DELTA_MODE", False)
+    monkeypatch.setattr(arxiv_metadata, "FANOUT_WORKERS", 3)
+    monkeypatch.setattr(arxiv_metadata, "FANOUT_PARTITIONS", 2)
+    monkeypatch.setattr(arxiv_metadata, "ArxivMetadataService", FakeSource)
+    monkeypatch.setattr(
+        arxiv_metadata, "LambdaFanout", lambda *args, **kwargs: OneRoundFanout(arxiv_metadata.run_fanout_task, 1)
+    )
+    invoke_resume = arxiv_metadata.invoke_resume
+    rounds, resumes = [], []
+    # 以本地執行的方式記錄接續 (不呼叫 Lambda)
+    monkeypatch.setattr(
+        arxiv_metadata,
+        "invoke_resume",
+        lambda checkpoint, context: resumes.append(checkpoint.prefix) or invoke_resume(checkpoint, None),
+    )
+
+    results = [arxiv_metadata.run_collection(metrics.Metrics("test"), FakeContext())]
+    while results[-1]["status"] == "suspended":
+        monkeypatch.setattr(arxiv_metadata, "FANOUT_WORKER_TIMEOUT", 0)
+        results.append(arxiv_metadata.lambda_handler({"resume": resumes[-1]}, FakeContext()))
+
+    # parse / dedup 之後各暫停一次，每一輪只執行一次
+    assert [result["status"] for result in results] == ["suspended", "suspended", "success"]
+    assert rounds == ["scan", "dedup", "emit"]
+    assert resumes == ["fanout/300", "fanout/300"]
+    assert len({record["id"] for record in uploaded_chunks()}) == 40
+    assert run_state.load_run_state(BUCKET).processed_version == 300
+    client = boto3.client("s3")
+    assert not client.list_objects_v2(Bucket=BUCKET, Prefix="fanout/300/").get("KeyCount")
+    assert client.head_object(Bucket=BUCKET, Key="arxiv-300.json")["ContentLength"] == snapshot.stat().st_size
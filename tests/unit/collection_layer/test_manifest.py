@@ -0,0 +1,92 @@
+import json
+import time
+
+import numpy as np
+
+from tests.layers import import_layer_module
+
+manifest = import_layer_module("collection_layer", "utils.manifest")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+
+
+def make_line(paper_id, update_date="2024-01-02", title="title"):
+    return json.dumps({"id": paper_id, "update_date": update_date, "title": title})
+
+
+def write_snapshot(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def run_process_metadata(uploaded_chunks, file_path, previous=None):
+    _, next_manifest = arxiv_metadata.process_metadata(file_path, "1", previous, workers=1)
+    return [record["id"] for record in uploaded_chunks()], next_manifest
+
+
+def make_manifest(rows):
+    entries = np.array(
+        sorted((manifest.hash_id(paper_id), ts, content) for paper_id, ts, content in rows),
+        dtype=manifest.MANIFEST_DTYPE,
+    )
+    return manifest.StateManifest(entries)
+
+
+def test_manifest_round_trip(tmp_path):
+    built = make_manifest([("a", 30, 3), ("b", 20, 2)])
+    built.save(str(tmp_path / "manifest.bin"))
+
+    loaded = manifest.StateManifest.load(str(tmp_path / "manifest.bin"))
+    assert len(loaded) == 2
+    np.testing.assert_array_equal(loaded.entries, built.entries)
+
+
+def changed(built, rows):
+    ids = np.array([manifest.hash_id(paper_id) for paper_id, _, _ in rows], dtype="<u8")
+    timestamps = np.array([ts for _, ts, _ in rows], dtype="<i8")
+    hashes = np.array([content for _, _, content in rows], dtype="<u8")
+    return built.changed_mask(ids, timestamps, hashes).tolist()
+
+
+def test_changed_mask_emits_only_new_or_changed(tmp_path):
+    built = make_manifest([("a", 30, 3), ("b", 20, 2)])
+    built.save(str(tmp_path / "manifest.bin"))
+    loaded = manifest.StateManifest.load(str(tmp_path / "manifest.bin"))
+    # 較舊的版本 / 未變動 / 內容變動 / 新增 / 較新版本但內容相同
+    rows = [("a", 20, 9), ("b", 20, 2), ("b", 20, 5), ("c", 10, 1), ("a", 40, 3)]
+
+    assert changed(loaded, rows) == [False, False, True, True, False]
+    # id 超出 manifest 範圍 (排序後位於最後) 時視為新增
+    assert changed(make_manifest([("a", 30, 3)]), [("zz", 1, 1), ("a", 30, 3)])[1] is False
+    assert all(changed(manifest.StateManifest.empty(), rows))
+
+
+def test_delta_mode_only_emits_new_or_changed(tmp_path, uploaded_chunks):
+    first = write_snapshot(tmp_path / "day1.json", [make_line("0001"), make_line("0002")])
+    emitted, day1_manifest = run_process_metadata(uploaded_chunks, first)
+    assert emitted == ["0001", "0002"]
+
+    second = write_snapshot(
+        tmp_path / "day2.json",
+        [make_line("0001"), make_line("0002", "2024-01-03", "new title"), make_line("0003")],
+    )
+    emitted, day2_manifest = run_process_metadata(uploaded_chunks, second, day1_manifest)
+    assert emitted == ["0002", "0003"]
+    assert len(day2_manifest) == 3
+
+    emitted, _ = run_process_metadata(uploaded_chunks, second, day2_manifest)
+    assert emitted == []
+
+
+def test_update_timestamps_do_not_depend_on_the_host_time_zone(monkeypatch):
+    index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+    monkeypatch.setenv("TZ", "Asia/Taipei")
+    time.tzset()
+    arxiv_metadata.date_to_timestamp.cache_clear()
+    try:
+        # manifest 的 update_timestamp 與索引的 external version 皆為 UTC 午夜
+        assert arxiv_metadata.date_to_timestamp("2024-01-03") == 1704240000
+        assert index_to_db.date_to_version("2024-01-03") == 1704240000
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+        arxiv_metadata.date_to_timestamp.cache_clear()
@@ -0,0 +1,141 @@
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.layers import import_layer_module
+
+s3 = import_layer_module("collection_layer", "utils.s3")
+run_state = import_layer_module("collection_layer", "utils.run_state")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+metrics = import_layer_module("collection_layer", "utils.metrics")
+
+BUCKET = "arxiv-test"
+
+
+class FakeSource:
+    """以固定的版本與 ETag 回應，來源未變動 (If-None-Match 相符) 時回傳 None"""
+
+    def __init__(self, version, etag):
+        self.current = run_state.SourceVersion(version, etag)
+        self.requested_etags = []
+
+    def __call__(self):
+        return self
+
+    def check_source(self, etag=None):
+        self.requested_etags.append(etag)
+        return None if etag == self.current.etag else self.current
+
+
+@pytest.fixture
+def s3_calls(monkeypatch):
+    """moto 上的 bucket，回傳 collection_layer 的 S3 client 呼叫過的操作名稱"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(arxiv_metadata, "S3_BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(arxiv_metadata, "S3_FOLDER_PREFIX", "arxiv")
+    with mock_aws():
+        monkeypatch.setattr(s3, "_clients", {})
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        calls = []
+        s3.get_s3_client().meta.events.register("before-call.s3.*", lambda model, **kwargs: calls.append(model.name))
+        yield calls
+
+
+def test_first_run_bootstraps_state_and_records_success(s3_calls, monkeypatch):
+    client = boto3.client("s3")
+    for timestamp in (100, 200):
+        client.put_object(Bucket=BUCKET, Key=f"arxiv-{timestamp}.json", Body=b"{}")
+    source = FakeSource(300, '"v300"')
+    processed = []
+    monkeypatch.setattr(arxiv_metadata, "ArxivMetadataService", source)
+    monkeypatch.setattr(
+        arxiv_metadata,
+        "run_single_collection",
+        lambda metrics, service, version, context: processed.append(version) or {"status": "success"},
+    )
+
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "success"}
+    state = run_state.load_run_state(BUCKET)
+    assert processed == [300]
+    assert (state.status, state.processed_version, state.source_etag) == ("success", 300, '"v300"')
+    assert state.snapshot_key == "arxiv-300.json"
+    # 上次處理的版本由既有的快照檔名推算 (第一次執行才列出)
+    assert source.requested_etags == [None]
+    assert s3_calls.count("ListObjectsV2") == 1
+
+    # 來源未變動: 只有一次 GET 與一次條件式請求
+    s3_calls.clear()
+    st = time.perf_counter()
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "skip"}
+    assert time.perf_counter() - st < 1
+    assert s3_calls == ["GetObject"]
+    assert source.requested_etags[-1] == '"v300"'
+
+
+def test_failed_run_is_retried_and_stale_writes_are_rejected(s3_calls, monkeypatch):
+    source = FakeSource(300, '"v300"')
+    monkeypatch.setattr(arxiv_metadata, "ArxivMetadataService", source)
+
+    def fail(metrics, service, version, context):
+        raise RuntimeError("download failed")
+
+    monkeypatch.setattr(arxiv_metadata, "run_single_collection", fail)
+    with pytest.raises(RuntimeError):
+        arxiv_metadata.run_collection(metrics.Metrics("test"))
+    state = run_state.load_run_state(BUCKET)
+    assert (state.status, state.source_version, state.processed_version) == ("failed", 300, 0)
+    assert state.error == "download failed"
+
+    # 失敗後不帶 ETag，即使來源未變動也會重新處理
+    monkeypatch.setattr(arxiv_metadata, "run_single_collection", lambda *args: {"status": "suspended"})
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "suspended"}
+    assert source.requested_etags == [None, None]
+    assert run_state.load_run_state(BUCKET).status == "running"
+
+    # 以過期的 ETag 寫入 (其他執行已更新) 時被拒絕
+    with pytest.raises(run_state.RunStateConflict):
+        run_state.save_run_state(BUCKET, state)
+
+
+def test_resume_event_continues_the_claimed_run_without_checking_the_source(s3_calls, monkeypatch):
+    source = FakeSource(300, '"v300"')
+    monkeypatch.setattr(arxiv_metadata, "ArxivMetadataService", source)
+    monkeypatch.setattr(arxiv_metadata, "run_single_collection", lambda *args: {"status": "suspended"})
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "suspended"}
+
+    resumed = []
+    monkeypatch.setattr(
+        arxiv_metadata,
+        "run_single_collection",
+        lambda metrics, service, version, context: resumed.append(version) or {"status": "success"},
+    )
+    assert arxiv_metadata.lambda_handler({"resume": "checkpoints/300"}, None) == {"status": "success"}
+    assert resumed == [300]
+    assert source.requested_etags == [None]
+    state = run_state.load_run_state(BUCKET)
+    assert (state.status, state.processed_version, state.source_etag) == ("success", 300, '"v300"')
+
+    # 已完成的版本不再接續
+    assert arxiv_metadata.lambda_handler({"resume": "checkpoints/300"}, None) == {"status": "skip"}
+    assert resumed == [300]
+
+
+def test_fresh_triggers_skip_while_a_run_is_in_progress(s3_calls, monkeypatch):
+    source = FakeSource(300, '"v300"')
+    monkeypatch.setattr(arxiv_metadata, "ArxivMetadataService", source)
+    monkeypatch.setattr(arxiv_metadata, "run_single_collection", lambda *args: {"status": "suspended"})
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "suspended"}
+
+    # 接續中的執行不被排程的觸發重新取得
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "skip"}
+    assert source.requested_etags == [None]
+
+    # 超過 RUN_STALE_SECONDS 的 running 視為已中斷，由新的觸發接手
+    monkeypatch.setattr(arxiv_metadata, "RUN_STALE_SECONDS", 0)
+    monkeypatch.setattr(arxiv_metadata, "run_single_collection", lambda *args: {"status": "success"})
+    assert arxiv_metadata.run_collection(metrics.Metrics("test")) == {"status": "success"}
+    assert run_state.load_run_state(BUCKET).processed_version == 300
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.layers import import_layer_module
+
+s3 = import_layer_module("collection_layer", "utils.s3")
+
+BUCKET = "arxiv-test"
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        monkeypatch.setattr(s3, "_clients", {})
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_uploader_uploads_in_background_and_reports_failures(s3_client):
+    with s3.S3Uploader(BUCKET, max_workers=4, max_pending=4) as uploader:
+        for index in range(20):
+            uploader.put_bytes(f"parsed_1/chunk-{index:02d}", f"body-{index}".encode(), ContentType="text/plain")
+        assert uploader.flush() == []
+
+    keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert keys == [f"parsed_1/chunk-{index:02d}" for index in range(20)]
+    assert s3_client.get_object(Bucket=BUCKET, Key="parsed_1/chunk-07")["Body"].read() == b"body-7"
+    assert uploader.uploaded_count == 20
+
+    missing_bucket = s3.S3Uploader("missing-bucket", max_workers=2)
+    missing_bucket.put_bytes("a", b"1")
+    missing_bucket.put_bytes("b", b"2")
+    assert missing_bucket.close() == ["a", "b"]
+
+
+def test_uploader_applies_backpressure():
+    class SlowClient:
+        def __init__(self):
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.lock = threading.Lock()
+
+        def put_object(self, **kwargs):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.02)
+            with self.lock:
+                self.in_flight -= 1
+
+    client = SlowClient()
+    uploader = s3.S3Uploader(BUCKET, max_workers=8, max_pending=3, client=client)
+    for index in range(12):
+        uploader.put_bytes(str(index), b"x")
+        assert len(uploader.pending) <= 3
+    assert uploader.close() == []
+    assert client.max_in_flight <= 3
+    assert uploader.uploaded_count == 12
+
+
+def test_upload_file_uses_shared_client(s3_client, tmp_path):
+    file_path = tmp_path / "snapshot.json"
+    file_path.write_bytes(b"{}\n" * 1000)
+
+    s3.upload_file_to_s3(BUCKET, "arxiv-1.json", str(file_path))
+    assert s3.get_s3_client() is s3.get_s3_client()
+    assert s3_client.head_object(Bucket=BUCKET, Key="arxiv-1.json")["ContentLength"] == 3000
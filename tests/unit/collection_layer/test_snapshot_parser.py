@@ -0,0 +1,54 @@
+import json
+
+from tests.layers import import_layer_module
+
+snapshot_parser = import_layer_module("collection_layer", "utils.snapshot_parser")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+
+
+def write_snapshot(path, count):
+    lines = [
+        json.dumps({"id": f"{i:04d}", "update_date": "2024-01-02", "abstract": "x" * (i % 50)}) for i in range(count)
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_byte_ranges_are_line_aligned_and_cover_file(tmp_path):
+    file_path = write_snapshot(tmp_path / "snapshot.json", 500)
+
+    byte_ranges = snapshot_parser.split_byte_ranges(file_path, 7)
+    assert len(byte_ranges) == 7
+    assert byte_ranges[0].start == 0
+    assert byte_ranges[-1].end == (tmp_path / "snapshot.json").stat().st_size
+
+    ids = []
+    for previous, current in zip(byte_ranges, byte_ranges[1:], strict=False):
+        assert previous.end == current.start
+    for byte_range in byte_ranges:
+        ids.extend(json.loads(line)["id"] for _, line in snapshot_parser.iter_range_lines(file_path, byte_range))
+    assert ids == [f"{i:04d}" for i in range(500)]
+
+
+def test_run_in_processes_keeps_task_order():
+    assert snapshot_parser.run_in_processes(lambda x: x * x, list(range(10)), workers=4) == [x * x for x in range(10)]
+    # 常駐行程版本接受邊產生的 iterator
+    assert snapshot_parser.map_in_processes(lambda x: x * x, iter(range(10)), workers=4) == [x * x for x in range(10)]
+
+
+def test_parallel_process_metadata_matches_serial(tmp_path, uploaded_chunks):
+    file_path = write_snapshot(tmp_path / "snapshot.json", 2500)
+    processed, _ = arxiv_metadata.process_metadata(file_path, "1", workers=3)
+
+    emitted = [record["id"] for record in uploaded_chunks()]
+    assert processed == 2500
+    assert emitted == [f"{i:04d}" for i in range(2500)]
+
+
+def test_extract_key_fields_falls_back_to_json():
+    assert snapshot_parser.extract_key_fields(b'{"id":"0704.0001","update_date":"2008-11-13"}') == (
+        "0704.0001",
+        "2008-11-13",
+    )
+    escaped = json.dumps({"id": 'a"b', "abstract": '"update_date":"x"', "update_date": "2008-11-13"}).encode()
+    assert snapshot_parser.extract_key_fields(escaped) == ('a"b', "2008-11-13")
@@ -0,0 +1,140 @@
+import base64
+import io
+import json
+import threading
+import zipfile
+import zlib
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from tests.layers import import_layer_module
+
+zip_stream = import_layer_module("collection_layer", "utils.zip_stream")
+snapshot_parser = import_layer_module("collection_layer", "utils.snapshot_parser")
+arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+
+SNAPSHOT = "".join(
+    json.dumps({"id": f"{i:04d}", "update_date": "2024-01-02", "abstract": "lorem ipsum " * 40}) + "\n"
+    for i in range(3000)
+).encode()
+
+
+class NonSeekableWriter(io.RawIOBase):
+    """zipfile 寫入不可 seek 的輸出時會改用 data descriptor"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def build_zip(member=arxiv_metadata.SNAPSHOT_FILE_NAME, seekable=True, force_zip64=False, other_member=True):
+    output = io.BytesIO() if seekable else NonSeekableWriter()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        if other_member:
+            archive.writestr("README.txt", b"other member")
+        with archive.open(member, "w", force_zip64=force_zip64) as file:
+            file.write(SNAPSHOT)
+    return (output if seekable else output.buffer).getvalue()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"force_zip64": True}, {"seekable": False, "other_member": False}],
+    ids=["sizes", "zip64", "descriptor"],
+)
+def test_iter_zip_member_streams_without_seek(options):
+    stream = io.BufferedReader(io.BytesIO(build_zip(**options)))
+    assert b"".join(zip_stream.iter_zip_member(stream, arxiv_metadata.SNAPSHOT_FILE_NAME)) == SNAPSHOT
+
+
+def test_iter_zip_member_detects_corruption():
+    data = bytearray(build_zip())
+    data[len(data) // 2] ^= 0xFF
+    with pytest.raises((ValueError, EOFError, zlib.error)):
+        b"".join(zip_stream.iter_zip_member(io.BytesIO(bytes(data)), arxiv_metadata.SNAPSHOT_FILE_NAME))
+
+    with pytest.raises(FileNotFoundError):
+        b"".join(zip_stream.iter_zip_member(io.BytesIO(build_zip(member="other.json")), "missing.json"))
+
+
+def test_iter_lines_with_offsets_matches_file_offsets():
+    chunks = [SNAPSHOT[i : i + 777] for i in range(0, len(SNAPSHOT), 777)]
+    for offset, line in zip_stream.iter_lines_with_offsets(zip_stream.prefetch(chunks, max_buffered=2)):
+        assert SNAPSHOT[offset : offset + len(line)] == line
+
+
+def test_streamed_ranges_are_scanned_in_parallel_while_downloading(tmp_path, uploaded_chunks, monkeypatch):
+    # 以小的讀取單位模擬網路串流，解壓後的資料分成多個區塊抵達
+    monkeypatch.setattr(zip_stream, "READ_SIZE", 4096)
+    file_path = str(tmp_path / arxiv_metadata.SNAPSHOT_FILE_NAME)
+    streamed = []
+
+    def record(byte_ranges):
+        for byte_range in byte_ranges:
+            streamed.append(byte_range)
+            yield byte_range
+
+    byte_ranges = arxiv_metadata.stream_snapshot_ranges(io.BytesIO(build_zip()), file_path, segment_bytes=64 * 1024)
+    scan = partial(arxiv_metadata.scan_range, file_path=file_path)
+    scans = snapshot_parser.map_in_processes(scan, record(byte_ranges), workers=3)
+
+    # range 依序相接、皆從行首開始並涵蓋整個檔案
+    assert len(streamed) > 3
+    assert [byte_range.start for byte_range in streamed] == [0] + [byte_range.end for byte_range in streamed[:-1]]
+    assert all(SNAPSHOT[byte_range.start - 1 : byte_range.start] == b"\n" for byte_range in streamed[1:])
+    assert streamed[-1].end == len(SNAPSHOT)
+    assert [scan["index"] for scan in scans] == list(range(len(streamed)))
+    assert sum(scan["lines"] for scan in scans) == 3000
+
+    processed, _ = arxiv_metadata.process_metadata(file_path, "1", workers=2, scans=scans)
+    assert processed == 3000
+    assert sorted(record["id"] for record in uploaded_chunks()) == [f"{i:04d}" for i in range(3000)]
+
+
+def test_stream_from_local_http_stand_in(tmp_path, uploaded_chunks):
+    payload = build_zip()
+    expected_auth = "Basic " + base64.b64encode(b"user:key").decode()
+
+    class KaggleStandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("Authorization") != expected_auth:
+                self.send_response(401)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.end_headers()
+            for i in range(0, len(payload), 4096):
+                self.wfile.write(payload[i : i + 4096])
+
+        def log_message(self, *args):
+            pass
+
+    threads = threading.enumerate()
+    server = HTTPServer(("127.0.0.1", 0), KaggleStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        stream = arxiv_metadata.open_snapshot_stream(f"http://127.0.0.1:{server.server_port}/", auth=("user", "key"))
+        file_path = str(tmp_path / arxiv_metadata.SNAPSHOT_FILE_NAME)
+        scans = [arxiv_metadata.scan_lines(0, arxiv_metadata.stream_snapshot(stream, file_path))]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    # 下載的背景執行緒已結束，輸出階段 fork 時沒有多出執行中的執行緒
+    assert threading.enumerate() == threads
+    processed, _ = arxiv_metadata.process_metadata(file_path, "1", workers=2, scans=scans)
+
+    emitted = [record["id"] for record in uploaded_chunks()]
+    assert (tmp_path / arxiv_metadata.SNAPSHOT_FILE_NAME).read_bytes() == SNAPSHOT
+    assert processed == 3000
+    assert emitted == [f"{i:04d}" for i in range(3000)]
@@ -0,0 +1,246 @@
+import importlib.util
+import io
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.layers import ROOT, activate_layer, import_layer_module
+
+
+def load_main():
+    activate_layer("data_process_layer")
+    spec = importlib.util.spec_from_file_location("create_index_main", ROOT / "create_index_with_mapping" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+main = load_main()
+
+
+class FakeIndices:
+    """以 dict 模擬索引與 alias，記錄每次呼叫"""
+
+    def __init__(self, indices, mappings=None):
+        self.indices = {name: {"aliases": set(aliases), "settings": {}} for name, aliases in indices.items()}
+        # 既有索引預設為 full profile 的 mapping
+        self.mappings = dict.fromkeys(indices, mappings or main.get_papers_mappings("full", embedding=False))
+        self.calls = []
+
+    def _targets(self, alias):
+        return {name: {} for name, index in self.indices.items() if alias in index["aliases"]}
+
+    def exists(self, index):
+        return index in self.indices
+
+    def exists_alias(self, name):
+        return bool(self._targets(name))
+
+    def get_alias(self, name):
+        return self._targets(name)
+
+    def get(self, index):
+        prefix = index.rstrip("*")
+        return {name: {} for name in self.indices if name.startswith(prefix)}
+
+    def get_mapping(self, index):
+        targets = self._targets(index) or [index]
+        return {name: {"mappings": self.mappings[name]["mappings"]} for name in targets}
+
+    def create(self, index, body):
+        self.calls.append(("create", index, body.get("settings")))
+        self.mappings[index] = {"mappings": body.get("mappings", {})}
+        self.indices[index] = {"aliases": set(), "settings": dict(body.get("settings", {}).get("index", {}))}
+
+    def put_settings(self, index, body):
+        self.calls.append(("put_settings", index, body))
+        self.indices[index]["settings"].update(body["index"])
+
+    def refresh(self, index):
+        self.calls.append(("refresh", index))
+
+    def forcemerge(self, index, max_num_segments, request_timeout):
+        self.calls.append(("forcemerge", index))
+
+    def update_aliases(self, body):
+        self.calls.append(("update_aliases", body["actions"]))
+        for action in body["actions"]:
+            ((kind, target),) = action.items()
+            if kind == "remove_index":
+                del self.indices[target["index"]]
+            elif kind == "remove":
+                self.indices[target["index"]]["aliases"].discard(target["alias"])
+            else:
+                self.indices[target["index"]]["aliases"].add(target["alias"])
+
+    def delete(self, index):
+        self.calls.append(("delete", index))
+        del self.indices[index]
+
+
+class FakeClient:
+    def __init__(self, indices, count=3, reindex_response=None, mappings=None):
+        self.indices = FakeIndices(indices, mappings)
+        self.cluster = self
+        self.reindexed = []
+        self.counts = dict.fromkeys(indices, count)
+        self.reindex_response = reindex_response or {"created": count}
+
+    def health(self, **kwargs):
+        return {"status": "green"}
+
+    def reindex(self, body, **kwargs):
+        self.reindexed.append(body)
+        self.counts[body["dest"]["index"]] = self.reindex_response.get("created", 0)
+        return self.reindex_response
+
+    def count(self, index):
+        targets = self.indices.get_alias(index) or [index]
+        return {"count": sum(self.counts.get(name, 0) for name in targets)}
+
+
+def test_rebuild_swaps_alias_and_drops_old_generations():
+    client = FakeClient(
+        {
+            "arxiv-papers-20240101000000": [],
+            "arxiv-papers-20250101000000": ["arxiv-papers"],
+            "arxiv-papers-authors": [],
+        }
+    )
+
+    mappings = main.get_papers_mappings("full", embedding=False)
+    new_index = main.rebuild_index(client, "arxiv-papers", mappings, "reindex", keep=2, service="es")
+
+    calls = client.indices.calls
+    assert calls[0] == ("create", new_index, {"index": main.BULK_LOAD_SETTINGS})
+    assert client.reindexed == [{"source": {"index": "arxiv-papers"}, "dest": {"index": new_index}}]
+    assert client.indices.indices[new_index]["settings"]["refresh_interval"] == main.INDEX_REFRESH_INTERVAL
+    # 先恢復設定並 force merge，才切換 alias
+    kinds = [call[0] for call in calls]
+    assert kinds.index("forcemerge") < kinds.index("update_aliases")
+    assert (
+        "update_aliases",
+        [
+            {"remove": {"index": "arxiv-papers-20250101000000", "alias": "arxiv-papers"}},
+            {"add": {"index": new_index, "alias": "arxiv-papers"}},
+        ],
+    ) in calls
+    assert sorted(client.indices.indices) == sorted(["arxiv-papers-20250101000000", "arxiv-papers-authors", new_index])
+
+
+@pytest.mark.parametrize(
+    "reindex_response",
+    [
+        {"created": 2, "failures": [{"id": "0704.0001", "cause": {"type": "mapper_parsing_exception"}}]},
+        {"created": 2, "timed_out": True},
+        {"created": 2},
+    ],
+    ids=["failures", "timed_out", "count_mismatch"],
+)
+def test_incomplete_reindex_keeps_the_alias_on_the_old_index(reindex_response):
+    client = FakeClient({"arxiv-papers-20250101000000": ["arxiv-papers"]}, reindex_response=reindex_response)
+
+    with pytest.raises(RuntimeError):
+        main.rebuild_index(client, "arxiv-papers", main.get_papers_mappings("full", embedding=False), "reindex")
+
+    # alias 未切換，未完成的新索引已刪除 (不會被計入保留的世代)
+    assert not any(call[0] == "update_aliases" for call in client.indices.calls)
+    assert list(client.indices.indices) == ["arxiv-papers-20250101000000"]
+    assert client.indices.exists_alias("arxiv-papers")
+
+
+@pytest.mark.parametrize(
+    ("source_profile", "profile", "embedding"),
+    [("full", "lean", False), ("lean", "full", False), ("full", "full", True)],
+    ids=["full_to_lean", "lean_to_full", "new_vector_field"],
+)
+def test_reindex_refuses_a_different_document_shape(source_profile, profile, embedding):
+    client = FakeClient(
+        {"arxiv-papers-20250101000000": ["arxiv-papers"]},
+        mappings=main.get_papers_mappings(source_profile, embedding=False),
+    )
+
+    with pytest.raises(ValueError, match="s3://"):
+        main.rebuild_index(client, "arxiv-papers", main.get_papers_mappings(profile, embedding=embedding), "reindex")
+    assert client.indices.calls == []
+    assert client.reindexed == []
+
+
+@pytest.mark.parametrize("service", ["es", "aoss"])
+def test_rebuild_replaces_legacy_concrete_index(service):
+    client = FakeClient({"arxiv-papers": []})
+
+    new_index = main.rebuild_index(client, "arxiv-papers", main.get_papers_mappings(), "none", service=service)
+
+    assert sorted(client.indices.indices) == [new_index]
+    assert client.indices.exists_alias("arxiv-papers")
+    tuned = any(call[0] in ("put_settings", "forcemerge") for call in client.indices.calls)
+    assert tuned == (service != "aoss")
+
+
+@pytest.mark.parametrize("service", ["es", "aoss"])
+def test_lean_profile_keeps_codec_with_bulk_load_settings(service):
+    client = FakeClient({})
+
+    new_index = main.rebuild_index(client, "arxiv-papers", main.get_papers_mappings("lean"), "none", service=service)
+
+    settings = client.indices.calls[0][2]
+    if service == "aoss":
+        assert settings is None
+    else:
+        assert settings == {"index": {"codec": "best_compression", **main.BULK_LOAD_SETTINGS}}
+    assert client.indices.exists_alias("arxiv-papers")
+    assert new_index in client.indices.indices
+
+
+@pytest.mark.parametrize("service", ["es", "aoss"])
+def test_embedding_adds_knn_vector_and_keeps_knn_setting(service):
+    client = FakeClient({})
+    mappings = main.get_papers_mappings("full", embedding=True)
+
+    main.rebuild_index(client, "arxiv-papers", mappings, "none", service=service)
+
+    assert mappings["mappings"]["properties"]["knn_vector"]["dimension"] == main.EMBEDDING_DIMENSION
+    # aoss 略過其他寫入期間的設定，但仍需 index.knn 才能建立向量欄位
+    settings = client.indices.calls[0][2]["index"]
+    assert settings["knn"] is True
+    assert ("refresh_interval" in settings) == (service != "aoss")
+
+
+def upload_chunks(s3, prefix, delta):
+    chunk_format = import_layer_module("collection_layer", "utils.chunk_format")
+    writer = chunk_format.NdjsonChunkWriter(
+        prefix,
+        upload=lambda key, body, metadata: s3.put_object(Bucket="arxiv-test", Key=key, Body=body, Metadata=metadata),
+        delta=delta,
+    )
+    writer.append({"id": "0704.0001"})
+    writer.flush()
+    activate_layer("data_process_layer")
+    return writer.keys[0]
+
+
+def test_rebuild_from_s3_refuses_delta_output(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="arxiv-test")
+        delta_key = upload_chunks(s3, "parsed_200/metadata-000", delta=True)
+        full_key = upload_chunks(s3, "parsed_100/metadata-000", delta=False)
+
+        client = FakeClient({})
+        with pytest.raises(main.DeltaChunkError, match="DELTA_MODE=false"):
+            main.rebuild_index(client, "arxiv-papers", {}, "s3://arxiv-test/parsed_200/", service="es")
+        # 建立新索引前即拒絕
+        assert client.indices.calls == []
+        main.check_full_snapshot("arxiv-test", "parsed_100/")
+
+        # 逐一讀取時亦拒絕增量輸出的 chunk (即使接受未標記的舊 chunk)
+        body = s3.get_object(Bucket="arxiv-test", Key=delta_key)["Body"].read()
+        with pytest.raises(main.DeltaChunkError):
+            list(main.iter_chunk_records(io.BytesIO(body), delta_key, require_full=True, allow_unmarked=True))
+        body = s3.get_object(Bucket="arxiv-test", Key=full_key)["Body"].read()
+        assert list(main.iter_chunk_records(io.BytesIO(body), full_key, require_full=True)) == [{"id": "0704.0001"}]
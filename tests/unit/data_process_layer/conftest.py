@@ -0,0 +1,8 @@
+import pytest
+
+from tests.layers import activate_layer
+
+
+@pytest.fixture(autouse=True)
+def _data_process_layer():
+    activate_layer("data_process_layer")
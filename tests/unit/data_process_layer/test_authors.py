@@ -0,0 +1,76 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+
+authors = import_layer_module("data_process_layer", "utils.authors")
+author_table = import_layer_module("data_process_layer", "utils.author_table")
+transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+
+BUCKET = "arxiv-test"
+
+
+def test_author_ids_ignore_accents_latex_and_punctuation():
+    assert authors.normalize_name('M\\"uller-L\\"udenscheidt, J.') == "muller ludenscheidt j"
+    assert authors.author_id("Müller", "J.") == authors.author_id('M\\"uller', "J") == authors.author_id("MULLER", "j")
+    assert authors.author_id("Müller", "J.") != authors.author_id("Müller", "K.")
+
+    record = next(synthetic.iter_records(1))
+    (doc,) = transform_metadata.transform_metadata_batch([record], author_ids=True)
+    assert doc[authors.AUTHOR_IDS_FIELD] == authors.parsed_author_ids(record["authors_parsed"])
+    assert len(doc[authors.AUTHOR_IDS_FIELD]) == len(authors.author_names(doc))
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def paper(paper_id, update_date, *names):
+    return {
+        "id": paper_id,
+        "update_date": update_date,
+        "authors": [" ".join(name) for name in names],
+        authors.AUTHOR_IDS_FIELD: [authors.author_id(*name) for name in names],
+    }
+
+
+def write_delta(s3, *documents):
+    postings = authors.AuthorPostings()
+    for _ in authors.collect_authors(documents, postings):
+        pass
+    return authors.write_author_delta(s3, BUCKET, postings, ["parsed_test/chunk.ndjson.gz"])
+
+
+def test_compaction_merges_deltas_into_memory_mapped_table(s3, tmp_path):
+    smith, lee, chen = ("Smith", "Anna"), ("Lee", "Bo"), ("Chen", "Yu")
+    write_delta(s3, paper("0001", "2020-01-01", smith, lee), paper("0002", "2020-01-01", smith, lee, chen))
+    assert author_table.compact_author_table(s3, BUCKET) == {
+        "deltas": 1,
+        "papers": 2,
+        "authors": 3,
+        "coauthor_pairs": 6,
+    }
+
+    # 較新的版本取代作者清單 (Lee 不再是 0002 的作者)，較舊的版本不覆蓋
+    write_delta(s3, paper("0002", "2021-06-01", smith, chen), paper("0001", "2019-01-01", chen))
+    stats = author_table.compact_author_table(s3, BUCKET)
+    assert stats["deltas"] == 1 and stats["papers"] == 2
+    assert not s3.list_objects_v2(Bucket=BUCKET, Prefix="authors/deltas/").get("KeyCount")
+
+    table = author_table.AuthorTable(author_table.download_author_table(s3, BUCKET, tmp_path / "authors"))
+    assert len(table) == 3
+    result = table.find("smith", "anna")
+    assert result["name"] == "Smith Anna"
+    assert sorted(result["papers"]) == ["0001", "0002"]
+    assert {coauthor["name"]: coauthor["papers"] for coauthor in result["coauthors"]} == {"Lee Bo": 1, "Chen Yu": 1}
+    assert table.find("Lee", "Bo")["papers"] == ["0001"]
+    assert table.find("Nobody") is None
@@ -0,0 +1,69 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from tests.layers import import_layer_module
+
+writer_format = import_layer_module("collection_layer", "utils.chunk_format")
+chunk_format = import_layer_module("data_process_layer", "utils.chunk_format")
+
+
+class NonSeekableBody(io.RawIOBase):
+    """模擬 S3 StreamingBody: 只能依序 read"""
+
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(min(len(buffer), 1000))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def write_chunks(records, **kwargs):
+    uploads = []
+    writer = writer_format.NdjsonChunkWriter(
+        "parsed_1/metadata-000", upload=lambda *args: uploads.append(args), **kwargs
+    )
+    for record in records:
+        writer.append(record)
+    writer.flush()
+    return uploads
+
+
+def test_chunks_cut_by_records_or_bytes_and_read_back():
+    records = [{"id": f"{i:04d}", "title": "論文" * (i % 7), "abstract": "x" * 200} for i in range(250)]
+
+    by_records = write_chunks(records, max_records=100)
+    assert [metadata["record-count"] for _, _, metadata in by_records] == ["100", "100", "50"]
+    assert [key for key, _, _ in by_records][0] == "parsed_1/metadata-000-00001.ndjson.gz"
+
+    by_bytes = write_chunks(records, target_bytes=10_000)
+    assert all(int(metadata["uncompressed-bytes"]) < 10_000 + 300 for _, _, metadata in by_bytes)
+    assert len(by_bytes) > 3
+
+    read_back = [
+        record for key, body, _ in by_bytes for record in chunk_format.iter_chunk_records(NonSeekableBody(body), key)
+    ]
+    assert read_back == records
+    assert sum(len(body) for _, body, _ in by_bytes) < len(json.dumps(records)) / 3
+
+
+def test_reads_legacy_json_array():
+    records = [{"id": "0001"}, {"id": "0002"}]
+    body = io.BytesIO(json.dumps(records).encode("utf-8"))
+    assert list(chunk_format.iter_chunk_records(body, "parsed_1/metadata-000-00001.json")) == records
+
+
+def test_detects_truncated_chunk():
+    ((key, body, _),) = write_chunks([{"id": f"{i:04d}"} for i in range(10)])
+    header, *lines = gzip.decompress(body).splitlines(keepends=True)
+    truncated = gzip.compress(header + b"".join(lines[:5]))
+
+    with pytest.raises(ValueError, match="incomplete"):
+        list(chunk_format.iter_chunk_records(io.BytesIO(truncated), key))
@@ -0,0 +1,118 @@
+import numpy as np
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+from tests.unit.data_process_layer.test_index_to_db import FakeBulkClient
+
+embedding = import_layer_module("data_process_layer", "utils.embedding")
+index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+
+
+class CountingEmbedder(embedding.HashedTfidfEmbedder):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return super().embed(texts)
+
+
+def test_vectors_are_deterministic_unit_vectors_ranked_by_overlap():
+    texts = [
+        "Quantum entanglement in spin chains",
+        "Entanglement entropy of quantum spin chains at criticality",
+        "Convolutional neural networks for image segmentation",
+        "the of and",
+    ]
+    vectors = embedding.HashedTfidfEmbedder(dimension=64).embed(texts)
+
+    # 不同的實例 (例如其他行程) 產生相同的向量，單筆計算與整批計算結果相同
+    np.testing.assert_array_equal(vectors, embedding.HashedTfidfEmbedder(dimension=64).embed(texts))
+    np.testing.assert_allclose(embedding.HashedTfidfEmbedder(dimension=64).embed(texts[2:3])[0], vectors[2])
+    assert vectors.shape == (4, 64) and vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1, rtol=1e-5)
+    # 只有停用詞時為零向量
+    assert not vectors[3].any()
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+
+
+def test_embed_documents_reuses_cached_vectors_for_unchanged_papers():
+    records = list(synthetic.iter_records(30, duplicate_rate=0))
+    embedder = CountingEmbedder(dimension=32)
+    cache = embedding.EmbeddingCache()
+
+    first = list(embedding.embed_documents(transform_metadata.transform_metadata_batch(records), embedder, cache, 8))
+    assert all(len(doc[embedding.VECTOR_FIELD]) == 32 for doc in first)
+    assert len(embedder.embedded) == 30
+
+    # 只有內容變動的論文重新計算，其餘直接取用快取
+    records[3]["abstract"] = "A completely different abstract about graph algorithms"
+    second = list(embedding.embed_documents(transform_metadata.transform_metadata_batch(records), embedder, cache, 8))
+    assert len(embedder.embedded) == 31
+    assert cache.hits == 29
+    assert second[0][embedding.VECTOR_FIELD] == first[0][embedding.VECTOR_FIELD]
+    assert second[3][embedding.VECTOR_FIELD] != first[3][embedding.VECTOR_FIELD]
+
+
+def test_bulk_embeds_only_documents_that_are_sent(monkeypatch):
+    records = list(synthetic.iter_records(20, duplicate_rate=0))
+    embedder = CountingEmbedder(dimension=16)
+    monkeypatch.setattr(embedding, "get_embedder", lambda: embedder)
+    # 不使用行程內的快取 (冷啟動、重播或回填的情況)
+    monkeypatch.setattr(embedding, "get_embedding_cache", lambda: embedding.EmbeddingCache(max_size=0))
+    client = FakeBulkClient()
+
+    index_to_db.bulk_index_documents(
+        "arxiv-papers", transform_metadata.transform_metadata_batch(records), client=client, embed=True
+    )
+    assert len(embedder.embedded) == 20
+    source = client.documents[records[0]["id"]]["_source"]
+    assert len(source[embedding.VECTOR_FIELD]) == 16
+    # 向量不計入 content_hash，embedder 的名稱計入 (與未啟用向量時送出的文件不同)
+    doc = next(transform_metadata.transform_metadata_batch(records[:1]))
+    assert (
+        source[index_to_db.CONTENT_HASH_FIELD] == index_to_db.build_entry("arxiv-papers", doc, embed=True).content_hash
+    )
+    assert source[index_to_db.CONTENT_HASH_FIELD] != index_to_db.build_entry("arxiv-papers", doc).content_hash
+
+    # 未變動的論文在比對 content_hash 後略過，不重新計算向量
+    records[3]["abstract"] = "A completely different abstract about graph algorithms"
+    controller = index_to_db.BulkController()
+    index_to_db.bulk_index_documents(
+        "arxiv-papers",
+        transform_metadata.transform_metadata_batch(records),
+        client=client,
+        controller=controller,
+        embed=True,
+    )
+    assert controller.unchanged == 19 and controller.embedded == 1
+    assert embedder.embedded[-1].endswith("graph algorithms")
+
+
+def test_enabling_or_changing_the_embedder_resends_unchanged_papers(monkeypatch):
+    records = list(synthetic.iter_records(10, duplicate_rate=0))
+    monkeypatch.setattr(embedding, "get_embedding_cache", lambda: embedding.EmbeddingCache(max_size=0))
+    client = FakeBulkClient()
+    index_to_db.bulk_index_documents(
+        "arxiv-papers", transform_metadata.transform_metadata_batch(records), client=client
+    )
+    assert not any(embedding.VECTOR_FIELD in doc["_source"] for doc in client.documents.values())
+
+    # 已索引但沒有向量的論文在啟用後重新送出並寫入向量；相同的 embedder 再次執行時略過
+    for embedder, expected in ((CountingEmbedder(dimension=16), 10), (CountingEmbedder(dimension=32), 10)):
+        monkeypatch.setattr(embedding, "get_embedder", lambda embedder=embedder: embedder)
+        for sent in (expected, 0):
+            controller = index_to_db.BulkController()
+            index_to_db.bulk_index_documents(
+                "arxiv-papers",
+                transform_metadata.transform_metadata_batch(records),
+                client=client,
+                controller=controller,
+                embed=True,
+            )
+            assert controller.embedded == sent and controller.unchanged == 10 - sent
+        assert all(
+            len(doc["_source"][embedding.VECTOR_FIELD]) == embedder.dimension for doc in client.documents.values()
+        )
@@ -0,0 +1,74 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+from tests.unit.data_process_layer.test_index_to_db import FakeBulkClient
+
+writer_format = import_layer_module("collection_layer", "utils.chunk_format")
+index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+arxiv_metadata = import_layer_module("data_process_layer", "arxiv_metadata")
+
+BUCKET = "arxiv-test"
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        arxiv_metadata.get_s3_client.cache_clear()
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+    arxiv_metadata.get_s3_client.cache_clear()
+
+
+def upload_chunk(client, key_prefix, records):
+    uploads = []
+    writer = writer_format.NdjsonChunkWriter(key_prefix, upload=lambda *args: uploads.append(args))
+    for record in records:
+        writer.append(record)
+    writer.flush()
+    (chunk_key, body, _), *_ = uploads
+    client.put_object(Bucket=BUCKET, Key=chunk_key, Body=body)
+    return chunk_key
+
+
+def sqs_message(message_id, key):
+    notification = {"Records": [{"s3": {"bucket": {"name": BUCKET}, "object": {"key": key}}}]}
+    return {"messageId": message_id, "eventSource": "aws:sqs", "body": json.dumps(notification)}
+
+
+def test_sqs_batch_reports_only_failed_chunks(bucket, monkeypatch):
+    records = list(synthetic.iter_records(20, duplicate_rate=0))
+    first = upload_chunk(bucket, "parsed_1/metadata-000", records[:10])
+    second = upload_chunk(bucket, "parsed_1/metadata-001", records[10:])
+    client = FakeBulkClient(failing_ids=[records[15]["id"]])
+    monkeypatch.setattr(index_to_db, "get_open_search_client", lambda: client)
+
+    event = {
+        "Records": [
+            sqs_message("m1", first),
+            sqs_message("m2", second),
+            sqs_message("m3", "parsed_1/metadata-002-00001.ndjson.gz"),
+            {"messageId": "m4", "eventSource": "aws:sqs", "body": json.dumps({"Event": "s3:TestEvent"})},
+        ]
+    }
+    response = arxiv_metadata.lambda_handler(event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m2"}, {"itemIdentifier": "m3"}]}
+    assert len(client.documents) == 19
+    # 同一批的文件以共用的 bulk 流程送出，request 可跨 chunk
+    assert len(client.bodies) == 1
+    failure_body = bucket.get_object(Bucket=BUCKET, Key=f"failures/{second}.ndjson")["Body"].read()
+    assert [json.loads(line)["_id"] for line in failure_body.splitlines()] == [records[15]["id"]]
+
+
+def test_event_without_chunks_skips_client_setup():
+    event = {"Records": [{"messageId": "m1", "eventSource": "aws:sqs", "body": json.dumps({"Event": "s3:TestEvent"})}]}
+    assert arxiv_metadata.lambda_handler(event, None) == {"batchItemFailures": []}
@@ -0,0 +1,240 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from opensearchpy import OpenSearch
+from opensearchpy.helpers import BulkIndexError
+
+from tests.layers import import_layer_module
+
+index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+
+
+class FakeBulkClient:
+    """記錄每個 bulk request 的大小與同時進行的 request 數，已索引的文件保留 version 與 content_hash"""
+
+    def __init__(self, failing_ids=()):
+        self.failing_ids = set(failing_ids)
+        self.bodies = []
+        self.documents = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def bulk(self, body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.bodies.append(body)
+        time.sleep(0.005)
+
+        lines = body.decode("utf-8").splitlines()
+        items = []
+        for action_line, source_line in zip(lines[::2], lines[1::2], strict=True):
+            action = json.loads(action_line)["index"]
+            doc_id = action["_id"]
+            current = self.documents.get(doc_id)
+            if doc_id in self.failing_ids:
+                status = 400
+            elif current and action.get("version", 0) < current["version"]:
+                status = 409
+            else:
+                self.documents[doc_id] = {"version": action.get("version", 0), "_source": json.loads(source_line)}
+                status = 201
+            items.append({"index": {"_id": doc_id, "status": status}})
+        with self.lock:
+            self.in_flight -= 1
+        return {"errors": any(item["index"]["status"] >= 300 for item in items), "items": items}
+
+    def mget(self, index, body, _source_includes):
+        docs = []
+        for doc_id in body["ids"]:
+            document = self.documents.get(doc_id)
+            if document is None:
+                docs.append({"_id": doc_id, "found": False})
+            else:
+                source = {field: document["_source"].get(field) for field in _source_includes.split(",")}
+                docs.append({"_id": doc_id, "found": True, "_source": source})
+        return {"docs": docs}
+
+
+def make_documents(count, produced):
+    for index in range(count):
+        produced.append(index)
+        yield {"id": f"{index:04d}", "abstract": "x" * 300}
+
+
+def test_streams_documents_in_byte_sized_requests():
+    client = FakeBulkClient()
+    produced = []
+
+    success, failed = index_to_db.bulk_index_documents(
+        "arxiv-papers",
+        make_documents(500, produced),
+        max_bytes=20_000,
+        client=client,
+        controller=index_to_db.BulkController(concurrency=3, max_concurrency=3),
+    )
+
+    assert (success, failed) == (500, 0)
+    assert all(len(body) <= 20_000 for body in client.bodies)
+    assert len(client.bodies) >= 9
+    assert client.max_in_flight <= 3
+    indexed = [json.loads(line)["index"]["_id"] for body in client.bodies for line in body.splitlines()[::2]]
+    assert sorted(indexed) == [f"{index:04d}" for index in range(500)]
+
+
+def make_papers(count, update_date, abstract="x"):
+    for index in range(count):
+        yield {"id": f"{index:04d}", "update_date": update_date, "abstract": abstract}
+
+
+def test_replaying_unchanged_documents_skips_bulk_requests():
+    client = FakeBulkClient()
+
+    assert index_to_db.bulk_index_documents("arxiv-papers", make_papers(120, "2024-01-02"), client=client) == (120, 0)
+    stored = client.documents["0005"]
+    assert stored["version"] == 1704153600
+    assert len(stored["_source"]["content_hash"]) == 16
+
+    requests = len(client.bodies)
+    controller = index_to_db.BulkController()
+    success, failed = index_to_db.bulk_index_documents(
+        "arxiv-papers", make_papers(120, "2024-01-02"), client=client, controller=controller
+    )
+    assert (success, failed, controller.unchanged) == (0, 0, 120)
+    assert len(client.bodies) == requests
+
+
+def test_stale_versions_are_rejected_without_failing():
+    client = FakeBulkClient()
+    index_to_db.bulk_index_documents("arxiv-papers", make_papers(10, "2024-03-01", "new"), client=client)
+
+    controller = index_to_db.BulkController()
+    success, failed = index_to_db.bulk_index_documents(
+        "arxiv-papers", make_papers(10, "2023-12-31", "old"), client=client, controller=controller
+    )
+
+    assert (success, failed, controller.stale) == (0, 0, 10)
+    assert client.documents["0003"]["_source"]["abstract"] == "new"
+
+
+def test_content_hash_ignores_previous_hash_field():
+    document = {"id": "0001", "update_date": "2024-01-02", "abstract": "x"}
+    entry = index_to_db.build_entry("arxiv-papers", document)
+    replayed = index_to_db.build_entry("arxiv-papers", {**document, "content_hash": "stale"})
+
+    assert replayed == entry
+    action, source = (json.loads(line) for line in entry.data.splitlines())
+    assert action["index"]["version_type"] == "external_gte"
+    assert source["content_hash"] == entry.content_hash
+
+
+def test_failed_documents_raise_after_all_requests():
+    client = FakeBulkClient(failing_ids={"0003", "0100"})
+
+    with pytest.raises(BulkIndexError) as error:
+        index_to_db.bulk_index_documents("arxiv-papers", make_documents(200, []), max_docs=50, client=client)
+
+    assert len(error.value.errors) == 2
+    assert len(client.bodies) == 4
+
+
+class ThrottlingBulkEndpoint(BaseHTTPRequestHandler):
+    """
+    本機的 _bulk stand-in: 前幾個 request 整批回傳 429，
+    flaky 的文件第一次回傳 item 層級的 429，bad 的文件永遠回傳 400
+    """
+
+    throttle_requests = 2
+    flaky_ids: set[str] = set()
+    bad_ids: set[str] = set()
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        if self.path.split("?")[0].endswith("/_mget"):
+            ids = json.loads(body)["ids"]
+            return self.respond(200, {"docs": [{"_id": doc_id, "found": False} for doc_id in ids]})
+        with server.lock:
+            server.requests += 1
+            throttle_request = server.requests <= self.throttle_requests
+        if throttle_request:
+            return self.respond(429, {"error": "Too Many Requests", "status": 429})
+
+        lines = body.splitlines()
+        items = []
+        for action_line, source_line in zip(lines[::2], lines[1::2], strict=True):
+            doc_id = json.loads(action_line)["index"]["_id"]
+            with server.lock:
+                if doc_id in self.bad_ids:
+                    status = 400
+                elif doc_id in self.flaky_ids and doc_id not in server.seen_flaky:
+                    server.seen_flaky.add(doc_id)
+                    status = 429
+                else:
+                    server.indexed[doc_id] = json.loads(source_line)
+                    status = 201
+            error = None if status == 201 else {"type": "test_error", "reason": str(status)}
+            items.append({"index": {"_id": doc_id, "status": status, "error": error}})
+        self.respond(200, {"took": 1, "errors": any(item["index"]["status"] != 201 for item in items), "items": items})
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bulk_endpoint(monkeypatch):
+    monkeypatch.setattr(index_to_db, "BULK_BACKOFF_BASE", 0.001)
+    ThrottlingBulkEndpoint.flaky_ids = {f"{index:04d}" for index in range(0, 300, 7)}
+    ThrottlingBulkEndpoint.bad_ids = {"0042", "0250"}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingBulkEndpoint)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.seen_flaky = set()
+    server.indexed = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_throttling_retries_failed_items_and_reports_permanent_failures(bulk_endpoint):
+    client = OpenSearch(hosts=[{"host": "127.0.0.1", "port": bulk_endpoint.server_port}], max_retries=0)
+    controller = index_to_db.BulkController(max_docs=64, concurrency=4, max_concurrency=4, min_docs=8)
+    written = []
+
+    success, failed = index_to_db.bulk_index_documents(
+        "arxiv-papers", make_documents(300, []), client=client, controller=controller, failure_sink=written.extend
+    )
+
+    assert (success, failed) == (298, 2)
+    assert sorted(bulk_endpoint.indexed) == sorted({f"{index:04d}" for index in range(300)} - {"0042", "0250"})
+    assert controller.throttled >= 2
+    assert sorted(record["_id"] for record in written) == ["0042", "0250"]
+    assert written[0]["status"] == 400
+    assert written[0]["_index"] == "arxiv-papers"
+    assert written[0]["_source"]["abstract"] == "x" * 300
+
+
+def test_controller_backs_off_on_throttling_and_recovers():
+    controller = index_to_db.BulkController(max_docs=1000, concurrency=4, max_concurrency=4, min_docs=50)
+
+    controller.record(0.1, throttled=True)
+    assert (controller.batch_docs, controller.concurrency) == (500, 2)
+    controller.record(30, throttled=False)
+    assert controller.batch_docs == 400
+
+    for _ in range(20):
+        controller.record(0.1, throttled=False)
+    assert controller.concurrency == 4
+    assert 400 < controller.batch_docs <= 1000
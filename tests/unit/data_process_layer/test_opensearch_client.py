@@ -0,0 +1,42 @@
+from datetime import UTC, datetime, timedelta
+
+import requests
+from botocore.credentials import RefreshableCredentials
+
+from tests.layers import import_layer_module
+
+opensearch_client = import_layer_module("data_process_layer", "utils.opensearch_client")
+
+
+def test_client_is_cached_across_invocations(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(opensearch_client, "create_open_search_client", lambda: object())
+    opensearch_client.get_open_search_client.cache_clear()
+
+    assert opensearch_client.get_open_search_client() is opensearch_client.get_open_search_client()
+    opensearch_client.get_open_search_client.cache_clear()
+
+
+def test_signing_refreshes_expiring_credentials():
+    access_keys = iter(f"AKIA{index}" for index in range(10))
+
+    def refresh():
+        # 有效期間短於 botocore 的提前更新門檻，每次取用都會觸發更新
+        expiry = datetime.now(UTC) + timedelta(minutes=5)
+        return {"access_key": next(access_keys), "secret_key": "s", "token": "t", "expiry_time": expiry.isoformat()}
+
+    credentials = RefreshableCredentials.create_from_metadata(refresh(), refresh, "test")
+    client = opensearch_client.create_open_search_client(
+        host="example.aoss.amazonaws.com", region="us-west-2", timeout=5, pool_maxsize=4, credentials=credentials
+    )
+    connection = client.transport.get_connection()
+    assert connection.session.adapters["https://"]._pool_maxsize == 4
+
+    def signed_credential():
+        request = connection.session.auth(requests.Request("GET", "https://example.aoss.amazonaws.com/").prepare())
+        return request.headers["Authorization"].split("Credential=")[1].split(",")[0]
+
+    first, second = signed_credential(), signed_credential()
+    assert first.split("/")[0] != second.split("/")[0]
+    assert first.endswith("/us-west-2/aoss/aws4_request")
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+from tests.unit.data_process_layer.test_handler import BUCKET, bucket, upload_chunk  # noqa: F401
+from tests.unit.data_process_layer.test_index_to_db import FakeBulkClient
+
+index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+replay = import_layer_module("data_process_layer", "replay")
+
+
+def test_replay_resumes_from_checkpoint_and_drains_failures(bucket, monkeypatch, tmp_path):  # noqa: F811
+    records = list(synthetic.iter_records(20, duplicate_rate=0))
+    first = upload_chunk(bucket, "parsed_1/metadata-000", records[:10])
+    second = upload_chunk(bucket, "parsed_1/metadata-001", records[10:])
+    client = FakeBulkClient(failing_ids=[records[15]["id"]])
+    monkeypatch.setattr(index_to_db, "get_open_search_client", lambda: client)
+    checkpoint = str(tmp_path / "replay.json")
+
+    # 行程內的 moto 狀態不會跨行程，測試以執行緒取代行程
+    summary = replay.replay(
+        f"s3://{BUCKET}/parsed_1/", 2, checkpoint_path=checkpoint, executor_factory=ThreadPoolExecutor
+    )
+    assert (summary["indexed"], summary["failed"], summary["failed_objects"]) == (19, 1, [second])
+    assert list(replay.load_checkpoint(checkpoint, f"s3://{BUCKET}/parsed_1/")["done"]) == [first]
+
+    # 失敗紀錄重新送出後刪除
+    client.failing_ids.clear()
+    summary = replay.replay(f"s3://{BUCKET}/failures/", 1, executor_factory=ThreadPoolExecutor)
+    assert (summary["indexed"], summary["failed_objects"]) == (1, [])
+    assert bucket.list_objects_v2(Bucket=BUCKET, Prefix="failures/")["KeyCount"] == 0
+
+    # 再次執行只處理尚未完成的 chunk，其文件皆已索引
+    summary = replay.replay(
+        f"s3://{BUCKET}/parsed_1/", 2, checkpoint_path=checkpoint, executor_factory=ThreadPoolExecutor
+    )
+    assert (summary["objects"], summary["indexed"], summary["unchanged"]) == (1, 0, 10)
+    assert len(client.documents) == 20
+
+
+def test_rate_limit_spaces_out_batches():
+    delays = []
+    controller = index_to_db.BulkController(max_rate=100)
+    for _ in range(3):
+        controller.wait_for_rate(50, sleep=delays.append)
+
+    # 第一個 batch 立即送出，之後依已送出的筆數等待 (0.5 秒 / 1 秒，扣除已經過的時間)
+    assert len(delays) == 2
+    assert 0.4 < delays[0] <= 0.5
+    assert 0.9 < delays[1] <= 1.0
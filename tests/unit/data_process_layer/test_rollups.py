@@ -0,0 +1,104 @@
+import gzip
+import json
+from collections import Counter
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.benchmarks import synthetic
+from tests.layers import import_layer_module
+from tests.unit.data_process_layer.test_index_to_db import FakeBulkClient
+
+index_to_db = import_layer_module("data_process_layer", "utils.index_to_db")
+rollups = import_layer_module("data_process_layer", "utils.rollups")
+transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+
+BUCKET = "arxiv-test"
+
+
+def index_with_rollups(client, documents):
+    controller = index_to_db.BulkController()
+    index_to_db.bulk_index_documents(
+        "arxiv-papers", documents, client=client, controller=controller, track_rollups=True
+    )
+    return controller.rollups
+
+
+def test_updates_replace_previously_counted_keys():
+    documents = list(transform_metadata.transform_metadata_batch(synthetic.iter_records(30, duplicate_rate=0)))
+    client = FakeBulkClient()
+
+    first = index_with_rollups(client, documents)
+    assert first == Counter(key for doc in documents for key in rollups.rollup_keys(doc))
+    assert client.documents[documents[0]["id"]]["_source"]["rollup_keys"] == rollups.rollup_keys(documents[0])
+
+    # 只有分類改變的論文產生變化: 舊分類 -1、新分類 +1，其餘 key 互相抵銷
+    updated = dict(documents[0], categories=[{"full_category": "q-bio.GN", "category": "q-bio", "subcategory": "GN"}])
+    delta = index_with_rollups(client, [updated, *documents[1:]])
+    changes = {key: count for key, count in delta.items() if count}
+    month = rollups.paper_month(updated)
+    assert changes == {
+        f"category_month|{month}|q-bio|GN": 1,
+        **{key: -1 for key in rollups.rollup_keys(documents[0]) if key.startswith("category_month|")},
+    }
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def read_table(s3, table):
+    body = s3.get_object(Bucket=BUCKET, Key=f"rollups/tables/{table}.json.gz")["Body"].read()
+    return json.loads(gzip.decompress(body))
+
+
+def test_compaction_applies_each_delta_once(s3, monkeypatch):
+    rollups.write_rollup_delta(s3, BUCKET, Counter({"author|Ada": 2, "version_month|2024-01|1": 1}), ["a"])
+    rollups.write_rollup_delta(s3, BUCKET, Counter({"author|Ada": -1, "author|Bob": 3, "author|Cy": 0}), ["b"])
+
+    # 寫入 state 後、刪除 delta 前中斷: 下次合併不重複套用
+    def fail_delete(**kwargs):
+        raise RuntimeError("interrupted")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(s3, "delete_objects", fail_delete)
+        with pytest.raises(RuntimeError):
+            rollups.compact_rollups(s3, BUCKET)
+    rollups.write_rollup_delta(s3, BUCKET, Counter({"category_month|2024-01|cs|LG": 1}), ["c"])
+    stats = rollups.compact_rollups(s3, BUCKET)
+
+    assert stats == {"deltas": 3, "category_month": 1, "version_month": 1, "top_authors": 2}
+    assert read_table(s3, "top_authors") == {
+        "columns": ["author", "papers"],
+        "data": {"author": ["Bob", "Ada"], "papers": [3, 1]},
+    }
+    assert read_table(s3, "category_month")["data"] == {
+        "month": ["2024-01"],
+        "category": ["cs"],
+        "subcategory": ["LG"],
+        "papers": [1],
+    }
+    assert s3.list_objects_v2(Bucket=BUCKET, Prefix="rollups/deltas/")["KeyCount"] == 0
+
+
+def test_compaction_keeps_a_bounded_number_of_authors(s3, monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_TOP_AUTHORS", 2)
+    monkeypatch.setattr(rollups, "ROLLUP_AUTHOR_CAPACITY", 3)
+    rollups.write_rollup_delta(s3, BUCKET, Counter({f"author|A{index}": index for index in range(1, 6)}), ["a"])
+    rollups.compact_rollups(s3, BUCKET)
+    rollups.write_rollup_delta(s3, BUCKET, Counter({"author|A1": 9, "category_month|2024-01|cs|LG": 1}), ["b"])
+    rollups.compact_rollups(s3, BUCKET)
+
+    # 未保留的作者 (A1) 由再次出現時的變化開始計數
+    state = rollups.get_gzip_json(s3, BUCKET, "rollups/state.json.gz")
+    assert sorted(key for key in state["keys"] if key.startswith("author|")) == ["author|A1", "author|A4", "author|A5"]
+    assert read_table(s3, "top_authors")["data"] == {"author": ["A1", "A5"], "papers": [9, 5]}
+    assert read_table(s3, "category_month")["data"]["papers"] == [1]
@@ -0,0 +1,58 @@
+import pytest
+
+from tests.benchmarks.bench_transform import legacy_parse_gmt_time, legacy_transform_metadata, make_records
+from tests.layers import import_layer_module
+
+transform_metadata = import_layer_module("data_process_layer", "utils.transform_metadata")
+handle_versions = import_layer_module("data_process_layer", "utils.handle_versions")
+
+
+def test_batch_transform_matches_original_implementation():
+    records = make_records(500)
+    records[0]["categories"] = "math.AG  hep-th a.b.c"
+    records[1]["authors_parsed"] = [["Doe", "", ""], ["", "Jane", "III", "MIT", "CERN"]]
+
+    assert list(transform_metadata.transform_metadata_batch(records)) == [
+        legacy_transform_metadata(record) for record in records
+    ]
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "Mon, 2 Apr 2007 19:18:42 GMT",
+        "Tue, 02 Jan 2024 00:00:00 GMT",
+        "sat, 29 Feb 2020 23:59:59 GMT",
+        "Mon, 2 Apr 2007 9:8:4 GMT",
+    ],
+)
+def test_parse_gmt_time_matches_strptime(value):
+    assert handle_versions.parse_gmt_time(value) == legacy_parse_gmt_time(value)
+
+
+@pytest.mark.parametrize("value", ["Mon, 30 Feb 2007 19:18:42 GMT", "Mon, 2 Foo 2007 19:18:42 GMT", "", "Mon, 2 Apr"])
+def test_parse_gmt_time_rejects_what_strptime_rejects(value):
+    with pytest.raises(ValueError):
+        legacy_parse_gmt_time(value)
+    with pytest.raises(ValueError):
+        handle_versions.parse_gmt_time(value)
+
+
+def test_lean_profile_flattens_nested_fields():
+    rollups = import_layer_module("data_process_layer", "utils.rollups")
+    records = make_records(200)
+    records[0]["categories"] = "math.AG  hep-th"
+    records[1]["authors_parsed"] = [["Doe", "", ""], ["", "Jane", "III", "MIT", "CERN"]]
+
+    full = list(transform_metadata.transform_metadata_batch(records, "full"))
+    lean = list(transform_metadata.transform_metadata_batch(records, "lean"))
+
+    assert lean[0]["categories"] == ["math.AG", "hep-th"]
+    assert lean[0]["category_groups"] == ["math", "hep-th"]
+    assert lean[1]["authors"] == ["Doe", "Jane III"]
+    assert lean[1]["affiliations"] == ["MIT", "CERN"]
+    for full_doc, lean_doc in zip(full, lean, strict=True):
+        assert not any(isinstance(value, list) and value and isinstance(value[0], dict) for value in lean_doc.values())
+        assert lean_doc["latest_version_date"] == full_doc["versions"][-1]["created_timestamp"]
+        # 兩種格式計入相同的儀表板彙總
+        assert rollups.rollup_keys(lean_doc) == rollups.rollup_keys(full_doc)
@@ -0,0 +1,8 @@
+import pytest
+
+from tests.benchmarks.bench_import import IMPORT_BUDGET_MS, check_budget, measure_import
+
+
+@pytest.mark.parametrize("layer", sorted(IMPORT_BUDGET_MS))
+def test_handler_import_stays_within_budget(layer):
+    assert check_budget(layer, measure_import(layer, repeat=3)) == []
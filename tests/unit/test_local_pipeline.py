@@ -0,0 +1,34 @@
+import gzip
+import json
+
+from local_pipeline import main as local_pipeline
+from tests.benchmarks import synthetic
+from tests.layers import activate_layer, import_layer_module
+
+
+def test_runs_snapshot_to_index_offline(tmp_path, monkeypatch):
+    arxiv_metadata = import_layer_module("collection_layer", "arxiv_metadata")
+    # 小 chunk 讓輸出與索引重疊，並以很小的佇列確認滿時會等待而不是卡住
+    monkeypatch.setattr(arxiv_metadata, "CHUNK_MAX_RECORDS", 100)
+    snapshot = tmp_path / "snapshot.json"
+    stats = synthetic.generate_snapshot(str(snapshot), 1500)
+    manifest = str(tmp_path / "manifest.bin")
+    options = {"index_workers": 2, "parse_workers": 2, "timestamp": "1", "queue_size": 1}
+
+    activate_layer("collection_layer")
+    summary = local_pipeline.run(str(snapshot), "memory", manifest_path=manifest, **options)
+    assert summary["errors"] == []
+    assert summary["processed"] == summary["documents"] == summary["indexed"] == stats["unique_ids"]
+    assert summary["chunks"] > 2
+
+    # 轉換後的文件與 data_process_layer 寫入索引的內容相同
+    summary = local_pipeline.run(str(snapshot), f"dir:{tmp_path / 'out'}", **options)
+    documents = [
+        json.loads(line) for path in sorted((tmp_path / "out").rglob("*.ndjson.gz")) for line in gzip.open(path, "rt")
+    ]
+    assert summary["indexed"] == len(documents) == len({doc["id"] for doc in documents}) == stats["unique_ids"]
+    assert all(doc["versions"] and "authors_parsed" in doc for doc in documents)
+
+    # 以 manifest 增量執行: 快照未變動時沒有需要索引的文件
+    summary = local_pipeline.run(str(snapshot), "memory", manifest_path=manifest, **options)
+    assert (summary["processed"], summary["chunks"], summary["errors"]) == (0, 0, [])
@@ -0,0 +1,45 @@
+import json
+import time
+
+from tests.layers import ROOT, import_layer_module
+
+metrics = import_layer_module("collection_layer", "utils.metrics")
+
+
+def test_layers_share_identical_metrics_module():
+    collection = (ROOT / "collection_layer" / "utils" / "metrics.py").read_bytes()
+    data_process = (ROOT / "data_process_layer" / "utils" / "metrics.py").read_bytes()
+    assert collection == data_process
+
+
+def test_stage_and_timed_iter_exclude_nested_time(tmp_path):
+    output = tmp_path / "metrics.ndjson"
+    recorder = metrics.Metrics("data_process", namespace="Test", output_path=str(output))
+
+    def slow_source():
+        for i in range(3):
+            time.sleep(0.02)
+            yield i
+
+    with recorder.stage("bulk") as stage:
+        items = list(recorder.timed_iter("read", slow_source()))
+        stage.records = len(items)
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        recorder.observe("bulk_latency", latency)
+    recorder.set_property("s3_key", "parsed_1/metadata-000-00001.ndjson.gz")
+    document = recorder.flush()
+
+    assert document["read_records"] == 3
+    assert document["read_seconds"] >= 0.06
+    assert document["bulk_seconds"] < 0.03
+    assert document["bulk_latency_p50"] == 0.2
+    assert document["bulk_latency_p99"] == 0.4
+    assert document["peak_rss_mb"] > 0
+
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "Test"
+    assert directive["Dimensions"] == [["Function"]]
+    names = {metric["Name"] for metric in directive["Metrics"]}
+    assert {"read_seconds", "read_records_per_second", "bulk_seconds", "bulk_latency_p90"} <= names
+    assert "s3_key" not in names
+    assert json.loads(output.read_text(encoding="utf-8")) == document
@@ -1,15 +1,89 @@
-import aws_cdk as core
-import aws_cdk.assertions as assertions
+def synth(monkeypatch, **env):
+    # jsii 在 import 時啟動背景執行緒，延後載入，其他測試 fork 子行程時才不會有執行中的執行緒
+    import aws_cdk as core
+    import aws_cdk.assertions as assertions
 
-from pipeline_cdk.pipeline_cdk_stack import PipelineCdkStack
+    from pipeline_cdk.pipeline_cdk_stack import PipelineCdkStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in pipeline_cdk/pipeline_cdk_stack.py
-def test_sqs_queue_created():
+    for name, value in {
+        "AWS_ACCOUNT": "123456789012",
+        "AWS_ROLE": "arxiv-pipeline",
+        "S3_BUCKET_NAME": "arxiv-dataset",
+        "S3_FOLDER_PREFIX": "arxiv",
+        **env,
+    }.items():
+        monkeypatch.setenv(name, value)
     app = core.App()
     stack = PipelineCdkStack(app, "pipeline-cdk")
-    template = assertions.Template.from_stack(stack)
+    return assertions.Template.from_stack(stack)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+
+def test_sqs_queue_created(monkeypatch):
+    from aws_cdk.assertions import Match
+
+    template = synth(monkeypatch, ROLLUPS_ENABLED="true")
+
+    template.has_resource_properties("AWS::SQS::Queue", {"VisibilityTimeout": 5400})
+    template.has_resource_properties(
+        "AWS::Lambda::EventSourceMapping",
+        {
+            "BatchSize": 10,
+            "MaximumBatchingWindowInSeconds": 30,
+            "FunctionResponseTypes": ["ReportBatchItemFailures"],
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "ScheduleExpression": "rate(1 hour)",
+            "Targets": Match.array_with([Match.object_like({"Input": '{"rollups":"compact"}'})]),
+        },
+    )
+
+
+def test_fanout_is_opt_in_and_workers_share_chunk_settings(monkeypatch):
+    monkeypatch.delenv("FANOUT_WORKERS", raising=False)
+    template = synth(monkeypatch)
+
+    # 未啟用時不建立 worker 與呼叫 worker 的 policy
+    functions = template.find_resources("AWS::Lambda::Function")
+    assert not any(name.startswith("collectionworker") for name in functions)
+    assert not any(
+        name.startswith("CollectionFanoutInvokePolicy") for name in template.find_resources("AWS::IAM::Policy")
+    )
+    coordinator = next(
+        resource["Properties"]["Environment"]["Variables"]
+        for name, resource in functions.items()
+        if name.startswith("collectionlayer")
+    )
+    assert coordinator["FANOUT_WORKERS"] == "0"
+    assert "FANOUT_FUNCTION_NAME" not in coordinator
+
+    template = synth(monkeypatch, FANOUT_WORKERS="8", CHUNK_MAX_RECORDS="2000", UPLOAD_WORKERS="4")
+    functions = template.find_resources("AWS::Lambda::Function")
+    coordinator, worker = (
+        next(resource["Properties"] for name, resource in functions.items() if name.startswith(prefix))
+        for prefix in ("collectionlayer", "collectionworker")
+    )
+    assert coordinator["Environment"]["Variables"]["FANOUT_FUNCTION_NAME"]
+    # worker 須在 coordinator 扣除接續的保留時間前結束
+    assert worker["Timeout"] == 600 < coordinator["Timeout"]
+    for properties in (coordinator, worker):
+        env = properties["Environment"]["Variables"]
+        assert env["CHUNK_MAX_RECORDS"] == "2000" and env["UPLOAD_WORKERS"] == "4"
+    assert any(name.startswith("CollectionFanoutInvokePolicy") for name in template.find_resources("AWS::IAM::Policy"))
+
+
+def test_rollup_schedule_is_opt_in(monkeypatch):
+    monkeypatch.delenv("ROLLUPS_ENABLED", raising=False)
+    monkeypatch.delenv("AUTHOR_INDEX_ENABLED", raising=False)
+    template = synth(monkeypatch)
+
+    template.resource_count_is("AWS::Events::Rule", 0)
+    functions = template.find_resources("AWS::Lambda::Function")
+    environment = next(
+        resource["Properties"]["Environment"]["Variables"]
+        for name, resource in functions.items()
+        if name.startswith("dataprocesslayer")
+    )
+    assert environment["ROLLUPS_ENABLED"] == "false"